@@ -50,7 +50,14 @@ class ETAConfig(EnvConfig):
             d, "pythonpath_dirs", env_var="ETA_PYTHONPATH_DIRS", default=[])
         self.environment_vars = self.parse_dict(
             d, "environment_vars", default={})
+        self.cache_dir = self.parse_string(
+            d, "cache_dir", env_var="ETA_CACHE_DIR", default="")
+        self.num_workers = int(self.parse_number(
+            d, "num_workers", env_var="ETA_NUM_WORKERS", default=1))
         self.tf_config = self.parse_dict(d, "tf_config", default={})
+        self.tf_auto_threads = self.parse_bool(
+            d, "tf_auto_threads", env_var="ETA_TF_AUTO_THREADS",
+            default=False)
         self.max_model_versions_to_keep = int(self.parse_number(
             d, "max_model_versions_to_keep",
             env_var="ETA_MAX_MODEL_VERSIONS_TO_KEEP", default=-1))
@@ -131,6 +131,12 @@ class PipelineBuildRequestConfig(Config):
         self.eta_config = self.parse_dict(d, "eta_config", default={})
         self.logging_config = self.parse_object(
             d, "logging_config", etal.LoggingConfig, default=None)
+        self.max_parallel_jobs = self.parse_number(
+            d, "max_parallel_jobs", default=1)
+        self.in_process_jobs = self.parse_bool(
+            d, "in_process_jobs", default=False)
+        self.use_job_cache = self.parse_bool(
+            d, "use_job_cache", default=False)
 
 
 class PipelineBuildRequest(Configurable):
@@ -158,6 +164,12 @@ class PipelineBuildRequest(Configurable):
         eta_config: a dictionary of custom ETA config settings for the pipeline
             (if any)
         logging_config: the LoggingConfig for the pipeline (if any)
+        max_parallel_jobs: the maximum number of pipeline jobs to run
+            concurrently
+        in_process_jobs: whether to run the pipeline modules in forked
+            children of the pipeline process rather than in new interpreters
+        use_job_cache: whether to reuse the outputs of previous runs of
+            modules with the same configs and inputs via a JobCache
     '''
 
     def __init__(self, config):
@@ -178,6 +190,9 @@ class PipelineBuildRequest(Configurable):
         self.parameters = etau.remove_none_values(config.parameters)
         self.eta_config = config.eta_config
         self.logging_config = config.logging_config
+        self.max_parallel_jobs = config.max_parallel_jobs
+        self.in_process_jobs = config.in_process_jobs
+        self.use_job_cache = config.use_job_cache
 
         self._validate_inputs()
         self._validate_outputs()
@@ -492,6 +507,10 @@ class PipelineBuilder(object):
                     .set(name=module)
                     .set(script=etam.find_exe(metadata))
                     .set(config_path=self._get_module_config_path(module))
+                    .set(dependencies=self._get_module_dependencies(module))
+                    .set(in_process=self.request.in_process_jobs)
+                    .set(inputs=list(itervalues(self.module_inputs[module])))
+                    .set(outputs=list(itervalues(self.module_outputs[module])))
                     .validate())
         if not jobs:
             logger.warning("Pipeline contains no jobs...")
@@ -515,6 +534,8 @@ class PipelineBuilder(object):
             .set(name=self.request.pipeline)
             .set(status_path=self.pipeline_status_path)
             .set(overwrite=False)
+            .set(max_parallel_jobs=self.request.max_parallel_jobs)
+            .set(use_job_cache=self.request.use_job_cache)
             .set(jobs=jobs)
             .set(eta_config=self.request.eta_config)
             .set(logging_config=logging_config)
@@ -539,6 +560,13 @@ class PipelineBuilder(object):
             logger.info("Writing module config '%s'", module_config_path)
             module_config.write_json(module_config_path)
 
+    def _get_module_dependencies(self, module):
+        deps = set(
+            conn.source.module
+            for conn in self.request.metadata.get_incoming_connections(module)
+            if conn.source.is_module_output)
+        return [m for m in self.execution_order if m in deps]
+
     def _get_timestamp_str(self):
         return time.strftime("%Y.%m.%d-%H.%M.%S", self.timestamp)
 
@@ -26,20 +26,39 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+import copy
+import os
+
 import numpy as np
 import tensorflow as tf
 
 from eta.core.config import Config
-from eta.core.features import Featurizer
+from eta.core.features import (
+    ClipFeatures, FeatureCache, Featurizer, unpack_layer_features)
+import eta.core.image as etai
 import eta.core.tfutils as etat
 import eta.core.video as etav
 
 
 class C3DConfig(Config):
-    '''Configuration settings for the C3D network.'''
+    '''Configuration settings for the C3D network.
+
+    Attributes:
+        model: the C3D UCF101 model to use
+        use_frozen_graph: whether to load the network from a frozen graph
+            whose outputs are `frozen_layers`. The frozen graph is exported
+            and cached the first time it is needed. The default is False
+        frozen_layers: the layers to keep when freezing the graph. The
+            default is all of "pool5", "fc1l", "fc1", "fc2l", "fc2", "fc3l",
+            and "probs"
+    '''
 
     def __init__(self, d):
         self.model = self.parse_string(d, "model", default="C3D-UCF101")
+        self.use_frozen_graph = self.parse_bool(
+            d, "use_frozen_graph", default=False)
+        self.frozen_layers = self.parse_array(
+            d, "frozen_layers", default=list(C3D.OUTPUT_LAYERS))
 
 
 class C3D(object):
@@ -48,8 +67,14 @@ class C3D(object):
 
     This implementation is hard-coded to process an tensor of video clips of
     size [XXXX, 16, 112, 112, 3].
+
+    If `use_frozen_graph` is set in the config, the network is loaded from a
+    cached frozen graph in which the weights are constants and only the
+    `frozen_layers` outputs are available as attributes of this instance.
     '''
 
+    OUTPUT_LAYERS = ("pool5", "fc1l", "fc1", "fc2l", "fc2", "fc3l", "probs")
+
     def __init__(self, config=None, sess=None, clips=None):
         '''Builds a new C3D network
 
@@ -63,9 +88,15 @@ class C3D(object):
             clips: an optional tf.placeholder of size [XXXX, 16, 112, 112, 3]
         '''
         self.config = config or C3DConfig.default()
-        self.sess = sess or etat.make_tf_session()
-        self.clips = clips or tf.placeholder(
-            tf.float32, [None, 16, 112, 112, 3])
+        self.sess = sess or etat.make_tf_session(
+            model_name=self.config.model)
+        if clips is None:
+            clips = tf.placeholder(tf.float32, [None, 16, 112, 112, 3])
+        self.clips = clips
+
+        if self.config.use_frozen_graph:
+            self._load_frozen_graph()
+            return
 
         # The source (https://github.com/hx173149/C3D-tensorflow) of the models
         # we use picked this variable scope, so we must use it too
@@ -88,17 +119,28 @@ class C3D(object):
         Args:
             clips: an array of size [XXXX, 16, 112, 112, 3] containing clips(s)
                 to feed into the network
-            layer: an optional layer whose output to return. By default, the
+            layer: an optional layer whose output to return, or a list or
+                dict of layers whose outputs to return, all of which are
+                computed in a single forward pass. Layers can be specified
+                either as tensors or by name, e.g., "fc2l". By default, the
                 output softmax layer (i.e., the class probabilities) is
                 returned
 
         Returns:
-            an array of same size as the requested layer. The first dimension
-                will always be XXXX
+            an array of same size as the requested layer, or a list or dict of
+                such arrays if multiple layers were requested. The first
+                dimension of each array will always be XXXX
         '''
         if layer is None:
+            if not hasattr(self, "probs"):
+                raise ValueError(
+                    "The default 'probs' layer is unavailable because it was "
+                    "not in `frozen_layers`; specify the layer(s) to "
+                    "evaluate")
             layer = self.probs
-        return self.sess.run(layer, feed_dict={self.clips: clips})
+
+        fetches = etat.resolve_layers(self, layer)
+        return self.sess.run(fetches, feed_dict={self.clips: clips})
 
     def close(self):
         '''Closes the TensorFlow session used by this instance, if necessary.
@@ -110,6 +152,37 @@ class C3D(object):
             self.sess.close()
             self.sess = None
 
+    @staticmethod
+    def export_frozen_graph(config, layers, path):
+        '''Builds the C3D network described by the given config, freezes it
+        up to the given layers, and writes the frozen graph to disk.
+
+        Args:
+            config: a C3DConfig instance
+            layers: the list of output layers to keep
+            path: the path to write the frozen graph
+        '''
+        config = copy.copy(config)
+        config.use_frozen_graph = False
+        with tf.Graph().as_default():
+            clips = tf.placeholder(
+                tf.float32, [None, 16, 112, 112, 3], name="clips")
+            with C3D(config=config, clips=clips) as c3d:
+                output_names = etat.add_frozen_outputs(c3d, layers)
+                etat.freeze_graph(c3d.sess, output_names, path)
+
+    def _load_frozen_graph(self):
+        layers = self.config.frozen_layers
+        path = etat.get_frozen_graph_path(self.config.model, layers)
+        if not os.path.isfile(path):
+            self.export_frozen_graph(self.config, layers, path)
+
+        output_names = [etat.get_frozen_output_name(l) for l in layers]
+        outputs = etat.import_frozen_graph(
+            path, {"clips": self.clips}, output_names, name="c3d")
+        for layer, tensor in zip(layers, outputs):
+            setattr(self, layer, tensor)
+
     def _build_conv_layers(self):
         with tf.name_scope("conv1") as scope:
             weights = _tf_variable_with_weight_decay(
@@ -246,6 +319,18 @@ class C3DFeaturizerConfig(C3DConfig):
         sample_method: the frame sampling method to use. The possible values
             are "first", "uniform", and "sliding_window"
         stride: the stride to use when the sampling method is "sliding_window"
+        layers: the list of layers whose outputs to extract, all of which are
+            computed in a single forward pass. The supported layers are
+            "pool5", "fc1l", "fc1", "fc2l", "fc2", "fc3l", and "probs". The
+            default is ["fc2l"]
+        use_frozen_graph: whether to load the network from a frozen graph.
+            Unless `frozen_layers` is provided, only `layers` are kept when
+            freezing the graph. The default is False
+        max_batch_clips: the maximum number of clips to evaluate at once
+            when the sampling method is "sliding_window". Frames are read and
+            clips are evaluated in chunks of this size, so the peak memory
+            usage is independent of the length of the video. The default is
+            32
     '''
 
     def __init__(self, d):
@@ -253,31 +338,63 @@ class C3DFeaturizerConfig(C3DConfig):
         self.sample_method = self.parse_string(
             d, "sample_method", default="sliding_window")
         self.stride = self.parse_number(d, "stride", default=8)
+        self.layers = self.parse_array(d, "layers", default=["fc2l"])
+        self.max_batch_clips = int(self.parse_number(
+            d, "max_batch_clips", default=32))
+        if "frozen_layers" not in d:
+            # Only freeze the layers that we need
+            self.frozen_layers = list(self.layers)
 
 
 class C3DFeaturizer(Featurizer):
-    '''Featurizer that embeds videos into the C3D feature space.'''
+    '''Featurizer that embeds videos into the C3D feature space.
+
+    If a single layer is requested, each video is featurized as a 1D array
+    containing the output of that layer. If multiple layers are requested,
+    each video is featurized as a dictionary mapping layer names to 1D arrays,
+    and `dim()` reports the dimension of the first layer.
+    '''
+
+    LAYER_DIMS = {
+        "pool5": 8192,
+        "fc1l": 4096,
+        "fc1": 4096,
+        "fc2l": 4096,
+        "fc2": 4096,
+        "fc3l": 101,
+        "probs": 101,
+    }
 
     def __init__(self, config=None):
         super(C3DFeaturizer, self).__init__()
         self.config = config or C3DFeaturizerConfig.default()
         self.validate(self.config)
         self.c3d = None
+        self._preprocessor = None
+
+        for layer in self.config.layers:
+            if layer not in self.LAYER_DIMS:
+                raise ValueError("Unsupported C3D layer '%s'" % layer)
 
     def dim(self):
         '''The dimension of the features extracted by this Featurizer.'''
-        return 4096
+        return self.LAYER_DIMS[self.config.layers[0]]
 
     def _start(self):
         '''Starts a TensorFlow session and loads the network.'''
         if self.c3d is None:
             self.c3d = C3D(self.config)
+        if self._preprocessor is None:
+            self._preprocessor = etai.ImageBatchPreprocessor(112, 112)
 
     def _stop(self):
         '''Closes the TensorFlow session and frees up the network.'''
         if self.c3d:
             self.c3d.close()
             self.c3d = None
+        if self._preprocessor:
+            self._preprocessor.close()
+            self._preprocessor = None
 
     def _featurize(self, video_path):
         '''Featurizes the input video using C3D.
@@ -288,33 +405,229 @@ class C3DFeaturizer(Featurizer):
             video_path: the input video path
 
         Returns:
-            the feature vector, a 1D array of length 4096
+            the feature vector, a 1D array of length `dim()`, or a dictionary
+                of feature vectors if multiple layers were requested
         '''
-        clips = self._sample_clips(video_path)
-
-        features = self.c3d.evaluate(clips, layer=self.c3d.fc2l)
-        if self.config.sample_method == "sliding_window":
-            # Average over sliding window clips
-            features = np.mean(features, axis=0)
-            features /= np.linalg.norm(features)
-        else:
-            features = features.reshape(-1)
-
-        return features
-
-    def _sample_clips(self, video_path):
+        if self.config.sample_method != "sliding_window":
+            clips = self._sample_clip(video_path)
+            outputs = self.c3d.evaluate(clips, layer=self.config.layers)
+            return unpack_layer_features(self.config.layers, outputs)[0]
+
+        # Average over sliding window clips, evaluating them in chunks
+        sums = None
+        count = 0
+        for _, clips in self._iter_sliding_window_clips(video_path):
+            outputs = self.c3d.evaluate(clips, layer=self.config.layers)
+            chunk_sums = [
+                np.sum(o.reshape(len(o), -1), axis=0, dtype=np.float64)
+                for o in outputs]
+            if sums is None:
+                sums = chunk_sums
+            else:
+                for total, chunk_sum in zip(sums, chunk_sums):
+                    total += chunk_sum
+            count += len(clips)
+
+        if not count:
+            raise ValueError(
+                "Video '%s' is too short to sample any clips" % video_path)
+
+        features = []
+        for total in sums:
+            output = (total / count).astype(np.float32)
+            output /= np.linalg.norm(output)
+            features.append(output[np.newaxis, :])
+
+        return unpack_layer_features(self.config.layers, features)[0]
+
+    def _sample_clip(self, video_path):
         sample_method = self.config.sample_method
-        stride = self.config.stride
-        size = (112, 112)
 
         if sample_method == "first":
-            clips = [etav.sample_first_frames(video_path, 16, size=size)]
+            imgs = etav.sample_first_frames(video_path, 16)
         elif sample_method == "uniform":
-            clips = [etav.uniformly_sample_frames(video_path, 16, size=size)]
-        elif sample_method == "sliding_window":
-            clips = etav.sliding_window_sample_frames(
-                video_path, 16, stride, size=size)
+            imgs = etav.uniformly_sample_frames(video_path, 16)
         else:
             raise ValueError("Invalid sample_method '%s'" % sample_method)
 
-        return clips
+        return self._preprocessor.preprocess(imgs)[np.newaxis, ...]
+
+    def _iter_sliding_window_clips(self, video_path):
+        '''Returns a generator that yields (start_frames, clips) tuples
+        containing at most `max_batch_clips` sliding window clips and their
+        first frame numbers. Only the frames needed by the current chunk of
+        clips are kept in memory.
+
+        Nothing is yielded if the video is shorter than one clip. If the
+        video contains fewer frames than its metadata reports, the clips that
+        extend past its last frame are omitted.
+        '''
+        clip_frames = etav.get_sliding_window_frames(
+            etav.get_frame_count(video_path), 16, self.config.stride)
+        if not clip_frames.size:
+            return
+
+        frames = np.unique(clip_frames)
+        max_clips = self.config.max_batch_clips
+
+        imgs = {}
+        last_frame = 0
+        with etav.FFmpegVideoReader(video_path, frames=list(frames)) as vr:
+            for start in range(0, len(clip_frames), max_clips):
+                chunk = clip_frames[start:start + max_clips]
+
+                # Read the frames of this chunk. `read()` raises
+                # StopIteration at the end of the video, which must not
+                # escape this generator
+                is_truncated = False
+                while last_frame < chunk[-1, -1]:
+                    try:
+                        img = vr.read()
+                    except StopIteration:
+                        is_truncated = True
+                        chunk = chunk[chunk[:, -1] <= last_frame]
+                        break
+
+                    last_frame = vr.frame_number
+                    imgs[last_frame] = img
+
+                if not chunk.size:
+                    return
+
+                # Discard frames that are no longer needed
+                for fn in [fn for fn in imgs if fn < chunk[0, 0]]:
+                    del imgs[fn]
+
+                # Preprocess each frame once, even if it appears in multiple
+                # clips
+                chunk_frames = np.array(sorted(imgs))
+                batch = self._preprocessor.preprocess(
+                    [imgs[fn] for fn in chunk_frames])
+                yield chunk[:, 0], batch[np.searchsorted(chunk_frames, chunk)]
+
+                if is_truncated:
+                    return
+
+
+class VideoClipsFeaturizerConfig(C3DFeaturizerConfig):
+    '''Configuration settings for a VideoClipsFeaturizer.
+
+    Attributes:
+        backing_path: the directory in which to store the clip features of
+            each video. The default is "/tmp"
+        (all attributes of C3DFeaturizerConfig, except that `sample_method`
+            is always "sliding_window")
+    '''
+
+    def __init__(self, d):
+        super(VideoClipsFeaturizerConfig, self).__init__(d)
+        self.backing_path = self.parse_string(
+            d, "backing_path", default="/tmp")
+        self.sample_method = "sliding_window"
+
+
+class VideoClipsFeaturizer(C3DFeaturizer):
+    '''Featurizer that embeds each sliding window clip of a video into the
+    C3D feature space and persists the per-clip features.
+
+    The features of each video are stored in `backing_path` as a ClipFeatures
+    file keyed by the first frame number of each clip. The file is named by
+    a hash of the contents of the video and the settings that affect the
+    features (see `FeatureCache.make_key()`), so videos with the same name
+    never collide, and features are recomputed if the video or the settings
+    change. Computing the clip features of a video whose clip features
+    already exist simply loads them.
+
+    Use `get_clip_features()` to get the ClipFeatures instance of a video,
+    which supports fast aggregation of the clip features over arbitrary
+    frame ranges without re-running C3D. Like C3DFeaturizer, `featurize()`
+    returns a vector of length `dim()`: the normalized mean of the features
+    of all clips of the video.
+
+    Only the first of the configured `layers` is stored.
+    '''
+
+    CLIP_LENGTH = 16
+
+    def __init__(self, config=None):
+        '''Creates a VideoClipsFeaturizer instance.
+
+        Args:
+            config: an optional VideoClipsFeaturizerConfig instance. If
+                omitted, the default configuration is used
+        '''
+        super(VideoClipsFeaturizer, self).__init__(
+            config or VideoClipsFeaturizerConfig.default())
+
+    def get_backing_path(self, video_path):
+        '''Returns the path to the clip features of the given video.'''
+        key = FeatureCache.make_key(video_path, {
+            "model": self.config.model,
+            "layer": self.config.layers[0],
+            "stride": self.config.stride,
+            "clip_length": self.CLIP_LENGTH,
+        })
+        return os.path.join(self.config.backing_path, key + ".clips.npz")
+
+    def get_clip_features(self, video_path):
+        '''Gets the features of each sliding window clip of the input video,
+        computing and storing them if necessary.
+
+        The network is only loaded if the clip features must be computed.
+
+        Args:
+            video_path: the input video path
+
+        Returns:
+            a ClipFeatures instance
+        '''
+        path = self.get_backing_path(video_path)
+        if os.path.isfile(path):
+            return ClipFeatures.read(path)
+
+        self.start(warn_on_restart=False, keep_alive=False)
+        clip_features = self._compute_clip_features(video_path, path)
+        if self._keep_alive is False:
+            self.stop()
+
+        return clip_features
+
+    def _featurize(self, video_path):
+        '''Featurizes the input video as the normalized mean of the features
+        of its sliding window clips, which are computed and stored if
+        necessary.
+
+        Args:
+            video_path: the input video path
+
+        Returns:
+            the feature vector, a 1D array of length `dim()`
+        '''
+        path = self.get_backing_path(video_path)
+        if os.path.isfile(path):
+            clip_features = ClipFeatures.read(path)
+        else:
+            clip_features = self._compute_clip_features(video_path, path)
+
+        last_frame = clip_features.start_frames[-1] + self.CLIP_LENGTH - 1
+        return clip_features.aggregate(
+            clip_features.start_frames[0], last_frame)
+
+    def _compute_clip_features(self, video_path, path):
+        layer = self.config.layers[0]
+        start_frames = []
+        X = []
+        for chunk_start_frames, clips in self._iter_sliding_window_clips(
+                video_path):
+            output = self.c3d.evaluate(clips, layer=layer)
+            X.append(output.reshape(len(output), -1))
+            start_frames.append(chunk_start_frames)
+
+        if not X:
+            raise ValueError(
+                "Video '%s' is too short to sample any clips" % video_path)
+
+        clip_features = ClipFeatures(
+            np.concatenate(start_frames), np.concatenate(X), self.CLIP_LENGTH)
+        clip_features.write(path)
+        return clip_features
@@ -174,6 +174,9 @@ class RunCommand(Command):
 
         # Run the last built pipeline
         eta run --last
+
+        # Run the jobs of a pipeline in forked children of a warm process
+        eta run --in-process '/path/to/pipeline.json'
     '''
 
     @staticmethod
@@ -183,23 +186,27 @@ class RunCommand(Command):
         parser.add_argument(
             "-l", "--last", action="store_true",
             help="run the last built pipeline")
+        parser.add_argument(
+            "--in-process", action="store_true", default=None,
+            help="run the pipeline modules in forked children of a warm "
+            "process rather than in new interpreters")
 
     @staticmethod
     def run(args):
         if args.config:
-            _run_pipeline(args.config)
+            _run_pipeline(args.config, in_process=args.in_process)
 
         if args.last:
             config = etab.find_last_built_pipeline()
             if config:
-                _run_pipeline(config)
+                _run_pipeline(config, in_process=args.in_process)
             else:
                 logger.info("No built pipelines found...")
 
 
-def _run_pipeline(config):
+def _run_pipeline(config, in_process=None):
     logger.info("Running ETA pipeline '%s'", config)
-    etap.run(config)
+    etap.run(config, in_process=in_process)
 
     if etau.is_in_root_dir(config, eta.config.config_dir):
         logger.info(
@@ -247,6 +254,88 @@ class CleanCommand(Command):
             etab.cleanup_all_pipelines()
 
 
+class ServeCommand(Command):
+    '''Command-line tool for running a featurizer server.
+
+    Examples:
+        # Serve featurizers on the default Unix socket in ~/.eta
+        eta serve
+
+        # Serve featurizers on a Unix socket
+        eta serve --address /tmp/eta.sock
+
+        # Serve featurizers using a FeaturizerServerConfig JSON file
+        eta serve --config '/path/to/server-config.json'
+    '''
+
+    @staticmethod
+    def setup(parser):
+        parser.add_argument(
+            "-c", "--config", type=etas.load_json,
+            help="path to a FeaturizerServerConfig file")
+        parser.add_argument(
+            "-a", "--address",
+            help="a Unix socket path or host:port on which to listen")
+
+    @staticmethod
+    def run(args):
+        import eta.core.featurizer_server as etafs
+
+        d = args.config or {}
+        if args.address:
+            d["address"] = args.address
+
+        config = etafs.FeaturizerServerConfig(d)
+        with etafs.FeaturizerServer(config) as server:
+            server.serve_forever()
+
+
+class WorkerCommand(Command):
+    '''Command-line tool for running pipeline jobs from a work queue.
+
+    Examples:
+        # Run jobs from the work queue in the given directory
+        eta worker '/path/to/queue'
+
+        # Run jobs until the queue is empty
+        eta worker --exit-when-idle '/path/to/queue'
+
+        # Run a worker using a WorkerConfig JSON file
+        eta worker --config '/path/to/worker-config.json'
+    '''
+
+    @staticmethod
+    def setup(parser):
+        parser.add_argument(
+            "queue_dir", nargs="?", help="the work queue directory")
+        parser.add_argument(
+            "-c", "--config", type=etas.load_json,
+            help="path to a WorkerConfig file")
+        parser.add_argument(
+            "--id", help="a unique ID for the worker")
+        parser.add_argument(
+            "--exit-when-idle", action="store_true",
+            help="exit when the work queue is empty")
+
+    @staticmethod
+    def run(args):
+        import eta.core.workqueue as etawq
+
+        d = args.config or {}
+        if args.queue_dir:
+            d["queue_dir"] = args.queue_dir
+        if args.id:
+            d["worker_id"] = args.id
+        if args.exit_when_idle:
+            d["exit_when_idle"] = True
+
+        worker = etawq.Worker(etawq.WorkerConfig(d))
+        try:
+            worker.serve()
+        except KeyboardInterrupt:
+            worker.stop()
+
+
 class ModelsCommand(Command):
     '''Command-line tool for working with ETA models.
 
@@ -461,6 +550,8 @@ subparsers = parser.add_subparsers(title="available commands")
 _register_command("build", BuildCommand)
 _register_command("run", RunCommand)
 _register_command("clean", CleanCommand)
+_register_command("serve", ServeCommand)
+_register_command("worker", WorkerCommand)
 _register_command("models", ModelsCommand)
 _register_command("modules", ModulesCommand)
 _register_command("pipelines", PipelinesCommand)
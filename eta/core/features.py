@@ -15,22 +15,31 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import *
+from future.utils import iteritems
 import six
 # pragma pylint: enable=redefined-builtin
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+from collections import OrderedDict
 import errno
+import hashlib
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import shutil
 import tempfile
+import threading
 
 import cv2
 import numpy as np
 
+import eta
 from eta.core.config import Config, Configurable
+import eta.core.image as etai
 from eta.core.numutils import GrowableArray
+import eta.core.numutils as etan
+import eta.core.serial as etas
 import eta.core.utils as etau
 import eta.core.types as etat
 import eta.core.video as etav
@@ -71,7 +80,8 @@ class Featurizer(Configurable):
 
     Subclasses of Featurizer must implement the `dim()` and `_featurize()`
     methods, and if necessary, should also implement the `_start()` and
-    `_stop()` methods.
+    `_stop()` methods. Subclasses that can process multiple inputs at once
+    more efficiently may also implement `_featurize_batch()`.
 
     Subclasses must call the superclass constructor defined by this base class.
 
@@ -185,13 +195,50 @@ class Featurizer(Configurable):
         '''
         raise NotImplementedError("subclass must implement _featurize()")
 
+    def featurize_batch(self, data):
+        '''Featurizes a batch of input data.
+
+        Args:
+            data: a list of data to featurize
+
+        Returns:
+            a list of feature vectors
+        '''
+        self.start(warn_on_restart=False, keep_alive=False)
+        fvs = self._featurize_batch(data)
+        if self._keep_alive is False:
+            self.stop()
+
+        return fvs
+
+    def _featurize_batch(self, data):
+        '''The backend implementation of batch feature extraction. By default,
+        `_featurize()` is called on each item in the batch. Subclasses that
+        can featurize batches more efficiently should override this method.
+
+        Args:
+            data: a list of data to featurize
+
+        Returns:
+            a list of feature vectors
+        '''
+        return [self._featurize(d) for d in data]
+
 
 class CanFeaturize(object):
     '''Mixin class that exposes the ability to featurize data just-in-time via
     a provided Featurizer instance.
+
+    Instances can optionally memoize the features of the paths that they
+    featurize. The memo cache holds at most `feature_cache_size` entries,
+    which are evicted in least recently used order, and is keyed by the path,
+    its modification time, and the config of the Featurizer, so features are
+    recomputed whenever the file or the Featurizer changes.
     '''
 
-    def __init__(self, featurizer=None, force_featurize=False):
+    def __init__(
+            self, featurizer=None, force_featurize=False,
+            feature_cache_size=0):
         '''Initializes a CanFeaturize instance.
 
         Args:
@@ -199,9 +246,13 @@ class CanFeaturize(object):
             force_featurize: whether to force any input to the
                 `featurize_if_needed` decorator to be featurized. By default,
                 this is False
+            feature_cache_size: the maximum number of featurized paths to
+                memoize. By default, this is 0 (no memoization)
         '''
         self.featurizer = featurizer
         self.force_featurize = force_featurize
+        self.feature_cache_size = feature_cache_size
+        self._feature_cache = OrderedDict()
 
     @property
     def has_featurizer(self):
@@ -220,37 +271,124 @@ class CanFeaturize(object):
         '''Removes the Featurizer from this instance, if any.'''
         self.featurizer = None
 
-    @staticmethod
-    def featurize_if_needed(*args, **kwargs):
-        '''This decorator function will check a specified argument of the
-        decorated function needs to be featurized, and if so, featurizes it
-        using the `featurizer` attribute of the class instances (already
-        defined).
+    def clear_feature_cache(self):
+        '''Clears the memoized features of this instance, if any.'''
+        self._feature_cache.clear()
 
-        The argument to featurize can be specified as either the numeric index
-        of the argument to featurize in *args or a named argument.  The code
-        tries to reconcile one of them, ultimately failing if it cannot find
-        one.
+    def featurize_paths(self, paths):
+        '''Featurizes the given paths using the Featurizer of this instance,
+        reusing memoized features when possible. All paths whose features are
+        not memoized are featurized in a single batch.
 
-        The method we use to tell if the argument needs to be featurized is by
-        checking if it is a string that points to a file on the disk, and if
-        that fails, if it is a string that points to a valid video.
+        Args:
+            paths: a list of paths
 
-        You can decorate with either just `@CanFeaturize.featurize_if_needed`,
-        in which case
-        or by specifying specific names of arguments to operate on either as
-        `@CanFeaturize.featurize_if_needed(arg_name="foo")`
-        or just
-        `@CanFeaturize.featurize_if_needed("foo")` and this will be a name not
-        an index.
+        Returns:
+            a list of feature vectors
+        '''
+        features = [None] * len(paths)
+        keys = [None] * len(paths)
+        missing = []
+        for idx, path in enumerate(paths):
+            if self.feature_cache_size > 0:
+                keys[idx] = self._get_feature_cache_key(path)
+                if keys[idx] in self._feature_cache:
+                    # Mark as recently used
+                    fv = self._feature_cache.pop(keys[idx])
+                    self._feature_cache[keys[idx]] = fv
+                    features[idx] = fv
+                    continue
+
+            missing.append(idx)
+
+        if len(missing) == 1:
+            fvs = [self.featurizer.featurize(paths[missing[0]])]
+        elif missing:
+            fvs = self.featurizer.featurize_batch(
+                [paths[idx] for idx in missing])
+        else:
+            fvs = []
 
-        Args:
-            arg_name ("X"): a string specifying the name of the argument
-                passed to the original function that you want to featurize
+        for idx, fv in zip(missing, fvs):
+            features[idx] = fv
+            if keys[idx] is not None:
+                self._feature_cache[keys[idx]] = fv
+                while len(self._feature_cache) > self.feature_cache_size:
+                    self._feature_cache.popitem(last=False)
+
+        return features
+
+    def _get_feature_cache_key(self, path):
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            # Non-file inputs, e.g., image sequence patterns
+            mtime = None
+
+        config = getattr(self.featurizer, "config", None)
+        if config is not None:
+            featurizer_key = etas.json_to_str(config, pretty_print=False)
+        else:
+            featurizer_key = etau.get_class_name(self.featurizer)
+
+        return path, mtime, featurizer_key
+
+    @staticmethod
+    def _is_featurizable_path(data):
+        if not isinstance(data, six.string_types):
+            return False
+
+        if os.path.exists(data):
+            return True
+
+        #
+        # The data is a string but not a single file, but it might be a file
+        # sequence.
+        #
+        # Currently the only such sequence we support is a video, so we check
+        # if data is a valid video path.
+        #
+        return etat.Video.is_valid_path(data)
 
-            arg_index (0): an int specifying the index of the argument passed
-                to the original function that you want to featurize. If
-                `arg_name` is provided, it takes precedence over `arg_index`
+    @staticmethod
+    def featurize_if_needed(*args, **kwargs):
+        '''Decorator that checks whether an argument of the decorated method
+        needs to be featurized and, if so, featurizes it using the
+        `featurizer` attribute of the class instance.
+
+        The argument to featurize can be specified either by its name or by
+        its numeric index in `*args`. If the argument is passed by name, the
+        name takes precedence over the index. If the argument cannot be found,
+        a warning is logged and the method is called without featurization.
+
+        An argument is featurized if it is a string that points to a file on
+        disk or to a valid video. Lists of such strings are featurized in a
+        single batch and replaced by a matrix whose rows contain their
+        features, or by a list of their features if they are not vectors of
+        the same length (e.g., the per-frame feature matrices of a
+        VideoFramesFeaturizer). Paths are featurized via `featurize_paths()`,
+        so their features are memoized if the instance has a
+        `feature_cache_size`.
+
+        Example:
+            @CanFeaturize.featurize_if_needed
+            def fit(self, X):
+                ...
+
+            @CanFeaturize.featurize_if_needed("foo")
+            def fit(self, foo):
+                ...
+
+            @CanFeaturize.featurize_if_needed(arg_name="foo", arg_index=2)
+            def fit(self, bar, foo):
+                ...
+
+        Args:
+            arg_name: the name of the argument of the decorated method to
+                featurize. The default is "X"
+            arg_index: the index of the argument of the decorated method to
+                featurize, which is used if the argument is not passed by
+                name. The default is 1, i.e., the first argument after `self`
 
         Raises:
             CanFeaturizeError: if featurization failed or was not allowed
@@ -319,27 +457,26 @@ class CanFeaturize(object):
                     logger.warning("Unknown argument; skipping featurization")
                     return caller(*args, **kwargs)
 
-                # Determine whether we need to featurize the input data.
-                should_featurize = cfobject.force_featurize
-                if not should_featurize and (used_name or used_index):
-                    if isinstance(data, six.string_types):
-                        if os.path.exists(data):
-                            should_featurize = True
-                        else:
-                            #
-                            # The data is a string but not a single file, but
-                            # it might be a file sequence.
-                            #
-                            # Currently the only such sequence we support is
-                            # a video, so we check if data is a valid video
-                            # path.
-                            #
-                            should_featurize = etat.Video.is_valid_path(data)
-
-                # Perform the actual featurization, if necessary.
-                if should_featurize:
+                # Determine whether we need to featurize the input data, and
+                # perform the actual featurization, if necessary.
+                force = cfobject.force_featurize
+                is_path_list = (
+                    isinstance(data, (list, tuple)) and data and all(
+                        isinstance(d, six.string_types) for d in data))
+                should_featurize = True
+                if isinstance(data, six.string_types) and (
+                        force or cfobject._is_featurizable_path(data)):
+                    data = cfobject.featurize_paths([data])[0]
+                elif is_path_list and (force or all(
+                        cfobject._is_featurizable_path(d) for d in data)):
+                    data = _stack_features(
+                        cfobject.featurize_paths(list(data)))
+                elif force:
                     data = cfobject.featurizer.featurize(data)
+                else:
+                    should_featurize = False
 
+                if should_featurize:
                     # Replace the data with its features.
                     if used_name:
                         kwargs[arg_name] = data
@@ -382,6 +519,16 @@ class VideoFramesFeaturizerConfig(Config):
         self.frame_featurizer = self.parse_object(
             d, "frame_featurizer", FeaturizerConfig)
         self.frames = self.parse_string(d, "frames", default="*")
+        self.workers = int(self.parse_number(d, "workers", default=1))
+        self.batch_size = int(self.parse_number(d, "batch_size", default=8))
+        self.backing_manager_cache_max_size = self.parse_number(
+            d, "backing_manager_cache_max_size", default=10 * 1024 ** 3)
+        self.skip_duplicate_frames = self.parse_bool(
+            d, "skip_duplicate_frames", default=False)
+        self.duplicate_frame_threshold = self.parse_number(
+            d, "duplicate_frame_threshold", default=1.0)
+        self.feature_codec_path = self.parse_string(
+            d, "feature_codec_path", default=None)
 
 
 class VideoFramesFeaturizer(Featurizer):
@@ -392,12 +539,22 @@ class VideoFramesFeaturizer(Featurizer):
 
     Featurized frames are stored on disk as compressed pickle files indexed by
     frame number. The location of the files on disk is controlled by the
-    `backing_path` attribute. By default, the backing path is `/tmp`.
+    `backing_path` attribute. By default, the backing path is `/tmp`. If the
+    frame featurizer returns a dictionary of feature vectors (e.g., a
+    VGG16Featurizer configured to extract multiple layers), all of the
+    feature sets are stored in the same file, keyed by name.
 
     This class also allows a `frame_preprocessor` function to be installed
     that preprocesses each input frame before featurizing it. By default, no
     preprocessing is performed.
 
+    Frames are passed to the frame featurizer in batches of up to
+    `batch_size` frames (8 by default) via `featurize_batch()`, so frame
+    featurizers that implement `_featurize_batch()` (e.g., the networks and
+    the thread pool of ORBFeaturizer) process multiple frames at once. Only
+    the frames whose features are not already in the backing store are
+    batched.
+
     **WARNING** if you use the same backing path for multiple videos your
     features will be invalid (features on disk are not overwritten, they are
     simply skipped).
@@ -420,6 +577,53 @@ class VideoFramesFeaturizer(Featurizer):
         "manual"
             the provided `backing_path` is used verbatim
 
+        "cache"
+            `backing_path` is used as the root of a content-addressed
+            FeatureCache. Each video is featurized into the cache entry for
+            its (video content, frame featurizer config, frame preprocessor)
+            combination, so re-featurizing the same video with the same
+            settings reuses the existing features, even across runs. The
+            total size of the cache is capped at
+            `backing_manager_cache_max_size` bytes by evicting the least
+            recently used entries. If a `frame_preprocessor` is installed,
+            `frame_preprocessor_id` must be set to a string that uniquely
+            identifies it (e.g., including the parameters of a closure), since
+            the identity of a function cannot be inferred reliably
+
+    On CPU-only hosts, the `workers` config field can be set to a value
+    greater than one to split the frames to featurize into that many
+    contiguous shards, each of which is featurized in its own process with its
+    own frame Featurizer and video reader. All workers write to the same
+    backing path, and `num_featurized_frames` and `num_skipped_frames` are
+    summed over the workers (duplicate detection restarts at the first frame
+    of each shard). When using this option, `intra_op_parallelism_threads` is
+    automatically set in `eta.config.tf_config` of each worker (unless it was
+    already set) so that the workers do not oversubscribe the CPU cores.
+    Workers are always created via `fork()`, even on platforms whose default
+    multiprocessing start method is "spawn", so they inherit the
+    `frame_preprocessor`, but the parent process must not have started a
+    TensorFlow session beforehand. On platforms that do not support `fork()`,
+    or if the frame featurizer of this instance is already running (e.g.,
+    because it is kept alive), the frames are featurized in this process.
+
+    For mostly static videos, the `skip_duplicate_frames` config field can be
+    set to True to skip featurizing frames that are near-duplicates of the
+    last featurized frame, as judged by a FrameChangeDetector with threshold
+    `duplicate_frame_threshold` that is applied to the frames after they are
+    preprocessed by the `frame_preprocessor`, if any. The features of skipped
+    frames are hard links to the features of the last featurized frame in the
+    backing store (or copies, if hard links are not supported). The number of
+    frames that were featurized and skipped by the last `featurize()` call
+    are available via the `num_featurized_frames` and `num_skipped_frames`
+    attributes.
+
+    To reduce the size of the backing store, the `feature_codec_path` config
+    field can point to a trained FeatureCodec (see `FeatureCodec.save()`),
+    in which case features are encoded before they are written to disk and
+    decoded when they are read. The features returned by this class are
+    always the decoded features, so that they are identical whether they
+    were just computed or read back from the backing store.
+
     @todo Refactor the backing managers into standalone Configurable classes
 
     @todo: Generalize to allow non npz-able features
@@ -435,22 +639,46 @@ class VideoFramesFeaturizer(Featurizer):
         self.validate(config)
         self.config = config
         self.most_recent_frame = -1
+        self.num_featurized_frames = 0
+        self.num_skipped_frames = 0
 
         super(VideoFramesFeaturizer, self).__init__()
 
         self._frame_string = "%08d.npz"
         self._frame_preprocessor = None
+        self._frame_preprocessor_id = None
         self._frame_featurizer = None
+        if self.config.feature_codec_path:
+            self._feature_codec = FeatureCodec.load(
+                self.config.feature_codec_path)
+        else:
+            self._feature_codec = None
         self._backing_path = None
 
         backing_managers = {
             "random": self._backing_manager_random,
             "replace": self._backing_manager_replace,
             "manual": self._backing_manager_manual,
+            "cache": self._backing_manager_cache,
         }
         self._backing_manager = backing_managers[self.config.backing_manager]
         self.update_backing_path(self.config.backing_path)
         self._backing_manager_random_last_tempdir = None
+        self._backing_manager_cache_last_key = None
+        if self.config.backing_manager == "cache":
+            self._feature_cache = FeatureCache(
+                self.config.backing_path,
+                self.config.backing_manager_cache_max_size)
+        else:
+            self._feature_cache = None
+
+    @property
+    def skip_ratio(self):
+        '''The fraction of the frames featurized by the last `featurize()`
+        call that were skipped as near-duplicates.
+        '''
+        total = self.num_featurized_frames + self.num_skipped_frames
+        return self.num_skipped_frames / total if total else 0.0
 
     @property
     def frame_preprocessor(self):
@@ -460,10 +688,28 @@ class VideoFramesFeaturizer(Featurizer):
     @frame_preprocessor.setter
     def frame_preprocessor(self, fp):
         self._frame_preprocessor = fp
+        self._frame_preprocessor_id = None
 
     @frame_preprocessor.deleter
     def frame_preprocessor(self):
         self._frame_preprocessor = None
+        self._frame_preprocessor_id = None
+
+    @property
+    def frame_preprocessor_id(self):
+        '''A string identifying the frame preprocessor, which is used to
+        address features in the "cache" backing manager. It is reset whenever
+        the frame preprocessor is changed, so it must be set after the
+        preprocessor. This is "" if no preprocessor is installed, and None if
+        a preprocessor is installed but no ID was set.
+        '''
+        if self._frame_preprocessor is None:
+            return ""
+        return self._frame_preprocessor_id
+
+    @frame_preprocessor_id.setter
+    def frame_preprocessor_id(self, fp_id):
+        self._frame_preprocessor_id = fp_id
 
     def _backing_manager_random(self, video_path, is_featurize_start=True):
         '''Backing manager that generates a new unique subdirectory of
@@ -498,6 +744,38 @@ class VideoFramesFeaturizer(Featurizer):
         '''Backing manager that simply uses the provided `backing_path`.'''
         pass
 
+    def _backing_manager_cache(self, video_path, is_featurize_start=True):
+        '''Backing manager that uses the FeatureCache entry for the video,
+        frame featurizer, and frame preprocessor as the backing directory.
+        '''
+        if is_featurize_start:
+            preprocessor_id = self.frame_preprocessor_id
+            if preprocessor_id is None:
+                raise VideoFramesFeaturizerError(
+                    "The \"cache\" backing manager requires a "
+                    "`frame_preprocessor_id` when a frame preprocessor is "
+                    "installed")
+
+            key = FeatureCache.make_key(
+                video_path, self._get_cache_config(), preprocessor_id)
+            self._backing_manager_cache_last_key = key
+            self.update_backing_path(self._feature_cache.get_entry_path(key))
+            return
+
+        self._feature_cache.evict(keep=self._backing_manager_cache_last_key)
+        self.update_backing_path(self.config.backing_path)
+
+    def _get_cache_config(self):
+        # The settings that affect the values of the features
+        d = {"frame_featurizer": self.config.frame_featurizer.serialize()}
+        if self.config.skip_duplicate_frames:
+            d["duplicate_frame_threshold"] = \
+                self.config.duplicate_frame_threshold
+        if self.config.feature_codec_path:
+            d["feature_codec"] = etau.MD5FileHasher.hash(
+                self.config.feature_codec_path)
+        return d
+
     def dim(self):
         '''Returns the dimension of the underlying frame Featurizer.'''
         if not self._frame_featurizer:
@@ -522,14 +800,19 @@ class VideoFramesFeaturizer(Featurizer):
 
         No checking is explicitly done here. Careful about starting from
         0 or 1.
+
+        Returns:
+            the feature vector, or a dictionary of feature vectors if the
+                frame featurizer extracts multiple feature sets
         '''
         p = self.featurized_frame_path(frame_number)
         if not os.path.isfile(p):
             raise FeaturizedFrameNotFoundError("Feature %d not found", p)
 
-        return np.load(p)["v"]
+        return _read_features(p, codec=self._feature_codec)
 
-    def featurize(self, video_path, frames=None, returnX=True):
+    def featurize(
+            self, video_path, frames=None, returnX=True, video_reader=None):
         '''Featurizes the frames of the input video.
 
         Attributes:
@@ -538,70 +821,298 @@ class VideoFramesFeaturizer(Featurizer):
                 video to featurize. By default, the value provided in the
                 VideoFramesFeaturizerConfig is used
             returnX: whether to return the frames matrix
+            video_reader: an optional, already opened VideoReader for
+                `video_path` from which to read the frames, e.g., a
+                BufferedVideoReader that has been decoding frames in the
+                background. If provided, `frames` is ignored and the reader
+                is closed after featurization. By default, a new
+                FFmpegVideoReader is opened
 
         Returns:
             If returnX is True, a (# frames) x (# dims) array is returned
-                whose rows contain the computed features
+                whose rows contain the computed features. If the frame
+                featurizer extracts multiple feature sets (e.g., multiple
+                layers of a network), a dictionary of such arrays is returned
         '''
         if not frames:
             frames = self.config.frames
 
         self._backing_manager(video_path)
-        self.start(warn_on_restart=False, keep_alive=False)
-        v = self._featurize(video_path, frames, returnX)
-        if self._keep_alive is False:
-            self.stop()
+        if (self.config.workers > 1 and video_reader is None and
+                self._can_featurize_parallel()):
+            v = self._featurize_parallel(video_path, frames, returnX)
+        else:
+            self.start(warn_on_restart=False, keep_alive=False)
+            v = self._featurize(
+                video_path, frames, returnX, video_reader=video_reader)
+            if self._keep_alive is False:
+                self.stop()
 
         self._backing_manager(video_path, False)
 
         return v
 
-    def _featurize(self, video_path, frames=None, returnX=True):
-        frames = frames or self.config.frames
-        logger.debug("Featurizing frames %s" % frames)
+    def featurize_batch(self, video_paths):
+        '''Featurizes the frames of each of the input videos via
+        `featurize()`, so that each video is featurized into its own backing
+        path.
 
-        if returnX:
-            X = None
+        Args:
+            video_paths: a list of input video paths
 
-        with etav.FFmpegVideoReader(video_path, frames=frames) as vr:
-            for img in vr:
-                self.most_recent_frame = vr.frame_number
-                path = self.featurized_frame_path(vr.frame_number)
+        Returns:
+            a list containing the features of each video, as returned by
+                `featurize()`
+        '''
+        return [self.featurize(video_path) for video_path in video_paths]
 
-                try:
-                    # Try to load the existing feature
-                    v = self.retrieve_featurized_frame(vr.frame_number)
-                except FeaturizedFrameNotFoundError:
-                    # Build the per-frame Featurizer, if necessary
-                    if not self._frame_featurizer:
-                        self._frame_featurizer = \
-                            self.config.frame_featurizer.build()
-                        self._frame_featurizer.start()
-
-                    if self._frame_preprocessor is not None:
-                        # Pre-process and then featurize the frame
-                        _img = self._frame_preprocessor(img)
-                        v = self._frame_featurizer.featurize(_img)
-                    else:
-                        # Featurize the frame
-                        v = self._frame_featurizer.featurize(img)
+    def iter_features(self, video_path, frames=None, batch_size=64):
+        '''Featurizes the frames of the input video and yields the features
+        in chunks, so that the full features matrix never needs to be held in
+        memory.
+
+        Features are read from and written to the backing store exactly as in
+        `featurize()`. Frames are always featurized in this process, even if
+        `workers` is greater than one.
+
+        Args:
+            video_path: the input video path
+            frames: an optional frames string to specify the frames of the
+                video to featurize. By default, the value provided in the
+                VideoFramesFeaturizerConfig is used
+            batch_size: the maximum number of frames per chunk. The default
+                is 64
 
-                    # Write the feature to disk
-                    np.savez_compressed(path, v=v)
+        Returns:
+            a generator that yields (frame_numbers, X) tuples, where
+                `frame_numbers` is an array of frame numbers and `X` is a
+                (# frames) x (# dims) array whose rows contain their features
+                (or a dictionary of such arrays if the frame featurizer
+                extracts multiple feature sets)
+        '''
+        if not frames:
+            frames = self.config.frames
 
-                if returnX:
-                    if X is None:
-                        # Lazily build the GrowableArray now that we know the
-                        # dimension of the features
-                        X = GrowableArray(len(v))
-                    X.update(v)
+        self._backing_manager(video_path)
+        self.start(warn_on_restart=False, keep_alive=False)
+        try:
+            frame_numbers = []
+            X = None
+            for frame_number, v in self._iter_frame_features(
+                    video_path, frames):
+                frame_numbers.append(frame_number)
+                X = _append_features(X, v)
+                if len(frame_numbers) >= batch_size:
+                    yield np.array(frame_numbers), _finalize_features(X)
+                    frame_numbers = []
+                    X = None
+
+            if frame_numbers:
+                yield np.array(frame_numbers), _finalize_features(X)
+        finally:
+            if self._keep_alive is False:
+                self.stop()
+            self._backing_manager(video_path, False)
+
+    def _featurize(
+            self, video_path, frames=None, returnX=True, video_reader=None):
+        X = None
+        for _, v in self._iter_frame_features(
+                video_path, frames=frames, video_reader=video_reader):
+            if returnX:
+                X = _append_features(X, v)
 
         if self._frame_featurizer and not self._keep_alive:
             # Stop the frame featurizer
             self._frame_featurizer.stop()
             self._frame_featurizer = None
 
-        return X.finalize() if returnX else None
+        return _finalize_features(X) if returnX else None
+
+    def _iter_frame_features(self, video_path, frames=None, video_reader=None):
+        '''Returns a generator that yields (frame_number, v) tuples
+        containing the features of each frame, which are retrieved from the
+        backing store, if possible, and otherwise computed and stored.
+        '''
+        if video_reader is None:
+            frames = frames or self.config.frames
+            video_reader = etav.FFmpegVideoReader(video_path, frames=frames)
+        logger.debug("Featurizing frames %s" % video_reader.frames)
+
+        if self.config.skip_duplicate_frames:
+            detector = FrameChangeDetector(
+                threshold=self.config.duplicate_frame_threshold)
+        else:
+            detector = None
+
+        self.num_featurized_frames = 0
+        self.num_skipped_frames = 0
+        last_frame = None  # the last frame that was not a duplicate
+        frames = []
+        num_to_featurize = 0
+
+        with video_reader as vr:
+            for img in vr:
+                self.most_recent_frame = vr.frame_number
+                frame = _FrameFeatures(
+                    vr.frame_number,
+                    self.featurized_frame_path(vr.frame_number))
+
+                # Duplicates are judged on the frames that are actually
+                # featurized, i.e., after preprocessing
+                _img = None
+                if detector is not None:
+                    _img = self._preprocess_frame(img)
+                is_duplicate = (
+                    detector is not None and detector.is_duplicate(_img) and
+                    last_frame is not None)
+
+                try:
+                    # Try to load the existing feature
+                    frame.v = self.retrieve_featurized_frame(vr.frame_number)
+                except FeaturizedFrameNotFoundError:
+                    if is_duplicate:
+                        # Reuse the feature of the last featurized frame
+                        frame.source = last_frame
+                    else:
+                        if _img is None:
+                            _img = self._preprocess_frame(img)
+                        frame.img = _img
+                        num_to_featurize += 1
+
+                if not is_duplicate:
+                    last_frame = frame
+
+                # Frames are featurized in batches, but they are always
+                # yielded in order
+                frames.append(frame)
+                if (num_to_featurize == 0 or
+                        num_to_featurize >= self.config.batch_size):
+                    for frame_number, v in self._flush_frames(frames):
+                        yield frame_number, v
+                    frames = []
+                    num_to_featurize = 0
+
+        for frame_number, v in self._flush_frames(frames):
+            yield frame_number, v
+
+        if detector is not None:
+            logger.info(
+                "Featurized %d frames; skipped %d duplicate frames (%.1f%%)",
+                self.num_featurized_frames, self.num_skipped_frames,
+                100.0 * self.skip_ratio)
+
+    def _preprocess_frame(self, img):
+        if self._frame_preprocessor is None:
+            return img
+        return self._frame_preprocessor(img)
+
+    def _flush_frames(self, frames):
+        '''Featurizes the given frames that need to be featurized in a single
+        batch and writes their features to disk, and then yields the
+        (frame_number, v) tuples of all of the frames, in order.
+        '''
+        to_featurize = [f for f in frames if f.img is not None]
+        if to_featurize:
+            # Build the per-frame Featurizer, if necessary
+            if not self._frame_featurizer:
+                self._frame_featurizer = self.config.frame_featurizer.build()
+                self._frame_featurizer.start()
+
+            vs = self._frame_featurizer.featurize_batch(
+                [f.img for f in to_featurize])
+            for frame, v in zip(to_featurize, vs):
+                # Write the feature to disk
+                frame.v = _write_features(
+                    frame.path, v, codec=self._feature_codec)
+                frame.img = None
+
+            self.num_featurized_frames += len(to_featurize)
+
+        for frame in frames:
+            if frame.source is not None:
+                _link_features(frame.source.path, frame.path)
+                frame.v = frame.source.v
+                frame.source = None
+                self.num_skipped_frames += 1
+
+            yield frame.frame_number, frame.v
+
+    def _can_featurize_parallel(self):
+        if etau.get_fork_context() is None:
+            logger.warning(
+                "fork() is not supported on this platform; featurizing "
+                "frames in this process")
+            return False
+
+        if self._frame_featurizer is not None:
+            # Forking a process that holds a running featurizer (e.g., a
+            # TensorFlow session) is unsafe
+            logger.warning(
+                "The frame featurizer is already running; featurizing "
+                "frames in this process")
+            return False
+
+        return True
+
+    def _featurize_parallel(self, video_path, frames, returnX):
+        if frames == "*":
+            frames = "1-%d" % etav.get_frame_count(video_path)
+        frames_list = etav.FrameRanges.from_str(frames).to_list()
+        shards = _split_frames(frames_list, self.config.workers)
+        logger.debug(
+            "Featurizing frames %s in %d shards", frames, len(shards))
+
+        # Workers are always forked so that they inherit the frame
+        # preprocessor, which need not be picklable
+        context = etau.get_fork_context()
+        intra_op_threads = max(1, etau.get_cpu_count() // len(shards))
+        workers = []
+        for shard in shards:
+            recv_conn, send_conn = context.Pipe(duplex=False)
+            p = context.Process(
+                target=_featurize_shard,
+                args=(
+                    send_conn, self.config, self._backing_path,
+                    self._frame_preprocessor, self.frame_preprocessor_id,
+                    video_path, shard, intra_op_threads))
+            p.start()
+            send_conn.close()
+            workers.append((p, recv_conn))
+
+        # Read the stats of each worker before reaping it, so that no worker
+        # blocks on its pipe
+        self.num_featurized_frames = 0
+        self.num_skipped_frames = 0
+        failed = 0
+        for p, conn in workers:
+            try:
+                num_featurized, num_skipped = conn.recv()
+                self.num_featurized_frames += num_featurized
+                self.num_skipped_frames += num_skipped
+            except EOFError:
+                failed += 1  # the worker died before reporting its stats
+            finally:
+                conn.close()
+
+            p.join()
+
+        if failed:
+            raise VideoFramesFeaturizerError(
+                "%d of %d featurization workers failed" % (
+                    failed, len(workers)))
+
+        self.most_recent_frame = frames_list[-1]
+
+        if not returnX:
+            return None
+
+        X = None
+        for frame_number in frames_list:
+            v = self.retrieve_featurized_frame(frame_number)
+            X = _append_features(X, v)
+
+        return _finalize_features(X)
 
     def featurized_frame_path(self, frame_number):
         '''Returns the backing path for the given frame number.'''
@@ -632,32 +1143,967 @@ class VideoFramesFeaturizer(Featurizer):
                 raise
 
 
+class VideoFramesFeaturizerError(Exception):
+    '''Exception raised when a VideoFramesFeaturizer fails.'''
+    pass
+
+
+class FeatureCodecConfig(Config):
+    '''Configuration settings for a FeatureCodec.
+
+    Attributes:
+        num_components: the number of principal components onto which to
+            project the features. The default is 256
+        use_pq: whether to further compress the projected features via
+            product quantization. The default is False
+        num_subvectors: the number of PQ subvectors. Must evenly divide
+            `num_components`. The default is 32
+        num_codewords: the number of codewords per PQ subvector. The default
+            is 256
+    '''
+
+    def __init__(self, d):
+        self.num_components = int(self.parse_number(
+            d, "num_components", default=256))
+        self.use_pq = self.parse_bool(d, "use_pq", default=False)
+        self.num_subvectors = int(self.parse_number(
+            d, "num_subvectors", default=32))
+        self.num_codewords = int(self.parse_number(
+            d, "num_codewords", default=256))
+
+
+class FeatureCodec(Configurable):
+    '''A trainable lossy codec for compressing feature vectors.
+
+    Features are projected onto their top `num_components` principal
+    components and stored as float16 coefficients or, if `use_pq` is True, as
+    product quantization codes of the coefficients.
+
+    Example usage:
+    ```
+    codec = FeatureCodec()
+    codec.train(X_sample)
+    codec.save("/path/to/codec.npz")
+
+    codes = codec.encode(X)
+    X_approx = codec.decode(codes)
+    ```
+    '''
+
+    def __init__(self, config=None):
+        '''Creates a FeatureCodec instance.
+
+        Args:
+            config: an optional FeatureCodecConfig instance. If omitted, the
+                default configuration is used
+        '''
+        self.config = config or FeatureCodecConfig.default()
+        self.validate(self.config)
+
+        self.mean = None
+        self.components = None
+        self.pq = None
+
+    @property
+    def is_trained(self):
+        '''Whether the codec has been trained.'''
+        return self.components is not None
+
+    def compression_ratio(self):
+        '''Returns the ratio of the size of a float32 feature vector to the
+        size of its encoding.
+        '''
+        dim = self.components.shape[1]
+        if self.pq is not None:
+            code_size = self.pq.num_subvectors * np.dtype(
+                self.pq.code_dtype).itemsize
+        else:
+            code_size = 2 * len(self.components)
+
+        return 4.0 * dim / code_size
+
+    def train(self, X, seed=None):
+        '''Trains the codec on the given sample of features.
+
+        Args:
+            X: an n x d array of features
+            seed: an optional random seed for training the product quantizer
+        '''
+        X = np.asarray(X, dtype=np.float32)
+        self.mean = np.mean(X, axis=0)
+
+        # Principal components via SVD of the centered data
+        _, _, Vt = np.linalg.svd(X - self.mean, full_matrices=False)
+        self.components = Vt[:self.config.num_components]
+
+        if self.config.use_pq:
+            self.pq = etan.ProductQuantizer(
+                num_subvectors=self.config.num_subvectors,
+                num_codewords=self.config.num_codewords)
+            self.pq.train(self._project(X), seed=seed)
+
+    def encode(self, X):
+        '''Encodes the given features.
+
+        Args:
+            X: an n x d array of features
+
+        Returns:
+            an n x num_components float16 array of coefficients, or an
+                n x num_subvectors array of PQ codes
+        '''
+        Y = self._project(np.asarray(X, dtype=np.float32))
+        if self.pq is not None:
+            return self.pq.encode(Y)
+
+        return Y.astype(np.float16)
+
+    def decode(self, codes):
+        '''Decodes the given encoded features.
+
+        Args:
+            codes: an array of codes returned by `encode()`
+
+        Returns:
+            an n x d array of (approximate) features
+        '''
+        if self.pq is not None:
+            Y = self.pq.decode(codes)
+        else:
+            Y = codes.astype(np.float32)
+
+        return np.dot(Y, self.components) + self.mean
+
+    def save(self, path):
+        '''Saves the codec to disk.
+
+        Args:
+            path: the output .npz path
+        '''
+        d = {
+            "config": etas.json_to_str(self.config),
+            "mean": self.mean,
+            "components": self.components,
+        }
+        if self.pq is not None:
+            d["codebooks"] = self.pq.codebooks
+
+        etau.ensure_basedir(path)
+        np.savez(path, **d)
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a FeatureCodec from disk.
+
+        Args:
+            path: the path to a .npz file written by `save()`
+
+        Returns:
+            a FeatureCodec instance
+        '''
+        d = np.load(path)
+        config = FeatureCodecConfig.from_dict(etas.load_json(str(d["config"])))
+        codec = cls(config)
+        codec.mean = d["mean"]
+        codec.components = d["components"]
+        if "codebooks" in d.files:
+            codec.pq = etan.ProductQuantizer.from_codebooks(d["codebooks"])
+
+        return codec
+
+    def _project(self, X):
+        return np.dot(X - self.mean, self.components.T)
+
+
+def evaluate_feature_codecs(X_train, X_test, configs, seed=None):
+    '''Trains FeatureCodecs with the given configurations and reports their
+    reconstruction error and compression ratio on held-out features.
+
+    Args:
+        X_train: an n x d array of features on which to train the codecs
+        X_test: an m x d array of features on which to evaluate them
+        configs: a list of FeatureCodecConfig instances
+        seed: an optional random seed
+
+    Returns:
+        a list of dictionaries, one per config, containing the "config", the
+            "compression_ratio", and the "relative_error" of the codec, which
+            is the mean of `||x - decode(encode(x))|| / ||x||` over X_test
+    '''
+    X_test = np.asarray(X_test, dtype=np.float32)
+    norms = np.maximum(np.linalg.norm(X_test, axis=1), 1e-12)
+
+    results = []
+    for config in configs:
+        codec = FeatureCodec(config)
+        codec.train(X_train, seed=seed)
+        X_approx = codec.decode(codec.encode(X_test))
+        errors = np.linalg.norm(X_test - X_approx, axis=1) / norms
+        result = {
+            "config": config,
+            "compression_ratio": codec.compression_ratio(),
+            "relative_error": float(np.mean(errors)),
+        }
+        logger.info(
+            "num_components = %d, use_pq = %s: compression %.1fx, relative "
+            "error %.4f", config.num_components, config.use_pq,
+            result["compression_ratio"], result["relative_error"])
+        results.append(result)
+
+    return results
+
+
+class ClipFeatures(object):
+    '''Features of the fixed-length clips of a video, keyed by the first
+    frame number of each clip.
+
+    Prefix sums of the features are maintained so that the mean feature of
+    the clips in any frame range can be computed in O(# dims) time.
+
+    Attributes:
+        start_frames: a sorted array of the first frame numbers of the clips
+        X: a (# clips) x (# dims) array of clip features
+        clip_length: the number of frames in each clip
+    '''
+
+    def __init__(self, start_frames, X, clip_length):
+        '''Creates a ClipFeatures instance.
+
+        Args:
+            start_frames: an array of the first frame numbers of the clips
+            X: a (# clips) x (# dims) array of clip features
+            clip_length: the number of frames in each clip
+        '''
+        order = np.argsort(start_frames, kind="mergesort")
+        self.start_frames = np.asarray(start_frames)[order]
+        self.X = np.asarray(X)[order]
+        self.clip_length = clip_length
+
+        self._prefix_sums = np.zeros(
+            (len(self.X) + 1, self.X.shape[1]), dtype=np.float64)
+        np.cumsum(self.X, axis=0, out=self._prefix_sums[1:])
+
+    def __len__(self):
+        return len(self.start_frames)
+
+    def get_clip_range(self, first_frame, last_frame, contained=True):
+        '''Returns the [start, stop) indices of the clips in the given frame
+        range.
+
+        Args:
+            first_frame: the first frame of the range
+            last_frame: the last frame of the range (inclusive)
+            contained: whether to only include the clips that lie entirely
+                within the range (True), or all clips that overlap it
+                (False). The default is True
+
+        Returns:
+            a (start, stop) tuple of clip indices
+        '''
+        if contained:
+            lo = first_frame
+            hi = last_frame - self.clip_length + 1
+        else:
+            lo = first_frame - self.clip_length + 1
+            hi = last_frame
+
+        start = np.searchsorted(self.start_frames, lo, side="left")
+        stop = np.searchsorted(self.start_frames, hi, side="right")
+        return int(start), int(max(start, stop))
+
+    def aggregate(
+            self, first_frame, last_frame, contained=True, normalize=True):
+        '''Computes the mean feature of the clips in the given frame range.
+
+        Args:
+            first_frame: the first frame of the range
+            last_frame: the last frame of the range (inclusive)
+            contained: whether to only include the clips that lie entirely
+                within the range (True), or all clips that overlap it
+                (False). The default is True
+            normalize: whether to L2-normalize the mean feature. The default
+                is True
+
+        Returns:
+            the mean feature vector, or None if no clips were in the range
+        '''
+        start, stop = self.get_clip_range(
+            first_frame, last_frame, contained=contained)
+        if start == stop:
+            return None
+
+        v = (self._prefix_sums[stop] - self._prefix_sums[start]) / (
+            stop - start)
+        if normalize:
+            v /= max(np.linalg.norm(v), 1e-12)
+
+        return v.astype(self.X.dtype)
+
+    def write(self, path):
+        '''Writes the clip features to disk.
+
+        Args:
+            path: the output .npz path
+        '''
+        etau.ensure_basedir(path)
+        np.savez_compressed(
+            path, start_frames=self.start_frames, X=self.X,
+            clip_length=self.clip_length)
+
+    @classmethod
+    def read(cls, path):
+        '''Reads ClipFeatures from disk.
+
+        Args:
+            path: the path to a .npz file written by `write()`
+
+        Returns:
+            a ClipFeatures instance
+        '''
+        d = np.load(path)
+        return cls(d["start_frames"], d["X"], int(d["clip_length"]))
+
+
+class FeatureReducer(object):
+    '''Base class for reducers that aggregate streams of feature chunks,
+    such as those generated by `VideoFramesFeaturizer.iter_features()`, in
+    O(# dims) memory.
+
+    Subclasses must implement the `update()` and `result()` methods.
+
+    Example usage:
+    ```
+    reducer = MeanFeatureReducer()
+    for _, X in video_frames_featurizer.iter_features(video_path):
+        reducer.update(X)
+
+    mean = reducer.result()
+    ```
+    '''
+
+    def update(self, X):
+        '''Updates the reducer with the given chunk of features.
+
+        Args:
+            X: a (# frames) x (# dims) array of features
+        '''
+        raise NotImplementedError("subclass must implement update()")
+
+    def result(self):
+        '''Returns the result of the reduction.'''
+        raise NotImplementedError("subclass must implement result()")
+
+
+class MeanFeatureReducer(FeatureReducer):
+    '''Reducer that computes the mean of a stream of features.'''
+
+    def __init__(self):
+        self._sum = None
+        self._count = 0
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self._sum is None:
+            self._sum = np.zeros(X.shape[1])
+        self._sum += np.sum(X, axis=0)
+        self._count += len(X)
+
+    def result(self):
+        '''Returns the mean feature vector, or None if no features were
+        seen.
+        '''
+        if not self._count:
+            return None
+        return self._sum / self._count
+
+
+class MaxFeatureReducer(FeatureReducer):
+    '''Reducer that computes the elementwise maximum of a stream of
+    features.
+    '''
+
+    def __init__(self):
+        self._max = None
+
+    def update(self, X):
+        chunk_max = np.max(X, axis=0)
+        if self._max is None:
+            self._max = chunk_max
+        else:
+            np.maximum(self._max, chunk_max, out=self._max)
+
+    def result(self):
+        '''Returns the maximum feature vector, or None if no features were
+        seen.
+        '''
+        return self._max
+
+
+class WindowedMeanFeatureReducer(FeatureReducer):
+    '''Reducer that computes the means of consecutive, non-overlapping
+    windows of a stream of features.
+
+    Only the running sum of the current window is kept in memory, along with
+    the means of the completed windows.
+    '''
+
+    def __init__(self, window_size):
+        '''Creates a WindowedMeanFeatureReducer instance.
+
+        Args:
+            window_size: the number of features per window
+        '''
+        self.window_size = window_size
+        self._window_means = []
+        self._sum = None
+        self._count = 0
+
+    def update(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self._sum is None:
+            self._sum = np.zeros(X.shape[1])
+
+        idx = 0
+        while idx < len(X):
+            num = min(self.window_size - self._count, len(X) - idx)
+            self._sum += np.sum(X[idx:idx + num], axis=0)
+            self._count += num
+            idx += num
+            if self._count == self.window_size:
+                self._window_means.append(self._sum / self._count)
+                self._sum = np.zeros_like(self._sum)
+                self._count = 0
+
+    def result(self):
+        '''Returns a (# windows) x (# dims) array containing the mean of
+        each window. A final partial window is included, if any.
+        '''
+        means = list(self._window_means)
+        if self._count:
+            means.append(self._sum / self._count)
+        if not means:
+            return None
+        return np.array(means)
+
+
+class FeatureCache(object):
+    '''A content-addressed cache of featurized video frames on disk.
+
+    Each entry of the cache is a subdirectory of `cache_dir` whose name is a
+    hash of the video contents, the settings of the Featurizer that computed
+    the features, and the identity of any preprocessing applied to the
+    frames. Entries contain one features file per frame, so features for
+    different subsets of frames of the same video accumulate in the same
+    entry.
+
+    The total size of the cache is capped by evicting the least recently
+    used entries. The last time that an entry was used is recorded as the
+    modification time of its directory.
+    '''
+
+    def __init__(self, cache_dir, max_size):
+        '''Creates a FeatureCache instance.
+
+        Args:
+            cache_dir: the cache directory
+            max_size: the maximum size of the cache, in bytes
+        '''
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def make_key(video_path, featurizer_config, preprocessor_id=""):
+        '''Generates the cache key for the given video and settings.
+
+        The video is identified by the hash of its contents, which is cached
+        in a sidecar (see `eta.core.utils.FileHasher`) so that the video is
+        only rehashed when its size or modification time changes.
+
+        Args:
+            video_path: the path to the video
+            featurizer_config: a JSON dictionary or Serializable describing
+                the Featurizer settings
+            preprocessor_id: an optional string identifying the frame
+                preprocessing
+
+        Returns:
+            the cache key
+        '''
+        config_str = etas.json_to_str(featurizer_config, pretty_print=False)
+        key_str = "\n".join([
+            etau.MD5FileHasher.hash(video_path, use_cache=True), config_str,
+            preprocessor_id])
+        return hashlib.md5(key_str.encode("utf-8")).hexdigest()
+
+    def get_entry_path(self, key):
+        '''Returns the directory of the cache entry with the given key,
+        creating it if necessary, and marks the entry as recently used.
+
+        Args:
+            key: the cache key
+
+        Returns:
+            the path to the cache entry directory
+        '''
+        path = os.path.join(self.cache_dir, key)
+        etau.ensure_dir(path)
+        os.utime(path, None)
+        return path
+
+    def get_size(self):
+        '''Returns the total size of the cache, in bytes.'''
+        return sum(size for _, _, size in self._get_entries())
+
+    def evict(self, keep=None):
+        '''Evicts the least recently used entries of the cache until its
+        total size is at most `max_size`.
+
+        Args:
+            keep: an optional key of an entry that must not be evicted
+        '''
+        entries = sorted(self._get_entries())
+        total_size = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if total_size <= self.max_size:
+                break
+            if key == keep:
+                continue
+
+            logger.debug("Evicting feature cache entry '%s'", key)
+            shutil.rmtree(
+                os.path.join(self.cache_dir, key), ignore_errors=True)
+            total_size -= size
+
+    def _get_entries(self):
+        '''Returns a list of (last used time, key, size) tuples for each
+        entry in the cache.
+        '''
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(path):
+                continue
+
+            try:
+                # Hard linked duplicate frames are counted separately, which
+                # overestimates the size of the cache slightly
+                size = sum(
+                    os.path.getsize(os.path.join(path, f))
+                    for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), key, size))
+            except OSError:
+                # The entry was evicted by another process
+                pass
+
+        return entries
+
+
+class FrameChangeDetector(object):
+    '''Cheap detector of near-duplicate video frames.
+
+    Each frame is compared to the last frame that was judged to be new via
+    the mean absolute difference of their downsampled grayscale thumbnails,
+    in units of 8-bit pixel intensity.
+    '''
+
+    def __init__(self, threshold=1.0, size=32):
+        '''Creates a FrameChangeDetector instance.
+
+        Args:
+            threshold: the mean absolute difference at or below which a
+                frame is considered a duplicate. The default is 1.0
+            size: the width and height of the thumbnails to compare. The
+                default is 32
+        '''
+        self.threshold = threshold
+        self.size = size
+        self._reference = None
+
+    def reset(self):
+        '''Resets the detector so that the next frame is always new.'''
+        self._reference = None
+
+    def is_duplicate(self, img):
+        '''Determines whether the given frame is a near-duplicate of the last
+        new frame. If it is not, the frame becomes the new reference frame.
+
+        Args:
+            img: the frame
+
+        Returns:
+            True if the frame is a near-duplicate, and False otherwise
+        '''
+        thumb = etai.resize(
+            img, self.size, self.size, interpolation=cv2.INTER_AREA)
+        thumb = thumb.astype(np.float32)
+        if thumb.ndim == 3:
+            thumb = np.mean(thumb[:, :, :3], axis=2)
+
+        if self._reference is not None:
+            diff = np.mean(np.abs(thumb - self._reference))
+            if diff <= self.threshold:
+                return True
+
+        self._reference = thumb
+        return False
+
+
+def unpack_layer_features(layers, outputs):
+    '''Unpacks the outputs of a multi-layer network evaluation into
+    per-input features.
+
+    Args:
+        layers: the list of layer names that were evaluated
+        outputs: a list containing the output array of each layer, each of
+            which has size [XXXX, ...], where XXXX is the number of inputs
+
+    Returns:
+        a list of XXXX features. If only one layer was evaluated, each feature
+            is a 1D array containing the flattened output of the layer for
+            the input. Otherwise, each feature is a dictionary mapping layer
+            names to 1D arrays
+    '''
+    outputs = [np.reshape(o, (len(o), -1)) for o in outputs]
+    if len(layers) == 1:
+        return list(outputs[0])
+
+    return [
+        OrderedDict((l, o[idx]) for l, o in zip(layers, outputs))
+        for idx in range(len(outputs[0]))
+    ]
+
+
+def iter_featurized_frames(
+        backing_path, batch_size=1024, layer=None, codec=None):
+    '''Iterates over the features stored in the given VideoFramesFeaturizer
+    backing directory in chunks, in order of frame number.
+
+    Args:
+        backing_path: the backing directory
+        batch_size: the maximum number of frames per chunk. The default is
+            1024
+        layer: the name of the feature set to load when the backing store
+            contains multiple feature sets per frame (e.g., multiple layers
+            of a network). Must be provided in this case
+        codec: the FeatureCodec with which the features were encoded, if
+            any
+
+    Returns:
+        a generator that yields (frame_numbers, X) tuples, where
+            `frame_numbers` is an array of frame numbers and `X` is a
+            (# frames) x (# dims) array whose rows contain their features
+    '''
+    frame_numbers = sorted(
+        int(os.path.splitext(f)[0]) for f in os.listdir(backing_path)
+        if f.endswith(".npz"))
+
+    for start in range(0, len(frame_numbers), batch_size):
+        chunk = frame_numbers[start:start + batch_size]
+        X = None
+        for frame_number in chunk:
+            v = _read_features(
+                os.path.join(backing_path, "%08d.npz" % frame_number),
+                codec=codec)
+            if isinstance(v, dict):
+                if layer is None:
+                    raise ValueError(
+                        "Backing store '%s' contains multiple feature sets; "
+                        "a layer must be specified" % backing_path)
+                v = v[layer]
+            X = _append_features(X, v)
+
+        yield np.array(chunk), _finalize_features(X)
+
+
+def _stack_features(fvs):
+    '''Stacks the given feature vectors into a matrix, or returns them as-is
+    if they are not all vectors of the same length.
+    '''
+    is_vector = [isinstance(fv, np.ndarray) and fv.ndim == 1 for fv in fvs]
+    if all(is_vector) and len(set(len(fv) for fv in fvs)) == 1:
+        return np.array(fvs)
+    return fvs
+
+
+def _write_features(path, v, codec=None):
+    '''Writes the given features to disk, encoding them with the given
+    FeatureCodec, if provided.
+
+    Returns:
+        the features as they will be read back from disk
+    '''
+    if codec is not None:
+        if isinstance(v, dict):
+            raise VideoFramesFeaturizerError(
+                "Feature codecs do not support multiple feature sets")
+        c = codec.encode(v[np.newaxis, :])
+        np.savez_compressed(path, c=c[0])
+        return codec.decode(c)[0]
+
+    if isinstance(v, dict):
+        np.savez_compressed(path, **v)
+    else:
+        np.savez_compressed(path, v=v)
+
+    return v
+
+
+def _read_features(path, codec=None):
+    features = np.load(path)
+    if features.files == ["v"]:
+        return features["v"]
+
+    if features.files == ["c"]:
+        if codec is None:
+            raise VideoFramesFeaturizerError(
+                "Features '%s' are encoded, but no codec was provided" % path)
+        return codec.decode(features["c"][np.newaxis, :])[0]
+
+    return OrderedDict((k, features[k]) for k in features.files)
+
+
+def _link_features(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _append_features(X, v):
+    '''Appends the feature vector (or dictionary of feature vectors) `v` to
+    the GrowableArray (or dictionary of GrowableArrays) `X`, which is lazily
+    built if it is None.
+    '''
+    if isinstance(v, dict):
+        if X is None:
+            X = OrderedDict(
+                (k, GrowableArray(len(vk))) for k, vk in iteritems(v))
+        for k, vk in iteritems(v):
+            X[k].update(vk)
+        return X
+
+    if X is None:
+        X = GrowableArray(len(v))
+    X.update(v)
+    return X
+
+
+def _finalize_features(X):
+    if X is None:
+        return None
+    if isinstance(X, dict):
+        return OrderedDict((k, Xk.finalize()) for k, Xk in iteritems(X))
+    return X.finalize()
+
+
+class _FrameFeatures(object):
+    '''The features of a frame being processed by a VideoFramesFeaturizer.'''
+
+    def __init__(self, frame_number, path):
+        self.frame_number = frame_number
+        self.path = path
+        self.v = None
+        self.img = None  # the preprocessed frame, if it must be featurized
+        self.source = None  # the frame whose features a duplicate reuses
+
+
+def _split_frames(frames_list, num_shards):
+    '''Splits the given list of frames into at most `num_shards` contiguous
+    frames strings of (nearly) equal size.
+    '''
+    num_shards = max(1, min(num_shards, len(frames_list)))
+    size, extra = divmod(len(frames_list), num_shards)
+    shards = []
+    start = 0
+    for idx in range(num_shards):
+        end = start + size + (1 if idx < extra else 0)
+        shards.append(
+            etav.FrameRanges.from_list(frames_list[start:end]).to_str())
+        start = end
+
+    return shards
+
+
+def _featurize_shard(
+        conn, config, backing_path, frame_preprocessor, frame_preprocessor_id,
+        video_path, frames, intra_op_threads):
+    '''Worker function that featurizes one shard of frames in a forked
+    subprocess and sends the (num_featurized_frames, num_skipped_frames) of
+    the shard to the parent via the given connection.
+    '''
+    tf_config = dict(eta.config.tf_config)
+    tf_config.setdefault("intra_op_parallelism_threads", intra_op_threads)
+    eta.set_config_settings(tf_config=tf_config)
+
+    d = config.serialize()
+    d["backing_manager"] = "manual"
+    d["backing_path"] = backing_path
+    d["workers"] = 1
+    shard_config = VideoFramesFeaturizerConfig(d)
+
+    vff = VideoFramesFeaturizer(shard_config)
+    vff.frame_preprocessor = frame_preprocessor
+    vff.frame_preprocessor_id = frame_preprocessor_id
+    vff.featurize(video_path, frames=frames, returnX=False)
+
+    conn.send((vff.num_featurized_frames, vff.num_skipped_frames))
+    conn.close()
+
+
+class ORBFeaturizerConfig(Config):
+    '''Configuration settings for an ORBFeaturizer.
+
+    Attributes:
+        num_keypoints: the number of keypoints to describe per image. The
+            default is 128
+        num_threads: the number of threads to use when featurizing batches of
+            images. By default, `eta.core.utils.get_cpu_count()` is used
+    '''
+
+    def __init__(self, d):
+        self.num_keypoints = int(self.parse_number(
+            d, "num_keypoints", default=128))
+        self.num_threads = int(self.parse_number(
+            d, "num_threads", default=0))
+
+
 class ORBFeaturizer(Featurizer):
     '''ORB (Oriented FAST and rotated BRIEF features) Featurizer.
 
+    Each image is featurized as a fixed-length uint8 vector of length
+    `dim() = 33 * num_keypoints`. The first `32 * num_keypoints` entries
+    contain the 32-byte descriptors of the (at most) `num_keypoints`
+    strongest keypoints in the image, in descending order of response, and
+    are zero-padded if fewer keypoints were found. The last `num_keypoints`
+    entries are a validity mask whose entries are 1 for the slots that
+    contain a descriptor and 0 for padding. Use `split_orb_features()` to
+    separate the descriptors and the mask.
+
+    Batches of images are featurized in a thread pool, since OpenCV releases
+    the GIL while computing the features.
+
     Reference:
         http://www.willowgarage.com/sites/default/files/orb_final.pdf
     '''
 
-    def __init__(self, num_keypoints=128):
-        '''Constructs a new ORB Featurizer instance.'''
+    def __init__(self, config=None, num_keypoints=None):
+        '''Constructs a new ORB Featurizer instance.
+
+        Args:
+            config: an optional ORBFeaturizerConfig instance. If omitted, the
+                default configuration is used. For backwards compatibility,
+                an integer is interpreted as `num_keypoints`
+            num_keypoints: deprecated; use the `num_keypoints` field of
+                `config` instead. If provided, the number of keypoints to
+                describe per image
+
+        Raises:
+            ValueError: if both `config` and `num_keypoints` are provided
+        '''
         super(ORBFeaturizer, self).__init__()
-        self.num_keypoints = num_keypoints
+        if isinstance(config, six.integer_types):
+            config, num_keypoints = None, config
 
-        try:
-            # OpenCV 3
-            self.orb = cv2.ORB_create(nfeatures=num_keypoints)
-        except AttributeError:
-            # OpenCV 2
-            self.orb = cv2.ORB(nfeatures=num_keypoints)
+        if num_keypoints is not None:
+            if config is not None:
+                raise ValueError(
+                    "Cannot provide both `config` and `num_keypoints`")
+
+            logger.warning(
+                "ORBFeaturizer(num_keypoints) is deprecated; pass an "
+                "ORBFeaturizerConfig instead")
+            config = ORBFeaturizerConfig.from_dict(
+                {"num_keypoints": num_keypoints})
+
+        self.config = config or ORBFeaturizerConfig.default()
+        self.validate(self.config)
+        self.num_keypoints = self.config.num_keypoints
+
+        self._local = threading.local()
+        self._pool = None
 
     def dim(self):
         '''Return the dimension of the features.'''
-        return 32 * self.num_keypoints
+        return 33 * self.num_keypoints
+
+    def _stop(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
 
     def _featurize(self, img):
-        gray = etai.rgb_to_gray(img)
-        return self.orb.detectAndCompute(gray, None)[1].flatten()
+        if etai.is_gray(img):
+            gray = img
+        else:
+            gray = etai.rgb_to_gray(img[:, :, :3])
+
+        keypoints, descriptors = self._get_orb().detectAndCompute(gray, None)
+
+        v = np.zeros(self.dim(), dtype=np.uint8)
+        if descriptors is None or not keypoints:
+            return v
+
+        # Keep the strongest keypoints, breaking ties by location so that the
+        # output is deterministic
+        order = sorted(
+            range(len(keypoints)),
+            key=lambda i: (
+                -keypoints[i].response, keypoints[i].pt[1],
+                keypoints[i].pt[0]))[:self.num_keypoints]
+
+        num = len(order)
+        v[:32 * num] = descriptors[order].ravel()
+        v[32 * self.num_keypoints:32 * self.num_keypoints + num] = 1
+        return v
+
+    def _featurize_batch(self, imgs):
+        num_threads = self.config.num_threads or etau.get_cpu_count()
+        if num_threads < 2 or len(imgs) < 2:
+            return [self._featurize(img) for img in imgs]
+
+        # The pool is created on the first batch, so single-image use never
+        # starts any threads
+        if self._pool is None:
+            self._pool = ThreadPool(num_threads)
+
+        return self._pool.map(self._featurize, imgs)
+
+    def _get_orb(self):
+        # cv2 feature detectors are not thread-safe, so each thread gets its
+        # own instance
+        orb = getattr(self._local, "orb", None)
+        if orb is None:
+            try:
+                # OpenCV 3
+                orb = cv2.ORB_create(nfeatures=self.num_keypoints)
+            except AttributeError:
+                # OpenCV 2
+                orb = cv2.ORB(nfeatures=self.num_keypoints)
+            self._local.orb = orb
+
+        return orb
+
+
+def split_orb_features(v, num_keypoints):
+    '''Splits a feature vector generated by an ORBFeaturizer into its
+    descriptors and validity mask.
+
+    Args:
+        v: a feature vector of length `33 * num_keypoints`
+        num_keypoints: the `num_keypoints` of the ORBFeaturizer
+
+    Returns:
+        descriptors: a num_keypoints x 32 array of descriptors
+        mask: a boolean array of length num_keypoints indicating which rows
+            of `descriptors` are valid
+    '''
+    descriptors = np.reshape(v[:32 * num_keypoints], (num_keypoints, 32))
+    mask = np.asarray(v[32 * num_keypoints:], dtype=bool)
+    return descriptors, mask
 
 
 class RandFeaturizer(Featurizer):
@@ -0,0 +1,528 @@
+'''
+Core infrastructure for serving Featurizers from a long-lived process.
+
+A FeaturizerServer keeps Featurizer instances warm (started) across requests
+and batches together the requests that it receives from multiple clients for
+the same Featurizer. Clients use a RemoteFeaturizer, which exposes the same
+interface as any other Featurizer, to send their data to the server.
+
+The server listens on either a local Unix socket, e.g., "/tmp/eta.sock", or a
+localhost port, e.g., "localhost:6451". By default, it listens on a Unix socket
+in "~/.eta" that only the current user can access.
+
+Requests are pickled, so clients must authenticate with a secret key before
+the server reads any data from them. If no key is configured, the server
+generates a random key and writes it to a file that only the current user can
+read, from which RemoteFeaturizers running as the same user load it. The
+server only builds Featurizers whose types are in its whitelist.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+from future.utils import itervalues
+from six.moves import queue
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import binascii
+import errno
+import logging
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+import os
+import socket
+import stat
+import threading
+import time
+
+from eta.core.config import Config, Configurable
+from eta.core.features import Featurizer, FeaturizerConfig
+import eta.core.serial as etas
+import eta.core.utils as etau
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_ADDRESS = os.path.join(
+    os.path.expanduser("~"), ".eta", "featurizer_server.sock")
+DEFAULT_AUTHKEY_PATH = os.path.join(
+    os.path.expanduser("~"), ".eta", "featurizer_server.key")
+DEFAULT_FEATURIZER_TYPES = [
+    "eta.core.c3d.C3DFeaturizer",
+    "eta.core.features.ORBFeaturizer",
+    "eta.core.vgg16.VGG16Featurizer",
+]
+
+
+class FeaturizerServerConfig(Config):
+    '''Configuration settings for a FeaturizerServer.
+
+    Attributes:
+        address: the address on which to listen. Can be a path to a Unix
+            socket, e.g., "/tmp/eta.sock", or a "host:port" string, e.g.,
+            "localhost:6451". The default is `DEFAULT_ADDRESS`, a Unix socket
+            in "~/.eta". Unix sockets are only accessible to the current user
+        authkey: the secret key that clients must provide. By default, a
+            random key is generated and written to `authkey_path`
+        authkey_path: the path to which to write the generated key when no
+            `authkey` is provided. The file is only readable by the current
+            user. The default is `DEFAULT_AUTHKEY_PATH`
+        featurizer_types: the fully-qualified class names of the Featurizers
+            that clients may request. The default is
+            `DEFAULT_FEATURIZER_TYPES`
+        max_batch_size: the maximum number of inputs to featurize at once.
+            The default is 32
+        max_batch_delay: the maximum time, in seconds, to wait for additional
+            requests to arrive before featurizing a partial batch. The default
+            is 0.01
+    '''
+
+    def __init__(self, d):
+        self.address = self.parse_string(
+            d, "address", default=DEFAULT_ADDRESS)
+        self.authkey = self.parse_string(d, "authkey", default=None)
+        self.authkey_path = self.parse_string(
+            d, "authkey_path", default=DEFAULT_AUTHKEY_PATH)
+        self.featurizer_types = self.parse_array(
+            d, "featurizer_types", default=DEFAULT_FEATURIZER_TYPES)
+        self.max_batch_size = int(self.parse_number(
+            d, "max_batch_size", default=32))
+        self.max_batch_delay = self.parse_number(
+            d, "max_batch_delay", default=0.01)
+
+
+class FeaturizerServer(Configurable):
+    '''A long-lived server that featurizes data on behalf of RemoteFeaturizer
+    clients.
+
+    The server builds one Featurizer for each distinct FeaturizerConfig that
+    it is asked to use and keeps it started until the server is closed.
+    Requests from all clients for the same Featurizer are gathered into
+    batches of up to `max_batch_size` inputs and processed via
+    `Featurizer.featurize_batch()`.
+
+    Example usage:
+    ```
+    with FeaturizerServer(FeaturizerServerConfig.default()) as server:
+        server.serve_forever()
+    ```
+    '''
+
+    def __init__(self, config):
+        '''Creates a FeaturizerServer instance.
+
+        Args:
+            config: a FeaturizerServerConfig instance
+        '''
+        self.validate(config)
+        self.config = config
+
+        self._listener = None
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def serve_forever(self):
+        '''Accepts and serves client connections until the server is closed
+        or interrupted.
+        '''
+        authkey = self.config.authkey
+        if not authkey:
+            authkey = _generate_authkey(self.config.authkey_path)
+            logger.info(
+                "Wrote server authkey to '%s'", self.config.authkey_path)
+
+        self._listener = _make_listener(
+            _parse_address(self.config.address), _to_bytes(authkey))
+        logger.info("Featurizer server listening on %s", self.config.address)
+
+        try:
+            while True:
+                listener = self._listener
+                if listener is None:
+                    break  # the server was closed
+
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, IOError) as e:
+                    if self._listener is None:
+                        break  # the server was closed
+
+                    logger.warning("Failed to accept connection: %s", e)
+                    continue
+
+                t = threading.Thread(target=self._serve_client, args=(conn,))
+                t.daemon = True
+                t.start()
+        except KeyboardInterrupt:
+            logger.info("Featurizer server interrupted")
+
+    def close(self):
+        '''Closes the server and stops all of its Featurizers.'''
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+        with self._lock:
+            for worker in itervalues(self._workers):
+                worker.close()
+            self._workers = {}
+
+    def _serve_client(self, conn):
+        logger.debug("Client connected")
+        try:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    break
+
+                try:
+                    conn.send(("ok", self._handle(*request)))
+                except Exception as e:
+                    logger.error("Featurizer server request failed: %s", e)
+                    conn.send(("error", str(e)))
+        finally:
+            conn.close()
+            logger.debug("Client disconnected")
+
+    def _handle(self, command, featurizer_dict, data=None):
+        worker = self._get_worker(featurizer_dict)
+        if command == "dim":
+            return worker.featurizer.dim()
+        if command == "featurize":
+            return worker.featurize(data)
+
+        raise FeaturizerServerError("Unknown command '%s'" % command)
+
+    def _get_worker(self, featurizer_dict):
+        # Check the type before the config is parsed, since parsing it imports
+        # the Featurizer's module
+        featurizer_type = featurizer_dict.get("type")
+        if featurizer_type not in self.config.featurizer_types:
+            raise FeaturizerServerError(
+                "Featurizer type '%s' is not allowed by this server" %
+                featurizer_type)
+
+        key = etas.json_to_str(featurizer_dict, pretty_print=False)
+        with self._lock:
+            if key not in self._workers:
+                logger.info(
+                    "Building featurizer %s", featurizer_dict.get("type"))
+                featurizer = FeaturizerConfig.from_dict(
+                    featurizer_dict).build()
+                self._workers[key] = _FeaturizerWorker(
+                    featurizer, self.config.max_batch_size,
+                    self.config.max_batch_delay)
+
+            return self._workers[key]
+
+
+class FeaturizerServerError(Exception):
+    '''Exception raised when a FeaturizerServer request fails.'''
+    pass
+
+
+class RemoteFeaturizerConfig(Config):
+    '''Configuration settings for a RemoteFeaturizer.
+
+    Attributes:
+        featurizer: the FeaturizerConfig of the Featurizer that the server
+            should use
+        address: the address of the FeaturizerServer. The default is
+            `DEFAULT_ADDRESS`
+        authkey: the secret key of the server. By default, the key is read
+            from `authkey_path`
+        authkey_path: the path to the key file written by the server when
+            `authkey` is not provided. The default is `DEFAULT_AUTHKEY_PATH`
+    '''
+
+    def __init__(self, d):
+        self.featurizer = self.parse_object(d, "featurizer", FeaturizerConfig)
+        self.address = self.parse_string(
+            d, "address", default=DEFAULT_ADDRESS)
+        self.authkey = self.parse_string(d, "authkey", default=None)
+        self.authkey_path = self.parse_string(
+            d, "authkey_path", default=DEFAULT_AUTHKEY_PATH)
+
+
+class RemoteFeaturizer(Featurizer):
+    '''Featurizer that sends its data to a FeaturizerServer, which featurizes
+    it using the Featurizer specified by the `featurizer` config field.
+
+    The connection to the server is opened by `start()` and closed by
+    `stop()`, so, as with any other Featurizer, users should call `start()`
+    manually (or use the `with` syntax) when featurizing many inputs.
+    '''
+
+    def __init__(self, config):
+        '''Creates a RemoteFeaturizer instance.
+
+        Args:
+            config: a RemoteFeaturizerConfig instance
+        '''
+        super(RemoteFeaturizer, self).__init__()
+        self.validate(config)
+        self.config = config
+
+        self._featurizer_dict = config.featurizer.serialize()
+        self._conn = None
+        self._dim = None
+
+    def dim(self):
+        '''Returns the dimension of the features extracted by the remote
+        Featurizer.
+        '''
+        if self._dim is None:
+            if self._conn is None:
+                with self:
+                    self._dim = self._request("dim")
+            else:
+                self._dim = self._request("dim")
+
+        return self._dim
+
+    def _start(self):
+        authkey = self.config.authkey
+        if not authkey:
+            try:
+                with open(self.config.authkey_path, "rt") as f:
+                    authkey = f.read().strip()
+            except IOError:
+                raise FeaturizerServerError(
+                    "No authkey was provided and no key file was found at "
+                    "'%s'" % self.config.authkey_path)
+
+        self._conn = Client(
+            _parse_address(self.config.address), authkey=_to_bytes(authkey))
+
+    def _stop(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _featurize(self, data):
+        return self._request("featurize", [data])[0]
+
+    def _featurize_batch(self, data):
+        return self._request("featurize", list(data))
+
+    def _request(self, command, data=None):
+        self._conn.send((command, self._featurizer_dict, data))
+        status, result = self._conn.recv()
+        if status != "ok":
+            raise FeaturizerServerError(result)
+
+        return result
+
+
+class _FeaturizerWorker(object):
+    '''Owns a started Featurizer and featurizes batches of requests for it in
+    a background thread.
+    '''
+
+    def __init__(self, featurizer, max_batch_size, max_batch_delay):
+        self.featurizer = featurizer
+        self.featurizer.start(keep_alive=True)
+
+        self._max_batch_size = max_batch_size
+        self._max_batch_delay = max_batch_delay
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def featurize(self, data):
+        request = _Request(data)
+        self._queue.put(request)
+        return request.wait()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self.featurizer.stop()
+
+    def _run(self):
+        while True:
+            requests = self._next_batch()
+            if requests is None:
+                return
+
+            data = []
+            for request in requests:
+                data.extend(request.data)
+
+            try:
+                fvs = self.featurizer.featurize_batch(data)
+            except Exception as e:
+                for request in requests:
+                    request.fail(e)
+                continue
+
+            idx = 0
+            for request in requests:
+                request.complete(fvs[idx:idx + len(request.data)])
+                idx += len(request.data)
+
+    def _next_batch(self):
+        request = self._queue.get()
+        if request is None:
+            return None
+
+        requests = [request]
+        count = len(request.data)
+        deadline = time.time() + self._max_batch_delay
+        while count < self._max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if request is None:
+                # Process the current batch before shutting down
+                self._queue.put(None)
+                break
+
+            requests.append(request)
+            count += len(request.data)
+
+        return requests
+
+
+class _Request(object):
+    '''A pending featurization request.'''
+
+    def __init__(self, data):
+        self.data = data
+        self._event = threading.Event()
+        self._result = None
+        self._error = None
+
+    def complete(self, result):
+        self._result = result
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise FeaturizerServerError(str(self._error))
+
+        return self._result
+
+
+def _parse_address(address):
+    '''Parses an address string into the format expected by
+    `multiprocessing.connection`.
+
+    "host:port" strings are converted to (host, port) tuples; all other
+    strings are treated as Unix socket paths.
+    '''
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+
+    return address
+
+
+def _make_listener(address, authkey):
+    '''Creates a Listener on the given address.
+
+    For Unix sockets, the parent directory is created, if necessary, with
+    permissions that only allow the current user to access it, and the socket
+    itself is only accessible to the current user. A stale socket left behind
+    by a server that exited uncleanly is removed first.
+    '''
+    if isinstance(address, tuple):
+        return Listener(address, authkey=authkey)
+
+    dirname = os.path.dirname(address)
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname, 0o700)
+
+    _remove_stale_socket(address)
+    listener = Listener(address, authkey=authkey)
+    os.chmod(address, 0o600)
+    return listener
+
+
+def _remove_stale_socket(path):
+    '''Removes the Unix socket at the given path, if no server is listening
+    on it.
+
+    Raises:
+        FeaturizerServerError: if a server is listening on the socket, or if
+            the path exists but is not a socket
+    '''
+    try:
+        mode = os.stat(path).st_mode
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+
+    if not stat.S_ISSOCK(mode):
+        raise FeaturizerServerError("'%s' is not a Unix socket" % path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        if e.errno not in (errno.ECONNREFUSED, errno.ENOENT):
+            raise
+
+        logger.info("Removing stale socket '%s'", path)
+        os.remove(path)
+        return
+    finally:
+        sock.close()
+
+    raise FeaturizerServerError(
+        "Another server is already listening on '%s'" % path)
+
+
+def _generate_authkey(path):
+    '''Generates a random authkey and writes it to the given path, which is
+    only readable by the current user.
+    '''
+    authkey = binascii.hexlify(os.urandom(32)).decode("ascii")
+    etau.ensure_basedir(path)
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wt") as f:
+        f.write(authkey)
+
+    return authkey
+
+
+def _to_bytes(s):
+    return s.encode("utf-8")
@@ -25,6 +25,7 @@ from builtins import *
 # pragma pylint: enable=wildcard-import
 
 import errno
+from multiprocessing.pool import ThreadPool
 import os
 from subprocess import Popen, PIPE
 
@@ -245,6 +246,100 @@ def to_double(img):
     return img.astype(np.float) / np.iinfo(img.dtype).max
 
 
+class ImageBatchPreprocessor(object):
+    '''Preprocesses batches of images into a float32 tensor of size
+    [XXXX, height, width, 3] that can be fed directly to a network.
+
+    Grayscale images are broadcast to three channels, alpha channels are
+    dropped, images are resized (if necessary) in a thread pool, and the
+    optional mean is subtracted in a single vectorized operation. All results
+    are written into a preallocated buffer that is reused across calls, so
+    the tensor returned by `preprocess()` is only valid until the next call.
+
+    Example usage:
+    ```
+    with ImageBatchPreprocessor(224, 224) as preprocessor:
+        for imgs in batches:
+            tensor = preprocessor.preprocess(imgs)
+            ...
+    ```
+    '''
+
+    def __init__(self, width, height, mean=None, num_threads=None):
+        '''Creates an ImageBatchPreprocessor instance.
+
+        Args:
+            width: the output width of the images
+            height: the output height of the images
+            mean: an optional per-channel mean to subtract from the images
+            num_threads: the number of threads to use to resize images. By
+                default, `eta.core.utils.get_cpu_count()` is used
+        '''
+        self.width = width
+        self.height = height
+        self.mean = (
+            np.asarray(mean, dtype=np.float32) if mean is not None else None)
+        self.num_threads = num_threads or etau.get_cpu_count()
+
+        self._buffer = np.empty((0, height, width, 3), dtype=np.float32)
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def preprocess(self, imgs):
+        '''Preprocesses the given batch of images.
+
+        Args:
+            imgs: a list of images, or an array of size
+                [XXXX, height, width, num_channels]
+
+        Returns:
+            a float32 array of size [len(imgs), height, width, 3]. The array
+                is a view into a buffer that is overwritten on the next call
+        '''
+        num_imgs = len(imgs)
+        if num_imgs > len(self._buffer):
+            self._buffer = np.empty(
+                (num_imgs, self.height, self.width, 3), dtype=np.float32)
+
+        batch = self._buffer[:num_imgs]
+        if num_imgs > 1 and self.num_threads > 1:
+            if self._pool is None:
+                self._pool = ThreadPool(self.num_threads)
+            self._pool.map(
+                lambda i: self._preprocess_image(imgs[i], batch[i]),
+                range(num_imgs))
+        else:
+            for img, out in zip(imgs, batch):
+                self._preprocess_image(img, out)
+
+        if self.mean is not None:
+            batch -= self.mean
+
+        return batch
+
+    def close(self):
+        '''Shuts down the thread pool used by this instance, if necessary.'''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _preprocess_image(self, img, out):
+        if img.shape[0] != self.height or img.shape[1] != self.width:
+            # OpenCV releases the GIL while resizing
+            img = resize(img, self.width, self.height)
+
+        if is_gray(img):
+            out[...] = img[:, :, np.newaxis]
+        else:
+            out[...] = img[:, :, :3]
+
+
 class Convert(object):
     '''Interface for the ImageMagick convert binary.'''
 
@@ -0,0 +1,461 @@
+'''
+Core tools for approximate nearest neighbor search over feature vectors.
+
+This module provides a VectorIndex that implements an inverted file (IVF)
+index with k-means coarse quantization and optional product quantization
+(PQ) of the residual vectors, entirely in numpy.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import logging
+import time
+
+import numpy as np
+
+from eta.core.config import Config, Configurable
+import eta.core.features as etaf
+import eta.core.numutils as etan
+import eta.core.serial as etas
+import eta.core.utils as etau
+
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndexConfig(Config):
+    '''Configuration settings for a VectorIndex.
+
+    Attributes:
+        num_lists: the number of inverted lists (i.e., k-means clusters) into
+            which the vectors are partitioned. The default is 256
+        num_probes: the number of inverted lists to search for each query.
+            The default is 8
+        use_pq: whether to store the vectors in the index compressed via
+            product quantization. The default is False
+        num_subvectors: the number of subvectors into which to split each
+            vector when `use_pq` is True. Must evenly divide the dimension of
+            the vectors. The default is 8
+        num_codewords: the number of codewords per subvector when `use_pq` is
+            True. The default is 256
+        num_train_iters: the number of k-means iterations to run when
+            training the index. The default is 20
+        max_train_size: the maximum number of vectors to use when training
+            the index via `VectorIndex.from_feature_store()`. The default is
+            100000
+    '''
+
+    def __init__(self, d):
+        self.num_lists = int(self.parse_number(d, "num_lists", default=256))
+        self.num_probes = int(self.parse_number(d, "num_probes", default=8))
+        self.use_pq = self.parse_bool(d, "use_pq", default=False)
+        self.num_subvectors = int(self.parse_number(
+            d, "num_subvectors", default=8))
+        self.num_codewords = int(self.parse_number(
+            d, "num_codewords", default=256))
+        self.num_train_iters = int(self.parse_number(
+            d, "num_train_iters", default=20))
+        self.max_train_size = int(self.parse_number(
+            d, "max_train_size", default=100000))
+
+
+class VectorIndex(Configurable):
+    '''An inverted file (IVF) index for approximate nearest neighbor search
+    of feature vectors under Euclidean distance.
+
+    The index must be trained on a representative sample of vectors via
+    `train()` before vectors can be added via `add()`. Vectors can be added
+    incrementally at any time thereafter. Queries are answered by searching
+    only the `num_probes` inverted lists whose centroids are closest to the
+    query.
+
+    Example usage:
+    ```
+    index = VectorIndex.from_feature_store(backing_path)
+    dists, frame_numbers = index.search(queries, k=10)
+    index.save("/path/to/index.npz")
+    ```
+    '''
+
+    def __init__(self, config=None):
+        '''Creates a VectorIndex instance.
+
+        Args:
+            config: an optional VectorIndexConfig instance. If omitted, the
+                default configuration is used
+        '''
+        self.config = config or VectorIndexConfig.default()
+        self.validate(self.config)
+
+        self.centroids = None
+        self.pq = None
+        self._list_ids = None
+        self._list_data = None
+        self._next_id = 0
+
+    def __len__(self):
+        if not self.is_trained:
+            return 0
+
+        return sum(
+            sum(len(chunk) for chunk in chunks) for chunks in self._list_ids)
+
+    @property
+    def is_trained(self):
+        '''Whether the index has been trained.'''
+        return self.centroids is not None
+
+    def train(self, X, seed=None):
+        '''Trains the coarse quantizer (and product quantizer, if
+        applicable) of the index. Any vectors in the index are discarded.
+
+        Args:
+            X: an n x d array of training vectors
+            seed: an optional random seed
+        '''
+        X = np.asarray(X, dtype=np.float32)
+        logger.info(
+            "Training index with %d lists on %d vectors",
+            self.config.num_lists, len(X))
+
+        self.centroids, assignments = etan.kmeans(
+            X, self.config.num_lists, num_iters=self.config.num_train_iters,
+            seed=seed)
+
+        if self.config.use_pq:
+            self.pq = etan.ProductQuantizer(
+                num_subvectors=self.config.num_subvectors,
+                num_codewords=self.config.num_codewords)
+            self.pq.train(
+                X - self.centroids[assignments],
+                num_iters=self.config.num_train_iters, seed=seed)
+
+        num_lists = len(self.centroids)
+        self._list_ids = [[] for _ in range(num_lists)]
+        self._list_data = [[] for _ in range(num_lists)]
+        self._next_id = 0
+
+    def add(self, X, ids=None):
+        '''Adds vectors to the index.
+
+        Args:
+            X: an n x d array of vectors
+            ids: an optional array of n integer IDs for the vectors. By
+                default, consecutive IDs are assigned, starting after the
+                largest ID that was previously assigned automatically
+
+        Raises:
+            VectorIndexError: if the index has not been trained
+        '''
+        if not self.is_trained:
+            raise VectorIndexError("Index must be trained before adding")
+
+        X = np.asarray(X, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + len(X))
+            self._next_id += len(X)
+        else:
+            ids = np.asarray(ids, dtype=np.int64)
+
+        assignments = etan.assign_clusters(X, self.centroids)
+        if self.pq is not None:
+            data = self.pq.encode(X - self.centroids[assignments])
+        else:
+            data = X
+
+        for c in np.unique(assignments):
+            mask = assignments == c
+            self._list_ids[c].append(ids[mask])
+            self._list_data[c].append(data[mask])
+
+    def search(self, Q, k=10, num_probes=None):
+        '''Finds the (approximate) k nearest neighbors of the given queries.
+
+        Args:
+            Q: an m x d array of queries, or a single query vector
+            k: the number of neighbors to return. The default is 10
+            num_probes: an optional number of inverted lists to search for
+                each query. By default, `num_probes` from the config is used
+
+        Returns:
+            dists: an m x k array of squared distances to the neighbors of
+                each query, sorted in ascending order. If fewer than k
+                neighbors were found, the remaining entries are inf
+            ids: an m x k array of the IDs of the neighbors. If fewer than k
+                neighbors were found, the remaining entries are -1
+
+        Raises:
+            VectorIndexError: if the index has not been trained
+        '''
+        if not self.is_trained:
+            raise VectorIndexError("Index must be trained before searching")
+
+        Q = np.atleast_2d(np.asarray(Q, dtype=np.float32))
+        num_probes = min(
+            num_probes or self.config.num_probes, len(self.centroids))
+
+        coarse_dists = etan.squared_distances(Q, self.centroids)
+        probes = np.argpartition(
+            coarse_dists, num_probes - 1, axis=1)[:, :num_probes]
+
+        all_dists = np.full((len(Q), k), np.inf, dtype=np.float32)
+        all_ids = np.full((len(Q), k), -1, dtype=np.int64)
+        for i, q in enumerate(Q):
+            cand_dists = []
+            cand_ids = []
+            for c in probes[i]:
+                ids, data = self._get_list(c)
+                if not len(ids):
+                    continue
+
+                if self.pq is not None:
+                    dists = self.pq.compute_distances(
+                        q - self.centroids[c], data)
+                else:
+                    dists = etan.squared_distances(q[np.newaxis], data)[0]
+
+                cand_dists.append(dists)
+                cand_ids.append(ids)
+
+            if not cand_dists:
+                continue
+
+            dists, ids = _top_k(
+                np.concatenate(cand_dists), np.concatenate(cand_ids), k)
+            all_dists[i, :len(dists)] = dists
+            all_ids[i, :len(ids)] = ids
+
+        return all_dists, all_ids
+
+    def save(self, path):
+        '''Saves the index to disk.
+
+        Args:
+            path: the output .npz path
+        '''
+        if not self.is_trained:
+            raise VectorIndexError("Only trained indexes can be saved")
+
+        lists = [self._get_list(c) for c in range(len(self.centroids))]
+        nonempty = [(ids, data) for ids, data in lists if data is not None]
+        if not nonempty:
+            raise VectorIndexError("Empty indexes cannot be saved")
+
+        # One range per centroid; empty lists are zero-length ranges
+        offsets = np.cumsum([0] + [len(ids) for ids, _ in lists])
+        d = {
+            "config": etas.json_to_str(self.config),
+            "centroids": self.centroids,
+            "offsets": offsets,
+            "next_id": self._next_id,
+            "ids": np.concatenate([ids for ids, _ in nonempty]),
+            "data": np.concatenate([data for _, data in nonempty]),
+        }
+        if self.pq is not None:
+            d["codebooks"] = self.pq.codebooks
+
+        etau.ensure_basedir(path)
+        np.savez(path, **d)
+
+    @classmethod
+    def load(cls, path):
+        '''Loads a VectorIndex from disk.
+
+        Args:
+            path: the path to a .npz file written by `save()`
+
+        Returns:
+            a VectorIndex instance
+
+        Raises:
+            VectorIndexError: if the file does not contain one list range per
+                centroid
+        '''
+        d = np.load(path)
+        config = VectorIndexConfig.from_dict(etas.load_json(str(d["config"])))
+        index = cls(config)
+        index.centroids = d["centroids"]
+        if "codebooks" in d.files:
+            index.pq = etan.ProductQuantizer.from_codebooks(d["codebooks"])
+
+        offsets = d["offsets"]
+        ids = d["ids"]
+        data = d["data"]
+        num_lists = len(index.centroids)
+        if len(offsets) != num_lists + 1:
+            raise VectorIndexError(
+                "Expected %d list offsets but found %d" % (
+                    num_lists + 1, len(offsets)))
+
+        index._list_ids = [[] for _ in range(num_lists)]
+        index._list_data = [[] for _ in range(num_lists)]
+        for c in range(num_lists):
+            start, end = offsets[c], offsets[c + 1]
+            if end > start:
+                index._list_ids[c].append(ids[start:end])
+                index._list_data[c].append(data[start:end])
+        index._next_id = int(d["next_id"])
+        return index
+
+    @classmethod
+    def from_feature_store(
+            cls, backing_path, config=None, layer=None, codec=None,
+            batch_size=1024, seed=None):
+        '''Builds a VectorIndex from the features in a VideoFramesFeaturizer
+        backing directory. The IDs of the vectors are their frame numbers.
+
+        The index is trained on (at most) the first `max_train_size` vectors
+        in the store, and then all vectors are added in chunks.
+
+        Args:
+            backing_path: the backing directory
+            config: an optional VectorIndexConfig instance
+            layer: the name of the feature set to index when the backing
+                store contains multiple feature sets per frame
+            codec: the FeatureCodec with which the features were encoded, if
+                any
+            batch_size: the number of features to load at once. The default
+                is 1024
+            seed: an optional random seed for training
+
+        Returns:
+            a VectorIndex instance
+        '''
+        index = cls(config)
+
+        X_train = []
+        num_train = 0
+        for _, X in etaf.iter_featurized_frames(
+                backing_path, batch_size=batch_size, layer=layer,
+                codec=codec):
+            X_train.append(X)
+            num_train += len(X)
+            if num_train >= index.config.max_train_size:
+                break
+
+        if not X_train:
+            raise VectorIndexError(
+                "No features found in '%s'" % backing_path)
+
+        X_train = np.concatenate(X_train)[:index.config.max_train_size]
+        index.train(X_train, seed=seed)
+
+        for frame_numbers, X in etaf.iter_featurized_frames(
+                backing_path, batch_size=batch_size, layer=layer,
+                codec=codec):
+            index.add(X, ids=frame_numbers)
+
+        return index
+
+    def _get_list(self, c):
+        '''Returns the (ids, data) arrays of the given inverted list,
+        merging any chunks that were added separately.
+        '''
+        if len(self._list_ids[c]) > 1:
+            self._list_ids[c] = [np.concatenate(self._list_ids[c])]
+            self._list_data[c] = [np.concatenate(self._list_data[c])]
+
+        if not self._list_ids[c]:
+            return [], None
+
+        return self._list_ids[c][0], self._list_data[c][0]
+
+
+class VectorIndexError(Exception):
+    '''Exception raised when an invalid VectorIndex operation is
+    performed.
+    '''
+    pass
+
+
+def brute_force_search(X, Q, k=10, ids=None, batch_size=1024):
+    '''Finds the exact k nearest neighbors of the given queries.
+
+    Args:
+        X: an n x d array of vectors to search
+        Q: an m x d array of queries
+        k: the number of neighbors to return. The default is 10
+        ids: an optional array of n IDs for the vectors. By default, the row
+            indices of X are used
+        batch_size: the number of queries to process at once. The default is
+            1024
+
+    Returns:
+        dists: an m x k array of squared distances to the neighbors
+        ids: an m x k array of the IDs of the neighbors
+    '''
+    X = np.asarray(X, dtype=np.float32)
+    Q = np.atleast_2d(np.asarray(Q, dtype=np.float32))
+    ids = np.arange(len(X)) if ids is None else np.asarray(ids)
+    k = min(k, len(X))
+
+    all_dists = np.empty((len(Q), k), dtype=np.float32)
+    all_ids = np.empty((len(Q), k), dtype=ids.dtype)
+    for start in range(0, len(Q), batch_size):
+        dists = etan.squared_distances(Q[start:start + batch_size], X)
+        for i, qdists in enumerate(dists):
+            all_dists[start + i], all_ids[start + i] = _top_k(qdists, ids, k)
+
+    return all_dists, all_ids
+
+
+def benchmark_index(index, X, Q, k=10, ids=None):
+    '''Compares the recall and latency of a VectorIndex to brute force
+    search.
+
+    Args:
+        index: a VectorIndex containing the vectors X
+        X: an n x d array of the vectors in the index
+        Q: an m x d array of queries
+        k: the number of neighbors to retrieve. The default is 10
+        ids: the IDs of the vectors in the index. By default, the row
+            indices of X are used
+
+    Returns:
+        a dictionary containing the "recall" of the index (i.e., the
+            fraction of the true k nearest neighbors that were found), and
+            the "index_latency" and "brute_force_latency" per query, in
+            seconds
+    '''
+    Q = np.atleast_2d(Q)
+
+    start_time = time.time()
+    _, true_ids = brute_force_search(X, Q, k=k, ids=ids)
+    brute_force_latency = (time.time() - start_time) / len(Q)
+
+    start_time = time.time()
+    _, found_ids = index.search(Q, k=k)
+    index_latency = (time.time() - start_time) / len(Q)
+
+    num_found = sum(
+        len(np.intersect1d(t, f)) for t, f in zip(true_ids, found_ids))
+    return {
+        "recall": num_found / float(true_ids.size),
+        "index_latency": index_latency,
+        "brute_force_latency": brute_force_latency,
+    }
+
+
+def _top_k(dists, ids, k):
+    '''Returns the k smallest distances and their IDs, in ascending order.'''
+    if len(dists) > k:
+        inds = np.argpartition(dists, k - 1)[:k]
+        dists = dists[inds]
+        ids = ids[inds]
+
+    order = np.argsort(dists)
+    return dists[order], ids[order]
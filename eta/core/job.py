@@ -18,33 +18,67 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+import errno
+import hashlib
+import json
 import logging
+import multiprocessing
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
+import traceback
 
+import six
+
+if six.PY2:
+    import imp
+else:
+    from importlib.util import module_from_spec, spec_from_file_location
+
+import eta
+import eta.constants as etac
 from eta.core.config import Config
 import eta.core.log as etal
+import eta.core.serial as etas
 import eta.core.utils as etau
 
 
 logger = logging.getLogger(__name__)
 
 
-def run(job_config, pipeline_status, overwrite=True):
+def run(
+        job_config, pipeline_status, overwrite=True, zygote=None,
+        job_cache=None, hasher_cls=None):
     '''Run the job specified by the JobConfig.
 
     If the job completes succesfully, the hash of the config file is written to
     disk.
 
+    If a JobCache is provided and the job declares its outputs, the job is
+    skipped and its outputs are restored from the cache whenever its config
+    and inputs match a previous successful run, and the job is always run
+    otherwise.
+
     Args:
         job_config: a JobConfig instance
         pipeline_status: a PipelineStatus instance
         overwrite: overwrite mode. When True, always run the job. When False,
             only run the job if the config file has changed since the last time
             the job was (succesfully) run
+        zygote: an optional running JobZygote to use to run the job if it is
+            an in-process job. In-process jobs are run as subprocesses when
+            no zygote is provided
+        job_cache: an optional JobCache to use to reuse the outputs of
+            previous runs of the job
+        hasher_cls: the `eta.core.utils.FileHasher` subclass to use to detect
+            changes to the config file. By default, `MD5FileHasher` is used
 
     Returns:
-        True/False: if the job was actually run
+        True/False: if the job was actually run or its outputs were restored
+            from the cache
         True/False: if execution terminated succesfully
 
     Raises:
@@ -52,47 +86,74 @@ def run(job_config, pipeline_status, overwrite=True):
     '''
     job_status = pipeline_status.add_job(job_config.name)
 
-    with etau.WorkingDir(job_config.working_dir):
-        # Check config hash
-        hasher = etau.MD5FileHasher(job_config.config_path)
-        if hasher.has_changed:
-            logger.info("Config %s changed", job_config.config_path)
-            should_run = True
-        elif hasher.has_record:
-            if overwrite:
-                logger.info("Overwriting existing job output")
-                should_run = True
-            else:
-                logger.info("Skipping job %s", job_config.name)
-                should_run = False
-        else:
-            should_run = True
+    # Jobs may run concurrently, so we resolve paths relative to the job's
+    # working directory rather than changing the process working directory
+    working_dir = os.path.abspath(job_config.working_dir or os.getcwd())
+    config_path = os.path.join(working_dir, job_config.config_path)
 
-        if should_run:
-            logger.info("Working directory: %s", os.getcwd())
-
-            # Run job
-            logger.info("Starting job %s", job_config.name)
-            job_status.start()
-            success = _run(job_config)
-            if not success:
-                # Job failed
-                logger.error("Job %s failed... exiting now", job_config.name)
-                job_status.fail()
-                return should_run, False
-
-            # Job complete!
-            logger.info("Job %s complete", job_config.name)
+    hasher = (hasher_cls or etau.MD5FileHasher)(config_path)
+
+    # Check job cache
+    cache_key = None
+    if job_cache is not None and job_config.outputs:
+        cache_key = job_cache.get_key(job_config, working_dir)
+        if job_cache.has(cache_key):
+            logger.info("Restoring cached outputs of job %s", job_config.name)
+            job_cache.restore(cache_key, job_config, working_dir)
             hasher.write()  # write config hash
-            job_status.complete()
+            job_status.skip("Job outputs restored from cache")
+            return True, True
+
+    # Check config hash
+    if hasher.has_changed:
+        logger.info("Config %s changed", job_config.config_path)
+        should_run = True
+    elif cache_key is not None:
+        logger.info("No cached outputs found for job %s", job_config.name)
+        should_run = True
+    elif hasher.has_record:
+        if overwrite:
+            logger.info("Overwriting existing job output")
+            should_run = True
         else:
-            # Skip job
-            job_status.skip()
+            logger.info("Skipping job %s", job_config.name)
+            should_run = False
+    else:
+        should_run = True
 
-        return should_run, True
+    if should_run:
+        logger.info("Working directory: %s", working_dir)
+
+        # Run job
+        logger.info("Starting job %s", job_config.name)
+        job_status.start()
+        success = _run(job_config, working_dir, zygote=zygote)
+        if not success:
+            # Job failed
+            logger.error("Job %s failed... exiting now", job_config.name)
+            job_status.fail()
+            return should_run, False
+
+        # Job complete!
+        logger.info("Job %s complete", job_config.name)
+        hasher.write()  # write config hash
+        if cache_key is not None:
+            job_cache.store(cache_key, job_config, working_dir)
+        job_status.complete()
+    else:
+        # Skip job
+        job_status.skip()
 
+    return should_run, True
+
+
+def _run(job_config, working_dir, zygote=None):
+    # In-process jobs are only forked from the zygote, which is single
+    # threaded; forking the current process could deadlock the child on locks
+    # held by other job threads
+    if job_config.in_process and job_config.script and zygote is not None:
+        return zygote.run(job_config, working_dir)
 
-def _run(job_config):
     # Construct command
     if job_config.binary:
         args = [job_config.binary]      # binary
@@ -114,11 +175,469 @@ def _run(job_config):
 
     # Run command
     etal.flush()  # must flush because subprocess will append to same logfile
-    success = etau.call(args)
+    success = etau.call(args, cwd=working_dir)
 
     return success
 
 
+def _run_module(job_config, working_dir):
+    # Runs in the forked child; returns the exit code of the job
+    code = 1
+    try:
+        os.chdir(working_dir)
+        script = os.path.abspath(job_config.script)
+        sys.path.insert(0, os.path.dirname(script))
+        sys.argv = [script, job_config.config_path]
+        if job_config.pipeline_config_path:
+            sys.argv.append(job_config.pipeline_config_path)
+
+        module = _load_module(script)
+        module.run(job_config.config_path, job_config.pipeline_config_path)
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        etal.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    return code
+
+
+def _load_module(script):
+    name = "_eta_job_" + os.path.splitext(os.path.basename(script))[0]
+    if six.PY2:
+        return imp.load_source(name, script)
+
+    spec = spec_from_file_location(name, script)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class JobCache(object):
+    '''A content-addressed cache of job outputs.
+
+    Jobs are keyed by their executable, their module config, fingerprints of
+    their input files, and the version and source code of ETA itself, so
+    entries are invalidated when ETA is upgraded or edited. The paths of the
+    inputs and outputs of the job are removed from the module config before
+    it is hashed, so the outputs of a job can be reused by another pipeline
+    run that writes its outputs to a different directory.
+
+    By default, inputs are fingerprinted by their sizes and modification
+    times. Outputs are copied into and out of the cache with their
+    modification times preserved, so the fingerprints of the outputs of a
+    restored job match those of the cached run and the jobs downstream of a
+    restored job can be restored, too. Live outputs never share storage with
+    cache entries, so rewriting an output in place cannot corrupt the cache.
+
+    Each entry is a subdirectory of the cache directory named by its key that
+    contains the outputs of the job.
+    '''
+
+    def __init__(self, cache_dir=None, full_hash=False, hasher_cls=None):
+        '''Creates a JobCache instance.
+
+        Args:
+            cache_dir: the cache directory. By default, the "jobs" directory of
+                `eta.config.cache_dir` (or the system temporary directory) is
+                used
+            full_hash: whether to fingerprint inputs by hashing their contents
+                rather than by their sizes and modification times. By default,
+                this is False
+            hasher_cls: the `eta.core.utils.FileHasher` subclass to use when
+                `full_hash` is True. Hashes are cached in sidecar files in
+                `eta.config.cache_dir`, so unchanged inputs are not rehashed.
+                By default, `MD5FileHasher` is used
+        '''
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                eta.config.cache_dir or tempfile.gettempdir(), "jobs")
+        self.cache_dir = cache_dir
+        self.full_hash = full_hash
+        self.hasher_cls = hasher_cls or etau.MD5FileHasher
+
+    def get_key(self, job_config, working_dir):
+        '''Computes the cache key of the given job.
+
+        Args:
+            job_config: a JobConfig instance
+            working_dir: the working directory of the job
+
+        Returns:
+            the cache key
+        '''
+        replacements = {}
+        for path in job_config.inputs:
+            fingerprint = self._fingerprint(os.path.join(working_dir, path))
+            replacements[path] = "<input:%s>" % fingerprint
+        for idx, path in enumerate(job_config.outputs):
+            replacements[path] = "<output:%d>" % idx
+
+        config = etas.read_json(
+            os.path.join(working_dir, job_config.config_path))
+        exe = job_config.binary or job_config.script or job_config.custom
+        if job_config.script:
+            exe_fingerprint = self._fingerprint(
+                os.path.join(working_dir, job_config.script))
+        else:
+            exe_fingerprint = None
+
+        s = json.dumps(
+            [etac.VERSION, _get_eta_fingerprint(), exe, exe_fingerprint,
+             _replace_strings(config, replacements)],
+            sort_keys=True)
+        return hashlib.md5(s.encode("utf-8")).hexdigest()
+
+    def get_entry_dir(self, key):
+        '''Returns the directory of the cache entry with the given key.'''
+        return os.path.join(self.cache_dir, key)
+
+    def has(self, key):
+        '''Returns True/False whether the cache has an entry with the given
+        key.
+        '''
+        return os.path.isdir(self.get_entry_dir(key))
+
+    def store(self, key, job_config, working_dir):
+        '''Stores the outputs of the given job in the cache.
+
+        The entry is assembled in a temporary directory and then renamed into
+        place, so concurrent pipelines never see partial entries.
+
+        Args:
+            key: the cache key of the job
+            job_config: a JobConfig instance
+            working_dir: the working directory of the job
+        '''
+        etau.ensure_dir(self.cache_dir)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            for idx, path in enumerate(job_config.outputs):
+                path = os.path.join(working_dir, path)
+                entry_path = os.path.join(tmp_dir, str(idx))
+                for relpath, filepath in _get_output_files(path):
+                    if relpath:
+                        _copy_file(filepath, os.path.join(entry_path, relpath))
+                    else:
+                        _copy_file(filepath, entry_path)
+
+            os.rename(tmp_dir, self.get_entry_dir(key))
+            logger.info("Stored job outputs in cache entry '%s'", key)
+        except OSError as e:
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            # Another run stored the same entry first
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+    def restore(self, key, job_config, working_dir):
+        '''Restores the outputs of the given job from the cache.
+
+        Any existing outputs are removed first, and the outputs are then
+        copied out of the cache entry.
+
+        Args:
+            key: the cache key of the job
+            job_config: a JobConfig instance
+            working_dir: the working directory of the job
+        '''
+        entry_dir = self.get_entry_dir(key)
+        for idx, path in enumerate(job_config.outputs):
+            path = os.path.join(working_dir, path)
+            output_dir = os.path.join(entry_dir, str(idx))
+            if os.path.isfile(output_dir):
+                _copy_file(output_dir, path)
+                continue
+
+            # Directory or sequence output
+            if "%" in path:
+                outdir = os.path.dirname(path)
+                for _, filepath in _get_output_files(path):
+                    os.remove(filepath)
+            else:
+                outdir = path
+                if os.path.isdir(outdir):
+                    shutil.rmtree(outdir)
+
+            for root, _, filenames in os.walk(output_dir):
+                for filename in filenames:
+                    filepath = os.path.join(root, filename)
+                    _copy_file(filepath, os.path.join(
+                        outdir, os.path.relpath(filepath, output_dir)))
+
+    def _fingerprint(self, path):
+        files = []
+        for relpath, filepath in _get_output_files(path):
+            if self.full_hash:
+                files.append((relpath, self.hasher_cls.hash(
+                    filepath, use_cache=True)))
+            else:
+                st = os.stat(filepath)
+                files.append((relpath, st.st_size, st.st_mtime))
+
+        return hashlib.md5(json.dumps(files).encode("utf-8")).hexdigest()
+
+
+def _replace_strings(obj, replacements):
+    if isinstance(obj, dict):
+        return {k: _replace_strings(v, replacements) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_replace_strings(v, replacements) for v in obj]
+    if isinstance(obj, str):
+        return replacements.get(obj, obj)
+    return obj
+
+
+def _get_output_files(path):
+    # Returns (relative path, path) tuples for the files that make up the
+    # given file, directory, or sequence path
+    if os.path.isfile(path):
+        return [("", path)]
+
+    if os.path.isdir(path):
+        files = []
+        for root, _, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                filepath = os.path.join(root, filename)
+                files.append((os.path.relpath(filepath, path), filepath))
+        return sorted(files)
+
+    if "%" in path:
+        filepaths = [path % idx for idx in etau.parse_pattern(path)]
+        return [(os.path.basename(f), f) for f in filepaths]
+
+    return []
+
+
+def _copy_file(filepath, outpath):
+    # Removes any existing file first so that the copy never writes through a
+    # hard link or symlink that shares storage with another file
+    etau.ensure_basedir(outpath)
+    if os.path.lexists(outpath):
+        os.remove(outpath)
+
+    shutil.copy2(filepath, outpath)
+
+
+_ETA_FINGERPRINT = None
+
+
+def _get_eta_fingerprint():
+    # Fingerprints the ETA source files by their sizes and modification times
+    global _ETA_FINGERPRINT
+    if _ETA_FINGERPRINT is None:
+        files = []
+        for relpath, filepath in _get_output_files(etac.ETA_DIR):
+            if filepath.endswith(".py"):
+                st = os.stat(filepath)
+                files.append((relpath, st.st_size, st.st_mtime))
+        _ETA_FINGERPRINT = hashlib.md5(
+            json.dumps(files).encode("utf-8")).hexdigest()
+
+    return _ETA_FINGERPRINT
+
+
+class JobZygote(object):
+    '''A warm process that pre-imports commonly used modules and then forks
+    a child to run each in-process job.
+
+    The zygote is forked from the calling process when it is started, so it
+    inherits the logging configuration of that process. Jobs can be submitted
+    concurrently from multiple threads.
+    '''
+
+    DEFAULT_PRELOAD_MODULES = ("eta", "cv2", "numpy")
+
+    def __init__(self, preload_modules=None):
+        '''Creates a JobZygote instance.
+
+        Args:
+            preload_modules: an optional list of names of modules to import
+                in the zygote before forking jobs. Modules that cannot be
+                imported are ignored. By default, DEFAULT_PRELOAD_MODULES is
+                used
+        '''
+        if preload_modules is None:
+            preload_modules = self.DEFAULT_PRELOAD_MODULES
+        self.preload_modules = list(preload_modules)
+
+        self._pid = None
+        self._conn = None
+        self._reader = None
+        self._next_id = 0
+        self._results = {}
+        self._alive = False
+        self._send_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def is_running(self):
+        '''Whether the zygote is running.'''
+        return self._alive
+
+    def start(self):
+        '''Starts the zygote.
+
+        This method should be called before the calling process starts any
+        threads, since only the forking thread survives in the zygote.
+        '''
+        if self._alive:
+            return
+
+        conn, child_conn = multiprocessing.Pipe()
+        etal.flush()  # must flush because the zygote shares our logfile
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            code = 1
+            try:
+                _serve_zygote(child_conn, self.preload_modules)
+                code = 0
+            finally:
+                os._exit(code)
+
+        child_conn.close()
+        self._pid = pid
+        self._conn = conn
+        self._alive = True
+        self._reader = threading.Thread(target=self._read_results)
+        self._reader.daemon = True
+        self._reader.start()
+        logger.info("Started job zygote (pid %d)", pid)
+
+    def run(self, job_config, working_dir):
+        '''Runs the given in-process job in a child of the zygote and waits
+        for it to finish.
+
+        Args:
+            job_config: a JobConfig instance
+            working_dir: the working directory in which to run the job
+
+        Returns:
+            True/False: if the job executed successfully
+        '''
+        with self._send_lock:
+            if not self._alive:
+                raise JobZygoteError("The zygote is not running")
+
+            job_id = self._next_id
+            self._next_id += 1
+            etal.flush()  # must flush because the job shares our logfile
+            self._conn.send((job_id, job_config, working_dir))
+
+        with self._cond:
+            while job_id not in self._results and self._alive:
+                self._cond.wait()
+
+            code = self._results.pop(job_id, None)
+
+        if code is None:
+            logger.error("Job zygote exited while running job %s",
+                         job_config.name)
+        return code == 0
+
+    def stop(self):
+        '''Stops the zygote after any running jobs have finished.'''
+        with self._send_lock:
+            if not self._alive:
+                return
+
+            try:
+                self._conn.send(None)
+            except EnvironmentError:
+                pass
+
+        self._reader.join()
+        os.waitpid(self._pid, 0)
+        self._conn.close()
+        self._pid = None
+        self._conn = None
+
+    def _read_results(self):
+        while True:
+            try:
+                job_id, code = self._conn.recv()
+            except (EOFError, EnvironmentError):
+                break
+
+            with self._cond:
+                self._results[job_id] = code
+                self._cond.notify_all()
+
+        with self._cond:
+            self._alive = False
+            self._cond.notify_all()
+
+
+def _serve_zygote(conn, preload_modules):
+    # Runs in the zygote; forks a child for each job request until a `None`
+    # request is received
+    for name in preload_modules:
+        try:
+            __import__(name)
+        except ImportError:
+            logger.debug("Job zygote failed to preload module '%s'", name)
+
+    children = {}
+    done = False
+    while not done or children:
+        # Reap any finished jobs
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                break
+
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+            conn.send((children.pop(pid), code))
+
+        if done:
+            if children:
+                time.sleep(0.05)
+            continue
+
+        # Wait for the next request, polling periodically to reap jobs
+        if not conn.poll(0.05 if children else None):
+            continue
+
+        try:
+            request = conn.recv()
+        except EOFError:
+            request = None
+
+        if request is None:
+            done = True
+            continue
+
+        job_id, job_config, working_dir = request
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            code = 1
+            try:
+                code = _run_module(job_config, working_dir)
+            finally:
+                os._exit(code)
+
+        children[pid] = job_id
+
+
+class JobZygoteError(Exception):
+    '''Exception raised when a JobZygote encounters an error.'''
+    pass
+
+
 class JobConfigError(Exception):
     pass
 
@@ -137,3 +656,8 @@ class JobConfig(Config):
         self.config_path = self.parse_string(d, "config_path")
         self.pipeline_config_path = self.parse_string(
             d, "pipeline_config_path", default=None)
+        self.dependencies = self.parse_array(
+            d, "dependencies", default=None)
+        self.in_process = self.parse_bool(d, "in_process", default=False)
+        self.inputs = self.parse_array(d, "inputs", default=[])
+        self.outputs = self.parse_array(d, "outputs", default=[])
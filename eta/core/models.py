@@ -941,6 +941,58 @@ class NpzModelWeights(PublishedModel, dict):
         return self
 
 
+class MemmapModelWeights(NpzModelWeights):
+    '''Class that provides a dictionary interface to a collection of published
+    model weights, which must be stored in an .npz file, whose values are
+    memory-mapped arrays.
+
+    The first time the weights are loaded, the (compressed) .npz file is
+    converted into a directory of uncompressed .npy files, which are
+    memory-mapped on all subsequent loads. This avoids decompressing and
+    copying the weights each time a model is loaded, and it allows multiple
+    processes that load the same model to share the weights in the page
+    cache.
+
+    The converted weights are stored in `eta.config.cache_dir`, if it is set,
+    and otherwise alongside the model file.
+    '''
+
+    @property
+    def cache_path(self):
+        '''The directory in which the converted weights are stored.'''
+        cache_dir = eta.config.cache_dir or os.path.dirname(self.model_path)
+        filename = os.path.splitext(os.path.basename(self.model_path))[0]
+        return os.path.join(cache_dir, filename + ".npy")
+
+    def _load(self):
+        if not os.path.isdir(self.cache_path):
+            self._convert()
+
+        for filename in os.listdir(self.cache_path):
+            name, ext = os.path.splitext(filename)
+            if ext == ".npy":
+                self[name] = np.load(
+                    os.path.join(self.cache_path, filename), mmap_mode="r")
+
+        return self
+
+    def _convert(self):
+        logger.info(
+            "Converting weights '%s' to memory-mappable format",
+            self.model_path)
+        tmp_path = "%s.%s" % (self.cache_path, etau.random_key(8))
+        etau.ensure_dir(tmp_path)
+        weights = np.load(self.model_path)
+        for name in weights.files:
+            np.save(os.path.join(tmp_path, name + ".npy"), weights[name])
+
+        try:
+            os.rename(tmp_path, self.cache_path)
+        except OSError:
+            # Another process converted the weights first
+            etau.delete_dir(tmp_path)
+
+
 class ModelManager(Configurable, Serializable):
     '''Base class for model managers.
 
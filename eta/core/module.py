@@ -23,8 +23,13 @@ from future.utils import iteritems
 # pragma pylint: enable=wildcard-import
 
 from collections import OrderedDict
+import copy
+from functools import wraps
 from glob import glob
+import logging
 import os
+import sys
+import traceback
 
 import eta
 from eta.core.config import Config, ConfigError, Configurable
@@ -34,6 +39,9 @@ import eta.core.types as etat
 import eta.core.utils as etau
 
 
+logger = logging.getLogger(__name__)
+
+
 def load_all_metadata():
     '''Loads all module metadata files.
 
@@ -180,6 +188,150 @@ def setup(module_config, pipeline_config_path=None):
     eta.set_config_settings(**module_config.base.eta_config)
 
 
+def shard_data(func):
+    '''Decorator that runs the decorated module function in parallel over
+    shards of the `data` array of its module config.
+
+    The decorated function must accept a module config derived from
+    BaseModuleConfig as its first argument and process each element of its
+    `data` field independently. When `config.base.num_workers` is greater
+    than one, `config.data` is split into that many contiguous shards, and
+    each shard is processed by the function in a child process forked from
+    the current process. The log messages of each shard are prefixed with the
+    shard number, and the function raises a ModuleShardError summarizing any
+    shards that failed after all shards have finished.
+
+    The function processes all of the data serially in the current process
+    when `config.base.num_workers` is at most one or when `fork()` is not
+    supported on this platform.
+
+    Example:
+        @etam.shard_data
+        def _process_videos(config):
+            for data in config.data:
+                ...
+
+    Args:
+        func: the module function to decorate
+
+    Returns:
+        the decorated function
+    '''
+    @wraps(func)
+    def wrapper(config, *args, **kwargs):
+        num_shards = min(config.base.num_workers, len(config.data))
+        ctx = etau.get_fork_context() if num_shards > 1 else None
+        if num_shards > 1 and ctx is None:
+            logger.warning(
+                "fork() is not supported on this platform; processing data "
+                "serially")
+
+        if ctx is None:
+            return func(config, *args, **kwargs)
+
+        _run_shards(ctx, func, config, num_shards, args, kwargs)
+
+    return wrapper
+
+
+def _run_shards(ctx, func, config, num_shards, args, kwargs):
+    logger.info(
+        "Processing %d data elements in %d shards", len(config.data),
+        num_shards)
+
+    # Split the data into contiguous shards of near-equal size
+    num_data = len(config.data)
+    bounds = [num_data * idx // num_shards for idx in range(num_shards + 1)]
+
+    children = []
+    for idx in range(num_shards):
+        shard_config = copy.copy(config)
+        shard_config.data = config.data[bounds[idx]:bounds[idx + 1]]
+
+        conn, child_conn = ctx.Pipe(duplex=False)
+        etal.flush()  # must flush because the shards share our logfile
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                conn.close()
+                code = _run_shard(
+                    func, shard_config, idx, num_shards, args, kwargs,
+                    child_conn)
+            finally:
+                os._exit(code)
+
+        child_conn.close()
+        children.append((pid, conn))
+
+    # Receive the errors of the shards before reaping them. A shard that
+    # fails blocks sending its traceback until we read it, so reaping it
+    # first would deadlock when the traceback overflows the pipe buffer
+    errors = []
+    for _, conn in children:
+        try:
+            errors.append(conn.recv())
+        except EOFError:
+            errors.append(None)
+        conn.close()
+
+    # Aggregate failures
+    failures = []
+    for idx, ((pid, _), error) in enumerate(zip(children, errors)):
+        _, status = os.waitpid(pid, 0)
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            continue
+
+        if error is None:
+            error = "Shard process terminated with status %d" % status
+        logger.error("Shard %d/%d failed:\n%s", idx + 1, num_shards, error)
+        failures.append(idx + 1)
+
+    if failures:
+        raise ModuleShardError(
+            "%d of %d shards failed: %s" % (
+                len(failures), num_shards,
+                ", ".join(str(idx) for idx in failures)))
+
+
+def _run_shard(func, config, idx, num_shards, args, kwargs, conn):
+    # Runs in the forked shard process; returns the exit code of the shard
+    log_filter = _ShardLogFilter(idx + 1, num_shards)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(log_filter)
+
+    # Let thread-count heuristics know that the shards share this host
+    eta.set_config_settings(num_workers=eta.config.num_workers * num_shards)
+
+    code = 1
+    try:
+        func(config, *args, **kwargs)
+        code = 0
+    except Exception:
+        conn.send(traceback.format_exc())
+    finally:
+        etal.flush()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.close()
+
+    return code
+
+
+class _ShardLogFilter(logging.Filter):
+    '''Logging filter that prefixes log messages with a shard number.'''
+
+    def __init__(self, idx, num_shards):
+        super(_ShardLogFilter, self).__init__()
+        self._prefix = "[shard %d/%d] " % (idx, num_shards)
+
+    def filter(self, record):
+        if not getattr(record, "_shard_prefixed", False):
+            record.msg = self._prefix + str(record.msg)
+            record._shard_prefixed = True
+        return True
+
+
 class BaseModuleConfig(Config):
     '''Base module configuration class that defines common configuration
     fields that all modules must support.
@@ -208,6 +360,8 @@ class BaseModuleConfigSettings(Config):
             before running the module
         logging_config: an `eta.core.log.LoggingConfig` instance defining
             the logging configuration settings for the module
+        num_workers: the number of processes across which modules that
+            support data sharding (see `shard_data()`) process their `data`
     '''
 
     def __init__(self, d):
@@ -215,6 +369,8 @@ class BaseModuleConfigSettings(Config):
         self.logging_config = self.parse_object(
             d, "logging_config", etal.LoggingConfig,
             default=etal.LoggingConfig.default())
+        self.num_workers = int(self.parse_number(
+            d, "num_workers", default=1))
 
 
 class GenericModuleConfig(Config):
@@ -634,6 +790,11 @@ class ModuleMetadata(Configurable, HasBlockDiagram):
                     self.info.name, name))
 
 
+class ModuleShardError(Exception):
+    '''Exception raised when one or more shards of a module fail.'''
+    pass
+
+
 class ModuleMetadataError(Exception):
     '''Exception raised when an invalid module metadata file is encountered.'''
     pass
@@ -53,6 +53,206 @@ def round_to_even(x):
     return int(round(x / 2.0) * 2)
 
 
+def squared_distances(X, Y):
+    '''Computes the squared Euclidean distances between the rows of two
+    matrices.
+
+    Args:
+        X: an m x d array
+        Y: an n x d array
+
+    Returns:
+        an m x n array whose (i, j) entry is the squared distance between
+            X[i] and Y[j]
+    '''
+    dists = (
+        np.sum(X ** 2, axis=1)[:, np.newaxis] - 2 * np.dot(X, Y.T) +
+        np.sum(Y ** 2, axis=1)[np.newaxis, :])
+    return np.maximum(dists, 0, out=dists)
+
+
+def kmeans(X, k, num_iters=20, batch_size=65536, seed=None):
+    '''Clusters the rows of a matrix via Lloyd's k-means algorithm.
+
+    Args:
+        X: an n x d array of points
+        k: the number of clusters. If there are fewer than k points, all of
+            the points are used as centroids
+        num_iters: the maximum number of iterations to run. The default is
+            20
+        batch_size: the number of points for which to compute distances at
+            once, which bounds the memory usage. The default is 65536
+        seed: an optional random seed
+
+    Returns:
+        centroids: a k x d array of cluster centroids
+        assignments: an array of length n containing the cluster of each
+            point
+    '''
+    X = np.asarray(X, dtype=np.float32)
+    rng = np.random.RandomState(seed)
+    k = min(k, len(X))
+    centroids = X[rng.choice(len(X), k, replace=False)].copy()
+
+    assignments = None
+    for _ in range(num_iters):
+        new_assignments = assign_clusters(X, centroids, batch_size=batch_size)
+        if assignments is not None and np.array_equal(
+                assignments, new_assignments):
+            break
+
+        assignments = new_assignments
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, X)
+
+        # Reseed empty clusters with random points
+        empty = counts == 0
+        nonempty = ~empty
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, np.newaxis]
+        if np.any(empty):
+            centroids[empty] = X[rng.choice(len(X), np.sum(empty))]
+
+    return centroids, assignments
+
+
+def assign_clusters(X, centroids, batch_size=65536):
+    '''Assigns each row of a matrix to its nearest centroid.
+
+    Args:
+        X: an n x d array of points
+        centroids: a k x d array of centroids
+        batch_size: the number of points for which to compute distances at
+            once. The default is 65536
+
+    Returns:
+        an array of length n containing the index of the nearest centroid to
+            each point
+    '''
+    assignments = np.empty(len(X), dtype=np.int64)
+    for start in range(0, len(X), batch_size):
+        dists = squared_distances(X[start:start + batch_size], centroids)
+        assignments[start:start + batch_size] = np.argmin(dists, axis=1)
+
+    return assignments
+
+
+class ProductQuantizer(object):
+    '''Product quantizer that compresses vectors by splitting them into
+    subvectors and replacing each subvector with the index of its nearest
+    codeword in a per-subvector codebook learned via k-means.
+    '''
+
+    def __init__(self, num_subvectors=8, num_codewords=256):
+        '''Creates a ProductQuantizer instance.
+
+        Args:
+            num_subvectors: the number of subvectors. The default is 8
+            num_codewords: the number of codewords per subvector. The
+                default is 256
+        '''
+        self.num_subvectors = num_subvectors
+        self.num_codewords = num_codewords
+        self.codebooks = None
+
+    @classmethod
+    def from_codebooks(cls, codebooks):
+        '''Creates a ProductQuantizer from trained codebooks.
+
+        Args:
+            codebooks: a num_subvectors x num_codewords x subvector dimension
+                array of codebooks
+
+        Returns:
+            a ProductQuantizer instance
+        '''
+        pq = cls(num_subvectors=codebooks.shape[0],
+                 num_codewords=codebooks.shape[1])
+        pq.codebooks = codebooks
+        return pq
+
+    @property
+    def code_dtype(self):
+        '''The dtype of the codes generated by this quantizer.'''
+        return np.uint8 if self.num_codewords <= 256 else np.uint16
+
+    def train(self, X, num_iters=20, seed=None):
+        '''Learns the codebooks of the quantizer.
+
+        Args:
+            X: an n x d array of training vectors. The dimension d must be
+                divisible by `num_subvectors`
+            num_iters: the number of k-means iterations to run. The default
+                is 20
+            seed: an optional random seed
+        '''
+        X = np.asarray(X, dtype=np.float32)
+        if X.shape[1] % self.num_subvectors:
+            raise ValueError(
+                "Vector dimension %d is not divisible by %d subvectors" % (
+                    X.shape[1], self.num_subvectors))
+
+        num_codewords = min(self.num_codewords, len(X))
+        codebooks = []
+        for Xs in self._split(X):
+            centroids, _ = kmeans(
+                Xs, num_codewords, num_iters=num_iters, seed=seed)
+            codebooks.append(centroids)
+
+        self.num_codewords = num_codewords
+        self.codebooks = np.array(codebooks)
+
+    def encode(self, X):
+        '''Encodes the given vectors.
+
+        Args:
+            X: an n x d array of vectors
+
+        Returns:
+            an n x num_subvectors array of codes
+        '''
+        X = np.asarray(X, dtype=np.float32)
+        codes = np.empty((len(X), self.num_subvectors), dtype=self.code_dtype)
+        for m, Xs in enumerate(self._split(X)):
+            codes[:, m] = assign_clusters(Xs, self.codebooks[m])
+
+        return codes
+
+    def decode(self, codes):
+        '''Decodes the given codes into (approximate) vectors.
+
+        Args:
+            codes: an n x num_subvectors array of codes
+
+        Returns:
+            an n x d array of vectors
+        '''
+        return np.concatenate(
+            [self.codebooks[m][codes[:, m]]
+             for m in range(self.num_subvectors)], axis=1)
+
+    def compute_distances(self, q, codes):
+        '''Computes the (asymmetric) squared distances between a query vector
+        and encoded vectors.
+
+        Args:
+            q: a query vector of length d
+            codes: an n x num_subvectors array of codes
+
+        Returns:
+            an array of n squared distances
+        '''
+        # Distances from each query subvector to each codeword
+        table = np.array([
+            squared_distances(qs, self.codebooks[m])[0]
+            for m, qs in enumerate(self._split(q[np.newaxis, :]))])
+        return np.sum(
+            table[np.arange(self.num_subvectors), codes], axis=1)
+
+    def _split(self, X):
+        return np.split(X, self.num_subvectors, axis=1)
+
+
 class Accumulator(object):
     '''A histogram-like class that supports counting arbitrary hashable
     objects.
@@ -159,9 +359,7 @@ class GrowableArray(object):
     def finalize(self):
         '''Return numpy array.'''
         return np.reshape(
-            self._data,
-            newshape=(len(self._data) // self.rowlen, self.rowlen),
-        )
+            self._data, (len(self._data) // self.rowlen, self.rowlen))
 
 
 class GrowableArrayError(Exception):
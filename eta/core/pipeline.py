@@ -18,6 +18,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import *
 from future.utils import iteritems
+from six.moves import queue
 # pragma pylint: enable=redefined-builtin
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
@@ -25,11 +26,12 @@ from future.utils import iteritems
 from collections import defaultdict
 from glob import glob
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import sys
 
 import eta
-from eta.core.config import Config, Configurable
+from eta.core.config import Config, ConfigError, Configurable
 from eta.core.diagram import HasBlockDiagram, BlockdiagPipeline
 import eta.core.graph as etag
 import eta.core.job as etaj
@@ -38,6 +40,7 @@ import eta.core.module as etam
 import eta.core.status as etas
 import eta.core.types as etat
 import eta.core.utils as etau
+import eta.core.workqueue as etawq
 
 
 logger = logging.getLogger(__name__)
@@ -49,7 +52,7 @@ PIPELINE_OUTPUT_NAME = "OUTPUT"
 
 def run(
         pipeline_config_path, pipeline_status=None, mark_as_complete=True,
-        rotate_logs=True):
+        rotate_logs=True, in_process=None):
     '''Run the pipeline specified by the PipelineConfig.
 
     Args:
@@ -61,12 +64,18 @@ def run(
             the pipeline finishes. By default, this is True
         rotate_logs: whether to rotate any existing pipeline log(s) before
             running. By default, this is True
+        in_process: whether to run the script jobs of the pipeline in-process
+            via a warm JobZygote rather than in new interpreters. By default,
+            the `in_process` setting of each job is used
 
     Returns:
         True/False whether the pipeline completed successfully
     '''
     # Load pipeline config
     pipeline_config = PipelineConfig.from_json(pipeline_config_path)
+    if in_process is not None:
+        for job_config in pipeline_config.jobs:
+            job_config.in_process = in_process
 
     # Setup logging
     etal.custom_setup(pipeline_config.logging_config, rotate=rotate_logs)
@@ -82,10 +91,23 @@ def run(
     # regardless of their working directory
     pipeline_config_path = os.path.abspath(pipeline_config_path)
 
+    # Start a zygote for in-process jobs before any threads are created. Jobs
+    # are run by the queue workers when a work queue is used
+    zygote = None
+    if hasattr(os, "fork") and not pipeline_config.queue_dir and any(
+            job_config.in_process for job_config in pipeline_config.jobs):
+        zygote = etaj.JobZygote(
+            preload_modules=pipeline_config.preload_modules)
+        zygote.start()
+
     # Run pipeline
-    return _run(
-        pipeline_config, pipeline_config_path, pipeline_status,
-        mark_as_complete)
+    try:
+        return _run(
+            pipeline_config, pipeline_config_path, pipeline_status,
+            mark_as_complete, zygote=zygote)
+    finally:
+        if zygote is not None:
+            zygote.stop()
 
 
 def _make_pipeline_status(pipeline_config):
@@ -108,34 +130,26 @@ def _make_publish_status_callback(status_path):
 
 def _run(
         pipeline_config, pipeline_config_path, pipeline_status,
-        mark_as_complete):
+        mark_as_complete, zygote=None):
     # Starting pipeline
     logger.info("Pipeline %s started", pipeline_config.name)
     pipeline_status.start()
     pipeline_status.publish()
 
     # Run jobs
-    overwrite = pipeline_config.overwrite
-    ran_last_job = False
     with etau.WorkingDir(pipeline_config.working_dir):
         for job_config in pipeline_config.jobs:
-            if ran_last_job and not overwrite:
-                logger.info(
-                    "Config change detected, running all remaining jobs")
-                overwrite = True
-
-            # Run job
             job_config.pipeline_config_path = pipeline_config_path
-            ran_last_job, success = etaj.run(
-                job_config, pipeline_status, overwrite=overwrite)
 
-            if not success:
-                # Pipeline failed
-                logger.info("Pipeline %s failed", pipeline_config.name)
-                pipeline_status.fail()
+        success = _run_jobs(pipeline_config, pipeline_status, zygote=zygote)
+
+    if not success:
+        # Pipeline failed
+        logger.info("Pipeline %s failed", pipeline_config.name)
+        pipeline_status.fail()
 
-                pipeline_status.publish()
-                return False
+        pipeline_status.publish()
+        return False
 
     if mark_as_complete:
         # Pipeline complete
@@ -146,6 +160,146 @@ def _run(
     return True
 
 
+def _run_jobs(pipeline_config, pipeline_status, zygote=None):
+    '''Runs the jobs of the pipeline, executing up to
+    `pipeline_config.max_parallel_jobs` jobs whose dependencies have completed
+    concurrently.
+
+    Jobs are launched in the order they appear in the PipelineConfig, so the
+    jobs are run serially in that order when `max_parallel_jobs == 1`. When a
+    job fails, no further jobs are launched, but any jobs that are already
+    running are allowed to finish.
+
+    If `pipeline_config.queue_dir` is set, jobs are submitted to the WorkQueue
+    in that directory and run by `eta worker` processes rather than locally.
+
+    Args:
+        pipeline_config: a PipelineConfig instance
+        pipeline_status: the PipelineStatus instance for the pipeline
+        zygote: an optional running JobZygote to use for in-process jobs
+
+    Returns:
+        True/False whether all jobs completed successfully
+    '''
+    job_configs = {
+        job_config.name: job_config for job_config in pipeline_config.jobs}
+    dependencies = pipeline_config.get_job_dependencies()
+    max_parallel_jobs = max(1, int(pipeline_config.max_parallel_jobs))
+    hasher_cls = etau.get_class(pipeline_config.file_hasher)
+    if pipeline_config.use_job_cache:
+        job_cache = etaj.JobCache(
+            full_hash=pipeline_config.job_cache_full_hash,
+            hasher_cls=hasher_cls)
+    else:
+        job_cache = None
+
+    if pipeline_config.queue_dir:
+        work_queue = etawq.WorkQueue(pipeline_config.queue_dir)
+
+        def run_job(job_config, overwrite):
+            return _run_queued_job(
+                job_config, pipeline_status, overwrite, pipeline_config,
+                work_queue, job_cache)
+    else:
+        def run_job(job_config, overwrite):
+            return etaj.run(
+                job_config, pipeline_status, overwrite=overwrite,
+                zygote=zygote, job_cache=job_cache, hasher_cls=hasher_cls)
+
+    pending = [job_config.name for job_config in pipeline_config.jobs]
+    ran_jobs = {}
+    num_running = 0
+    failed = False
+    error = None
+    results = queue.Queue()
+    pool = ThreadPool(processes=max_parallel_jobs)
+    try:
+        while True:
+            # Launch all jobs whose dependencies have completed
+            for name in list(pending):
+                if failed or num_running >= max_parallel_jobs:
+                    break
+
+                deps = dependencies[name]
+                if any(dep not in ran_jobs for dep in deps):
+                    continue
+
+                # Rerun a job whenever any of its dependencies were rerun
+                overwrite = pipeline_config.overwrite
+                if not overwrite and any(ran_jobs[dep] for dep in deps):
+                    logger.info(
+                        "Upstream change detected, running job %s", name)
+                    overwrite = True
+
+                pending.remove(name)
+                num_running += 1
+                pool.apply_async(
+                    _run_job, (run_job, job_configs[name], overwrite, results))
+
+            if not num_running:
+                break
+
+            # Wait for a job to finish
+            name, ran_job, success, job_error = results.get()
+            num_running -= 1
+            pipeline_status.publish()
+            if success:
+                ran_jobs[name] = ran_job
+            else:
+                failed = True
+                error = error or job_error
+    finally:
+        pool.close()
+        pool.join()
+
+    if error is not None:
+        raise error
+
+    return not failed
+
+
+def _run_job(run_job, job_config, overwrite, results):
+    try:
+        ran_job, success = run_job(job_config, overwrite)
+        error = None
+    except Exception as e:
+        ran_job, success, error = True, False, e
+
+    results.put((job_config.name, ran_job, success, error))
+
+
+def _run_queued_job(
+        job_config, pipeline_status, overwrite, pipeline_config, work_queue,
+        job_cache):
+    job_status = pipeline_status.add_job(job_config.name)
+
+    ticket = etawq.make_job_ticket(
+        job_config, pipeline_config.name, overwrite=overwrite,
+        file_hasher=pipeline_config.file_hasher, job_cache=job_cache)
+    ticket_id = work_queue.submit(ticket)
+    logger.info("Queued job %s (ticket %s)", job_config.name, ticket_id)
+
+    try:
+        result = etawq.wait_for_job_ticket(
+            work_queue, ticket_id,
+            heartbeat_timeout=pipeline_config.queue_heartbeat_timeout,
+            timeout=pipeline_config.queue_job_timeout)
+    except etawq.WorkQueueTimeoutError:
+        job_status.fail()
+        raise
+
+    # Aggregate the status reported by the worker
+    if result["job_status"]:
+        worker_status = etas.JobStatus.from_dict(result["job_status"])
+        for attr in worker_status.attributes():
+            setattr(job_status, attr, getattr(worker_status, attr))
+
+    logger.info(
+        "Job %s %s on worker %s", job_config.name,
+        "complete" if result["success"] else "failed", result["worker_id"])
+    return result["ran_job"], result["success"]
+
+
 def load_all_metadata():
     '''Loads all pipeline metadata files.
 
@@ -245,13 +399,65 @@ class PipelineConfig(Config):
         self.working_dir = self.parse_string(d, "working_dir", default=None)
         self.status_path = self.parse_string(d, "status_path", default=None)
         self.overwrite = self.parse_bool(d, "overwrite", default=True)
+        self.max_parallel_jobs = self.parse_number(
+            d, "max_parallel_jobs", default=1)
         self.jobs = self.parse_object_array(
             d, "jobs", etaj.JobConfig, default=[])
+        self.preload_modules = self.parse_array(
+            d, "preload_modules",
+            default=list(etaj.JobZygote.DEFAULT_PRELOAD_MODULES))
+        self.use_job_cache = self.parse_bool(
+            d, "use_job_cache", default=False)
+        self.job_cache_full_hash = self.parse_bool(
+            d, "job_cache_full_hash", default=False)
+        self.file_hasher = self.parse_string(
+            d, "file_hasher", default="eta.core.utils.MD5FileHasher")
+        self.queue_dir = self.parse_string(d, "queue_dir", default=None)
+        self.queue_heartbeat_timeout = self.parse_number(
+            d, "queue_heartbeat_timeout", default=60)
+        self.queue_job_timeout = self.parse_number(
+            d, "queue_job_timeout", default=None)
         self.eta_config = self.parse_dict(d, "eta_config", default={})
         self.logging_config = self.parse_object(
             d, "logging_config", etal.LoggingConfig,
             default=etal.LoggingConfig.default())
 
+        self._validate_job_dependencies()
+
+    def get_job_dependencies(self):
+        '''Returns a dictionary mapping job names to lists of the names of the
+        jobs that they depend on.
+
+        Jobs that do not explicitly declare their dependencies depend on all
+        preceding jobs in the pipeline.
+        '''
+        dependencies = {}
+        names = []
+        for job_config in self.jobs:
+            if job_config.dependencies is None:
+                dependencies[job_config.name] = list(names)
+            else:
+                dependencies[job_config.name] = job_config.dependencies
+            names.append(job_config.name)
+
+        return dependencies
+
+    def _validate_job_dependencies(self):
+        names = set()
+        for job_config in self.jobs:
+            if job_config.name in names:
+                raise ConfigError(
+                    "Pipeline contains multiple jobs named '%s'" %
+                    job_config.name)
+
+            for dep in job_config.dependencies or []:
+                if dep not in names:
+                    raise ConfigError(
+                        "Job '%s' depends on '%s', which is not a preceding "
+                        "job in the pipeline" % (job_config.name, dep))
+
+            names.add(job_config.name)
+
 
 class PipelineMetadataConfig(Config):
     '''Pipeline metadata configuration class.'''
@@ -20,6 +20,7 @@ from future.utils import iteritems
 # pragma pylint: enable=wildcard-import
 
 import logging
+import threading
 
 from eta.core.serial import Serializable
 import eta.core.utils as etau
@@ -73,6 +74,7 @@ class PipelineStatus(Serializable):
         self._serialize_jobs = serialize_jobs
         self._publish_callback = None
         self._active_job = None
+        self._lock = threading.RLock()
 
     def set_publish_callback(self, publish_callback):
         '''Sets the callback to use when `publish()` is called.
@@ -88,24 +90,38 @@ class PipelineStatus(Serializable):
         `set_publish_callback()` method (if any).
         '''
         if self._publish_callback:
-            self._publish_callback(self)
+            with self._lock:
+                self._publish_callback(self)
 
     @property
     def active_job(self):
-        '''The JobStatus instance for the active job, or None if no job is
-        active.
+        '''The JobStatus instance for the most recently added job, or None if
+        no job is active.
         '''
         return self._active_job
 
+    @property
+    def active_jobs(self):
+        '''A list of JobStatus instances for the jobs that are currently
+        running.
+        '''
+        with self._lock:
+            return [
+                job for job in self.jobs if job.state == JobState.RUNNING]
+
     def add_job(self, name):
         '''Add a new job with the given name and activate it.
 
+        This method is thread-safe, so jobs that are running concurrently may
+        share a PipelineStatus instance.
+
         Returns:
             the JobStatus instance for the job
         '''
-        self._active_job = JobStatus(name)
-        self.jobs.append(self._active_job)
-        return self._active_job
+        with self._lock:
+            self._active_job = JobStatus(name)
+            self.jobs.append(self._active_job)
+            return self._active_job
 
     def add_message(self, message):
         '''Add the given message to the messages list.'''
@@ -15,44 +15,66 @@ from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import *
 from future.utils import iteritems
+import six
 # pragma pylint: enable=redefined-builtin
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
 import copy
 import logging
+import os
+import tempfile
+import time
 
 import tensorflow as tf
 
 import eta
 import eta.core.models as etam
+import eta.core.serial as etas
+import eta.core.utils as etau
 
 
 logger = logging.getLogger(__name__)
 
 
-def make_tf_session(config_proto=None):
+THREAD_CALIBRATION_CACHE_FILE = "tf_thread_calibration.json"
+
+
+def make_tf_session(config_proto=None, model_name=None):
     '''Makes a new tf.Session that inherits any config settings from the global
     `eta.config.tf_config`.
 
     Args:
         config_proto: an optional tf.ConfigProto from which to initialize the
             session config. By default, tf.ConfigProto() is used
+        model_name: an optional name of the model that will be run in the
+            session. If provided, any cached thread counts computed by
+            `calibrate_thread_counts()` for the model are used
 
     Returns:
         a tf.Session
     '''
-    config = make_tf_config(config_proto=config_proto)
+    config = make_tf_config(config_proto=config_proto, model_name=model_name)
     return tf.Session(config=config)
 
 
-def make_tf_config(config_proto=None):
+def make_tf_config(config_proto=None, model_name=None):
     '''Makes a new tf.ConfigProto that inherits any config settings from the
     global `eta.config.tf_config`.
 
+    If the intra-op and/or inter-op thread counts are not set by the provided
+    proto or by `eta.config.tf_config`, they are set as follows:
+        - to the calibrated thread counts for `model_name`, if they have been
+          cached by `calibrate_thread_counts()`
+        - to the thread counts recommended by `get_cpu_thread_counts()`, if
+          `eta.config.tf_auto_threads` is True
+        - otherwise, they are left unset so that TensorFlow uses its defaults
+
     Args:
         config_proto: an optional tf.ConfigProto from which to initialize the
             config. By default, tf.ConfigProto() is used
+        model_name: an optional name of the model that will be run with the
+            config
 
     Returns:
         a tf.ConfigProto
@@ -64,9 +86,408 @@ def make_tf_config(config_proto=None):
             "Applying eta.tf_config settings: %s", str(eta.config.tf_config))
         _set_proto_fields(config, eta.config.tf_config)
 
+    if config.intra_op_parallelism_threads and \
+            config.inter_op_parallelism_threads:
+        return config
+
+    thread_counts = None
+    if model_name:
+        thread_counts = get_calibrated_thread_counts(model_name)
+    if thread_counts is None and eta.config.tf_auto_threads:
+        thread_counts = get_cpu_thread_counts()
+
+    if thread_counts is not None:
+        intra_op_threads, inter_op_threads = thread_counts
+        logger.debug(
+            "Using %d intra-op and %d inter-op threads", intra_op_threads,
+            inter_op_threads)
+        if not config.intra_op_parallelism_threads:
+            config.intra_op_parallelism_threads = intra_op_threads
+        if not config.inter_op_parallelism_threads:
+            config.inter_op_parallelism_threads = inter_op_threads
+
     return config
 
 
+def get_cpu_thread_counts(num_workers=None):
+    '''Returns the recommended TensorFlow thread pool sizes for CPU inference
+    when `num_workers` ETA workers share the CPUs available to this process.
+
+    The available CPUs are determined by `eta.core.utils.get_cpu_count()`,
+    which respects CPU affinity and cgroup quotas, and are divided evenly
+    between the workers.
+
+    Args:
+        num_workers: the number of ETA workers that will run concurrently on
+            this host. By default, `eta.config.num_workers` is used
+
+    Returns:
+        intra_op_threads: the recommended number of intra-op threads
+        inter_op_threads: the recommended number of inter-op threads
+    '''
+    num_workers = max(1, num_workers or eta.config.num_workers)
+    cpus_per_worker = max(1, etau.get_cpu_count() // num_workers)
+
+    # Our models are mostly sequential stacks of large ops, so most of the
+    # parallelism comes from within each op
+    inter_op_threads = 2 if cpus_per_worker >= 8 else 1
+    return cpus_per_worker, inter_op_threads
+
+
+def get_calibrated_thread_counts(model_name, num_workers=None):
+    '''Returns the cached thread counts computed by
+    `calibrate_thread_counts()` for the given model on this host, if any.
+
+    Args:
+        model_name: the name of the model
+        num_workers: the number of concurrent ETA workers. By default,
+            `eta.config.num_workers` is used
+
+    Returns:
+        an (intra_op_threads, inter_op_threads) tuple, or None if no
+            calibration has been cached
+    '''
+    key = _make_calibration_key(model_name, num_workers)
+    thread_counts = _read_calibration_cache().get(key, None)
+    return tuple(thread_counts) if thread_counts else None
+
+
+def calibrate_thread_counts(
+        model_name, benchmark_fcn, num_workers=None, candidates=None,
+        num_runs=5, force=False):
+    '''Runs a small benchmark to choose the best TensorFlow thread pool sizes
+    for the given model on this host, and caches the result.
+
+    Each candidate setting is benchmarked in a fresh subprocess, since
+    TensorFlow's thread pools cannot be reconfigured once they are created.
+    Subprocesses are always created via `fork()`, even on platforms whose
+    default multiprocessing start method is "spawn", so `benchmark_fcn` need
+    not be picklable, but this function must be called before any TensorFlow
+    session is created in the current process. On platforms that do not
+    support `fork()`, no benchmarks are run and the thread counts recommended
+    by `get_cpu_thread_counts()` are returned (and not cached).
+
+    The result is cached in `eta.config.cache_dir`, and subsequent calls to
+    `make_tf_config()` with the same `model_name` will use it.
+
+    Example usage:
+    ```
+    def benchmark_vgg16(sess):
+        vgg16 = VGG16(sess=sess)
+        imgs = np.random.rand(8, 224, 224, 3)
+        return lambda: vgg16.evaluate(imgs, layer=vgg16.fc2l)
+
+    calibrate_thread_counts("VGG-16", benchmark_vgg16)
+    ```
+
+    Args:
+        model_name: the name of the model being calibrated
+        benchmark_fcn: a function that accepts a tf.Session, loads the model
+            in it, and returns a function with no arguments that performs one
+            inference
+        num_workers: the number of ETA workers that will run concurrently on
+            this host. By default, `eta.config.num_workers` is used
+        candidates: an optional list of (intra_op_threads, inter_op_threads)
+            tuples to try. By default, a small set of candidates is generated
+            around `get_cpu_thread_counts(num_workers)`
+        num_runs: the number of timed inferences to average for each
+            candidate. The default is 5
+        force: whether to re-run the calibration even if a cached result
+            exists. The default is False
+
+    Returns:
+        the best (intra_op_threads, inter_op_threads) tuple
+
+    Raises:
+        ThreadCalibrationError: if all of the benchmarks failed
+    '''
+    if not force:
+        thread_counts = get_calibrated_thread_counts(
+            model_name, num_workers=num_workers)
+        if thread_counts is not None:
+            logger.info(
+                "Using cached thread counts %s for model '%s'",
+                thread_counts, model_name)
+            return thread_counts
+
+    if etau.get_fork_context() is None:
+        logger.warning(
+            "fork() is not supported on this platform; using the default "
+            "thread counts for model '%s'", model_name)
+        return get_cpu_thread_counts(num_workers=num_workers)
+
+    if candidates is None:
+        candidates = _make_thread_count_candidates(num_workers)
+
+    best_runtime = None
+    thread_counts = None
+    for intra_op_threads, inter_op_threads in candidates:
+        runtime = _benchmark_thread_counts(
+            benchmark_fcn, intra_op_threads, inter_op_threads, num_runs)
+        if runtime is None:
+            logger.warning(
+                "Benchmark failed for %d intra-op and %d inter-op threads",
+                intra_op_threads, inter_op_threads)
+            continue
+
+        logger.info(
+            "%d intra-op and %d inter-op threads: %.4fs per inference",
+            intra_op_threads, inter_op_threads, runtime)
+        if best_runtime is None or runtime < best_runtime:
+            best_runtime = runtime
+            thread_counts = (intra_op_threads, inter_op_threads)
+
+    if thread_counts is None:
+        raise ThreadCalibrationError(
+            "All thread count benchmarks failed for model '%s'" % model_name)
+
+    logger.info(
+        "Best thread counts for model '%s': %s", model_name, thread_counts)
+
+    key = _make_calibration_key(model_name, num_workers)
+    cache = _read_calibration_cache()
+    cache[key] = list(thread_counts)
+    _write_calibration_cache(cache)
+
+    return thread_counts
+
+
+class ThreadCalibrationError(Exception):
+    '''Exception raised when thread count calibration fails.'''
+    pass
+
+
+def _make_thread_count_candidates(num_workers):
+    intra_op_threads, _ = get_cpu_thread_counts(num_workers=num_workers)
+    intras = sorted(set(
+        max(1, intra_op_threads // d) for d in (1, 2, 4)), reverse=True)
+    return [(intra, inter) for intra in intras for inter in (1, 2)]
+
+
+def _benchmark_thread_counts(
+        benchmark_fcn, intra_op_threads, inter_op_threads, num_runs):
+    context = etau.get_fork_context()
+    recv_conn, send_conn = context.Pipe(duplex=False)
+    p = context.Process(
+        target=_run_thread_count_benchmark,
+        args=(
+            benchmark_fcn, intra_op_threads, inter_op_threads, num_runs,
+            send_conn))
+    p.start()
+    send_conn.close()
+
+    # Read the result before reaping the process, so that it never blocks on
+    # the pipe
+    try:
+        runtime = recv_conn.recv()
+    except EOFError:
+        runtime = None  # the benchmark died before reporting its result
+    finally:
+        recv_conn.close()
+
+    p.join()
+    return runtime if p.exitcode == 0 else None
+
+
+def _run_thread_count_benchmark(
+        benchmark_fcn, intra_op_threads, inter_op_threads, num_runs, conn):
+    config = tf.ConfigProto()
+    _set_proto_fields(config, eta.config.tf_config)
+    config.intra_op_parallelism_threads = intra_op_threads
+    config.inter_op_parallelism_threads = inter_op_threads
+
+    with tf.Session(config=config) as sess:
+        run = benchmark_fcn(sess)
+        run()  # warmup
+        start = time.time()
+        for _ in range(num_runs):
+            run()
+        conn.send((time.time() - start) / num_runs)
+        conn.close()
+
+
+def _make_calibration_key(model_name, num_workers):
+    num_workers = max(1, num_workers or eta.config.num_workers)
+    return "%s@%dcpus/%dworkers" % (
+        model_name, etau.get_cpu_count(), num_workers)
+
+
+def _get_calibration_cache_path():
+    cache_dir = eta.config.cache_dir or tempfile.gettempdir()
+    return os.path.join(cache_dir, THREAD_CALIBRATION_CACHE_FILE)
+
+
+def _read_calibration_cache():
+    path = _get_calibration_cache_path()
+    if not os.path.isfile(path):
+        return {}
+
+    try:
+        return etas.read_json(path)
+    except ValueError:
+        logger.warning("Ignoring invalid calibration cache '%s'", path)
+        return {}
+
+
+def _write_calibration_cache(cache):
+    # Write to a temporary file first so that concurrent readers never see a
+    # partial file
+    path = _get_calibration_cache_path()
+    tmp_path = "%s.%s.tmp" % (path, etau.random_key(8))
+    etas.write_json(cache, tmp_path)
+    os.rename(tmp_path, path)
+
+
+def get_frozen_graph_path(model_name, layers):
+    '''Returns the path at which the frozen graph for the given model and
+    output layers is cached.
+
+    Frozen graphs are cached in `eta.config.cache_dir`, if it is set, and
+    otherwise in the system temporary directory.
+
+    Args:
+        model_name: the name of the model
+        layers: the list of output layer names of the frozen graph
+
+    Returns:
+        the path to the frozen graph
+    '''
+    cache_dir = eta.config.cache_dir or tempfile.gettempdir()
+    filename = "%s.%s.frozen.pb" % (model_name, "-".join(layers))
+    return os.path.join(cache_dir, "frozen_graphs", filename)
+
+
+def get_frozen_output_name(layer):
+    '''Returns the name of the output node for the given layer in a frozen
+    graph.
+
+    The output nodes live in a separate "frozen/" scope so that they do not
+    collide with the name scopes of the layers of the network.
+
+    Args:
+        layer: the layer name, e.g., "fc2"
+
+    Returns:
+        the name of the output node
+    '''
+    return "frozen/" + layer
+
+
+def add_frozen_outputs(model, layers):
+    '''Adds named output nodes for the given layers of a network to its
+    graph so that they can be kept when the graph is frozen.
+
+    Args:
+        model: the network instance whose layers are exposed as attributes
+        layers: the list of layer names
+
+    Returns:
+        the list of names of the output nodes, which can be passed to
+            `freeze_graph()`
+
+    Raises:
+        ValueError: if the output nodes already exist in the graph
+    '''
+    output_names = []
+    for layer in layers:
+        name = get_frozen_output_name(layer)
+        output = tf.identity(resolve_layers(model, layer), name=name)
+        if output.op.name != name:
+            raise ValueError(
+                "Frozen output '%s' already exists in the graph" % name)
+
+        output_names.append(name)
+
+    return output_names
+
+
+def freeze_graph(sess, output_names, path):
+    '''Freezes the graph of the given session and writes it to disk.
+
+    All variables are replaced by constants containing their current values,
+    any nodes that are not needed to compute the requested outputs are
+    removed, and training-only nodes are stripped.
+
+    Args:
+        sess: the tf.Session whose graph to freeze
+        output_names: the list of names of the output nodes to keep
+        path: the path to write the frozen graph
+    '''
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        sess, sess.graph.as_graph_def(), output_names)
+    graph_def = tf.graph_util.remove_training_nodes(
+        graph_def, protected_nodes=output_names)
+
+    # Write to a temporary path first so that concurrent readers never see a
+    # partially written graph
+    etau.ensure_basedir(path)
+    tmp_path = "%s.%s" % (path, etau.random_key(8))
+    with tf.gfile.GFile(tmp_path, "wb") as f:
+        f.write(graph_def.SerializeToString())
+    os.rename(tmp_path, path)
+    logger.info("Frozen graph written to '%s'", path)
+
+
+def import_frozen_graph(path, input_map, output_names, name="frozen"):
+    '''Imports a frozen graph written by `freeze_graph()` into the current
+    default graph.
+
+    Args:
+        path: the path to the frozen graph
+        input_map: a dictionary mapping the names of the input nodes of the
+            frozen graph to the tf.Tensors to use for them
+        output_names: the list of names of the output nodes to return
+        name: an optional name scope for the imported graph. The default is
+            "frozen"
+
+    Returns:
+        a list of tf.Tensors for the requested outputs
+    '''
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(path, "rb") as f:
+        graph_def.ParseFromString(f.read())
+
+    input_map = {k + ":0": v for k, v in iteritems(input_map)}
+    return tf.import_graph_def(
+        graph_def, input_map=input_map,
+        return_elements=[n + ":0" for n in output_names], name=name)
+
+
+def resolve_layers(model, layers):
+    '''Resolves the given layer(s) of a network into tensors that can be
+    fetched via `tf.Session.run()`.
+
+    Args:
+        model: the network instance, e.g., an `eta.core.vgg16.VGG16`, whose
+            layers are exposed as attributes
+        layers: a tf.Tensor or layer name (e.g., "fc2"), or a list or dict
+            whose values are tf.Tensors or layer names
+
+    Returns:
+        a tf.Tensor, or a list or dict of tf.Tensors, with the same structure
+            as `layers`
+
+    Raises:
+        ValueError: if a layer name was not recognized
+    '''
+    def _resolve(layer):
+        if not isinstance(layer, six.string_types):
+            return layer
+        tensor = getattr(model, layer, None)
+        if not isinstance(tensor, tf.Tensor):
+            raise ValueError(
+                "'%s' is not a layer of %s" % (layer, etau.get_class_name(
+                    model)))
+        return tensor
+
+    if isinstance(layers, dict):
+        return {k: _resolve(v) for k, v in iteritems(layers)}
+    if isinstance(layers, (list, tuple)):
+        return [_resolve(l) for l in layers]
+
+    return _resolve(layers)
+
+
 def _set_proto_fields(proto, d):
     def _split_field(field):
         chunks = field.split(".", 1)
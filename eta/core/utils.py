@@ -27,7 +27,10 @@ import glob
 import hashlib
 import inspect
 import itertools as it
+import json
 import logging
+import math
+import multiprocessing
 import os
 import random
 import re
@@ -99,6 +102,76 @@ def has_gpu():
         return False
 
 
+def get_cpu_count():
+    '''Returns the number of CPUs available to the current process.
+
+    This respects the CPU affinity of the process and any CPU quota imposed
+    by cgroups (e.g., when running in a container), so it may be smaller than
+    the number of CPUs on the machine.
+
+    Returns:
+        the number of available CPUs, which is always at least 1
+    '''
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is not available on all platforms
+        count = multiprocessing.cpu_count()
+
+    quota = _get_cgroup_cpu_quota()
+    if quota:
+        count = min(count, int(math.ceil(quota)))
+
+    return max(1, count)
+
+
+def _get_cgroup_cpu_quota():
+    # cgroup v2
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "rt") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return float(quota) / float(period)
+    except (EnvironmentError, ValueError):
+        pass
+
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", "rt") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us", "rt") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return float(quota) / period
+    except (EnvironmentError, ValueError):
+        pass
+
+    return None
+
+
+def get_fork_context():
+    '''Returns a multiprocessing context whose processes are created via
+    `fork()`, regardless of the default start method of the platform.
+
+    Child processes created by this context inherit the state of the parent,
+    including closures and other unpicklable objects, which the "spawn"
+    start method (the default on Windows and on macOS in Python 3.8+) would
+    need to pickle.
+
+    Returns:
+        a multiprocessing context, or None if `fork()` is not supported on
+            this platform
+    '''
+    if not hasattr(os, "fork"):
+        return None
+
+    try:
+        return multiprocessing.get_context("fork")
+    except AttributeError:
+        # Python 2 always forks
+        return multiprocessing
+
+
 def get_class_name(cls_or_obj):
     '''Returns the fully-qualified class name for the given input, which can
     be a class or class instance.
@@ -207,7 +280,7 @@ def query_yes_no(question, default=None):
             print("Please respond with 'yes' or 'no'")
 
 
-def call(args):
+def call(args, cwd=None):
     '''Runs the command via `subprocess.call`.
 
     stdout and stderr are streamed live during execution. If you want to
@@ -215,11 +288,13 @@ def call(args):
 
     Args:
         args: the command specified as a ["list", "of", "strings"]
+        cwd: an optional working directory in which to run the command. By
+            default, the current working directory is used
 
     Returns:
         True/False: if the command executed successfully
     '''
-    return subprocess.call(args) == 0
+    return subprocess.call(args, cwd=cwd) == 0
 
 
 def communicate(args, decode=False):
@@ -705,7 +780,7 @@ def parse_pattern(patt):
     # Create validation functions
     seq_patts = re.findall(seq_exp, patt)
     fcns = [parse_int_sprintf_pattern(sp) for sp in seq_patts]
-    full_exp, num_inds = re.subn(seq_exp, "(\\s*\\d+)", patt)
+    full_exp, num_inds = re.subn(seq_exp, r"(\\s*\\d+)", patt)
 
     # Extract indices from exactly matching patterns
     inds = []
@@ -907,15 +982,34 @@ def remove_none_values(d):
 
 
 class FileHasher(object):
-    '''Base class for file hashers.'''
+    '''Base class for file hashers.
+
+    Files are hashed in chunks, so arbitrarily large files can be hashed
+    without reading them into memory.
+
+    Hashes can optionally be cached in a sidecar file that records the size
+    and modification time of the file when it was hashed. Subsequent hashes
+    of the file are read from the sidecar as long as the size and
+    modification time of the file are unchanged. Sidecars are stored in the
+    "hashes" directory of `eta.config.cache_dir` (or the system temporary
+    directory) rather than next to the hashed files, so hashing the contents
+    of a directory never picks up sidecars written by earlier hashes.
+    '''
 
     EXT = ""
+    CHUNK_SIZE = 1024 * 1024
 
-    def __init__(self, path):
+    def __init__(self, path, use_cache=False):
         '''Constructs a FileHasher instance based on the current version of
-        the input file.'''
+        the input file.
+
+        Args:
+            path: the path to the file
+            use_cache: whether to use the sidecar hash cache of the file. By
+                default, this is False
+        '''
         self.path = path
-        self._new_hash = self.hash(path)
+        self._new_hash = self.hash(path, use_cache=use_cache)
         self._cur_hash = self.read()
 
     @property
@@ -953,9 +1047,74 @@ class FileHasher(object):
         with open(self.record_path, "wt") as f:
             f.write(self._new_hash)
 
+    @classmethod
+    def hash(cls, path, use_cache=False):
+        '''Computes the hash of the file contents.
+
+        Args:
+            path: the path to the file
+            use_cache: whether to read the hash from (and write it to) the
+                sidecar hash cache of the file. By default, this is False
+
+        Returns:
+            the hex digest of the file contents
+        '''
+        if use_cache:
+            st = os.stat(path)
+            digest = cls._read_cache(path, st)
+            if digest is not None:
+                return digest
+
+        h = cls.make_hash()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b""):
+                h.update(chunk)
+        digest = str(h.hexdigest())
+
+        if use_cache:
+            cls._write_cache(path, st, digest)
+
+        return digest
+
+    @classmethod
+    def get_cache_path(cls, path):
+        '''Returns the path to the sidecar hash cache of the given file.
+
+        The sidecar is keyed by the absolute path of the file.
+        '''
+        import eta
+        cache_dir = os.path.join(
+            eta.config.cache_dir or tempfile.gettempdir(), "hashes")
+        key = hashlib.md5(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(cache_dir, key + cls.EXT + ".cache")
+
     @staticmethod
-    def hash(path):
-        raise NotImplementedError("subclass must implement hash()")
+    def make_hash():
+        '''Returns a new `hashlib` hash object.'''
+        raise NotImplementedError("subclass must implement make_hash()")
+
+    @classmethod
+    def _read_cache(cls, path, st):
+        try:
+            with open(cls.get_cache_path(path), "rt") as f:
+                d = json.load(f)
+            if d["size"] == st.st_size and d["mtime"] == st.st_mtime:
+                return d["hash"]
+        except (EnvironmentError, ValueError, KeyError):
+            pass
+
+        return None
+
+    @classmethod
+    def _write_cache(cls, path, st, digest):
+        d = {"size": st.st_size, "mtime": st.st_mtime, "hash": digest}
+        cache_path = cls.get_cache_path(path)
+        try:
+            ensure_basedir(cache_path)
+            with open(cache_path, "wt") as f:
+                f.write(json.dumps(d))
+        except EnvironmentError:
+            logger.debug("Unable to write hash cache for '%s'", path)
 
 
 class MD5FileHasher(FileHasher):
@@ -964,10 +1123,32 @@ class MD5FileHasher(FileHasher):
     EXT = ".md5"
 
     @staticmethod
-    def hash(path):
-        '''Computes the MD5 hash of the file contents.'''
-        with open(path, "rb") as f:
-            return str(hashlib.md5(f.read()).hexdigest())
+    def make_hash():
+        return hashlib.md5()
+
+
+class SHA1FileHasher(FileHasher):
+    '''SHA-1 file hasher.'''
+
+    EXT = ".sha1"
+
+    @staticmethod
+    def make_hash():
+        return hashlib.sha1()
+
+
+class BLAKE2FileHasher(FileHasher):
+    '''BLAKE2b file hasher.
+
+    BLAKE2b is typically faster than MD5 and SHA-1 on 64-bit platforms. It is
+    only available in Python 3.6 or later.
+    '''
+
+    EXT = ".blake2"
+
+    @staticmethod
+    def make_hash():
+        return hashlib.blake2b()
 
 
 class TempDir(object):
@@ -29,14 +29,16 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+import copy
 import logging
+import os
 
 import numpy as np
 import tensorflow as tf
 
 from eta.core.config import Config
 import eta.core.image as etai
-from eta.core.features import Featurizer
+from eta.core.features import Featurizer, unpack_layer_features
 import eta.core.models as etam
 import eta.core.tfutils as etat
 
@@ -45,10 +47,24 @@ logger = logging.getLogger(__name__)
 
 
 class VGG16Config(Config):
-    '''Configuration settings for the VGG-16 network.'''
+    '''Configuration settings for the VGG-16 network.
+
+    Attributes:
+        model: the VGG-16 model to use
+        use_frozen_graph: whether to load the network from a frozen graph
+            whose outputs are `frozen_layers`. The frozen graph is exported
+            and cached the first time it is needed. The default is False
+        frozen_layers: the layers to keep when freezing the graph. The
+            default is all of "pool5", "fc1", "fc2l", "fc2", "fc3", and
+            "probs"
+    '''
 
     def __init__(self, d):
         self.model = self.parse_string(d, "model", default="VGG-16")
+        self.use_frozen_graph = self.parse_bool(
+            d, "use_frozen_graph", default=False)
+        self.frozen_layers = self.parse_array(
+            d, "frozen_layers", default=list(VGG16.OUTPUT_LAYERS))
 
 
 class VGG16(object):
@@ -57,8 +73,14 @@ class VGG16(object):
 
     This implementation is hard-coded to process a tensor of images of size
     [XXXX, 224, 224, 3].
+
+    If `use_frozen_graph` is set in the config, the network is loaded from a
+    cached frozen graph in which the weights are constants and only the
+    `frozen_layers` outputs are available as attributes of this instance.
     '''
 
+    OUTPUT_LAYERS = ("pool5", "fc1", "fc2l", "fc2", "fc3", "probs")
+
     def __init__(self, config=None, sess=None, imgs=None):
         '''Builds a new VGG-16 network.
 
@@ -76,7 +98,7 @@ class VGG16(object):
         if config is None:
             config = VGG16Config.default()
         if sess is None:
-            sess = etat.make_tf_session()
+            sess = etat.make_tf_session(model_name=config.model)
         if imgs is None:
             imgs = tf.placeholder(tf.float32, [None, 224, 224, 3])
 
@@ -84,6 +106,10 @@ class VGG16(object):
         self.sess = sess
         self.imgs = imgs
 
+        if self.config.use_frozen_graph:
+            self._load_frozen_graph()
+            return
+
         self._build_conv_layers()
         self._build_fc_layers()
         self._build_output_layer()
@@ -102,18 +128,28 @@ class VGG16(object):
         Args:
             imgs: an array of size [XXXX, 224, 224, 3] containing image(s) to
                 feed into the network
-            layer: an optional layer whose output to return. By default, the
+            layer: an optional layer whose output to return, or a list or
+                dict of layers whose outputs to return, all of which are
+                computed in a single forward pass. Layers can be specified
+                either as tensors or by name, e.g., "fc2l". By default, the
                 output softmax layer (i.e., the class probabilities) is
                 returned
 
         Returns:
-            an array of same size as the requested layer. The first dimension
-                will always be XXXX
+            an array of same size as the requested layer, or a list or dict of
+                such arrays if multiple layers were requested. The first
+                dimension of each array will always be XXXX
         '''
         if layer is None:
+            if not hasattr(self, "probs"):
+                raise ValueError(
+                    "The default 'probs' layer is unavailable because it was "
+                    "not in `frozen_layers`; specify the layer(s) to "
+                    "evaluate")
             layer = self.probs
 
-        return self.sess.run(layer, feed_dict={self.imgs: imgs})
+        fetches = etat.resolve_layers(self, layer)
+        return self.sess.run(fetches, feed_dict={self.imgs: imgs})
 
     def close(self):
         '''Closes the TensorFlow session used by this instance, if necessary.
@@ -125,6 +161,36 @@ class VGG16(object):
             self.sess.close()
             self.sess = None
 
+    @staticmethod
+    def export_frozen_graph(config, layers, path):
+        '''Builds the VGG-16 network described by the given config, freezes
+        it up to the given layers, and writes the frozen graph to disk.
+
+        Args:
+            config: a VGG16Config instance
+            layers: the list of output layers to keep
+            path: the path to write the frozen graph
+        '''
+        config = copy.copy(config)
+        config.use_frozen_graph = False
+        with tf.Graph().as_default():
+            imgs = tf.placeholder(tf.float32, [None, 224, 224, 3], name="imgs")
+            with VGG16(config=config, imgs=imgs) as vgg16:
+                output_names = etat.add_frozen_outputs(vgg16, layers)
+                etat.freeze_graph(vgg16.sess, output_names, path)
+
+    def _load_frozen_graph(self):
+        layers = self.config.frozen_layers
+        path = etat.get_frozen_graph_path(self.config.model, layers)
+        if not os.path.isfile(path):
+            self.export_frozen_graph(self.config, layers, path)
+
+        output_names = [etat.get_frozen_output_name(l) for l in layers]
+        outputs = etat.import_frozen_graph(
+            path, {"imgs": self.imgs}, output_names, name="vgg16")
+        for layer, tensor in zip(layers, outputs):
+            setattr(self, layer, tensor)
+
     def _build_conv_layers(self):
         self.parameters = []
 
@@ -449,39 +515,89 @@ class VGG16(object):
         self.probs = tf.nn.softmax(self.fc3)
 
     def _load_model(self, model):
-        weights = etam.NpzModelWeights(model).load()
-        for i, k in enumerate(sorted(weights)):
-            self.sess.run(self.parameters[i].assign(weights[k]))
+        weights = etam.MemmapModelWeights(model).load()
+
+        # Assign all weights via a single op
+        placeholders = [
+            tf.placeholder(p.dtype.base_dtype, shape=p.get_shape())
+            for p in self.parameters]
+        load_op = tf.group(*[
+            p.assign(ph) for p, ph in zip(self.parameters, placeholders)])
+        feed_dict = {
+            ph: weights[k] for ph, k in zip(placeholders, sorted(weights))}
+        self.sess.run(load_op, feed_dict=feed_dict)
 
 
 class VGG16FeaturizerConfig(VGG16Config):
-    '''Configuration settings for a VGG16Featurizer.'''
-    pass
+    '''Configuration settings for a VGG16Featurizer.
+
+    Attributes:
+        model: the VGG-16 model to use
+        layers: the list of layers whose outputs to extract, all of which are
+            computed in a single forward pass. The supported layers are
+            "pool5", "fc1", "fc2l", "fc2", "fc3", and "probs". The default is
+            ["fc2l"]
+        use_frozen_graph: whether to load the network from a frozen graph.
+            Unless `frozen_layers` is provided, only `layers` are kept when
+            freezing the graph. The default is False
+    '''
+
+    def __init__(self, d):
+        super(VGG16FeaturizerConfig, self).__init__(d)
+        self.layers = self.parse_array(d, "layers", default=["fc2l"])
+        if "frozen_layers" not in d:
+            # Only freeze the layers that we need
+            self.frozen_layers = list(self.layers)
 
 
 class VGG16Featurizer(Featurizer):
-    '''Featurizer that embeds images into the VGG-16 feature space.'''
+    '''Featurizer that embeds images into the VGG-16 feature space.
+
+    If a single layer is requested, each image is featurized as a 1D array
+    containing the (flattened) output of that layer. If multiple layers are
+    requested, each image is featurized as a dictionary mapping layer names
+    to 1D arrays, and `dim()` reports the dimension of the first layer.
+    '''
+
+    LAYER_DIMS = {
+        "pool5": 25088,
+        "fc1": 4096,
+        "fc2l": 4096,
+        "fc2": 4096,
+        "fc3": 1000,
+        "probs": 1000,
+    }
 
     def __init__(self, config=None):
         super(VGG16Featurizer, self).__init__()
         self.config = config or VGG16FeaturizerConfig.default()
         self.validate(self.config)
         self.vgg16 = None
+        self._preprocessor = None
+
+        for layer in self.config.layers:
+            if layer not in self.LAYER_DIMS:
+                raise ValueError("Unsupported VGG-16 layer '%s'" % layer)
 
     def dim(self):
         '''The dimension of the features extracted by this Featurizer.'''
-        return 4096
+        return self.LAYER_DIMS[self.config.layers[0]]
 
     def _start(self):
         '''Starts a TensorFlow session and loads the network.'''
         if self.vgg16 is None:
             self.vgg16 = VGG16(self.config)
+        if self._preprocessor is None:
+            self._preprocessor = etai.ImageBatchPreprocessor(224, 224)
 
     def _stop(self):
         '''Closes the TensorFlow session and frees up the network.'''
         if self.vgg16:
             self.vgg16.close()
             self.vgg16 = None
+        if self._preprocessor:
+            self._preprocessor.close()
+            self._preprocessor = None
 
     def _featurize(self, img):
         '''Featurizes the input image using VGG-16.
@@ -492,12 +608,25 @@ class VGG16Featurizer(Featurizer):
             img: the input image
 
         Returns:
-            the feature vector, a 1D array of length 4096
+            the feature vector, a 1D array of length `dim()`, or a dictionary
+                of feature vectors if multiple layers were requested
         '''
-        if etai.is_gray(img):
-            img = etai.gray_to_rgb(img)
-        elif etai.has_alpha(img):
-            img = img[:, :, :3]
+        return self._featurize_batch([img])[0]
+
+    def _featurize_batch(self, imgs):
+        '''Featurizes a batch of images using VGG-16 in a single forward
+        pass.
 
-        imgs = [etai.resize(img, 224, 224)]
-        return self.vgg16.evaluate(imgs, layer=self.vgg16.fc2l)[0]
+        The images are converted to RGB and resized to 224 x 224 into a
+        single preallocated float32 tensor before being fed to the network.
+
+        Args:
+            imgs: a list of input images
+
+        Returns:
+            a list of feature vectors (or dictionaries of feature vectors, if
+                multiple layers were requested)
+        '''
+        imgs = self._preprocessor.preprocess(imgs)
+        outputs = self.vgg16.evaluate(imgs, layer=self.config.layers)
+        return unpack_layer_features(self.config.layers, outputs)
@@ -22,6 +22,7 @@ from __future__ import unicode_literals
 from builtins import *
 from future.utils import iteritems
 import six
+from six.moves import queue
 # pragma pylint: enable=redefined-builtin
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
@@ -381,6 +382,24 @@ def uniformly_sample_frames(arg, k, size=None):
     return np.array(imgs)
 
 
+def get_sliding_window_frames(num_frames, k, stride):
+    '''Returns the frame numbers of the clips generated by a sliding window
+    of the given length and stride over a video.
+
+    Args:
+        num_frames: the number of frames in the video
+        k: the size of each window
+        stride: the stride for sliding window
+
+    Returns:
+        an array of size [XXXX, k] containing the 1-based frame numbers of
+            each clip
+    '''
+    delta = np.arange(1, k + 1)
+    offsets = np.array(list(range(0, num_frames + 1 - k, stride)))
+    return offsets[:, np.newaxis] + delta[np.newaxis, :]
+
+
 def sliding_window_sample_frames(arg, k, stride, size=None):
     '''Samples clips from the video using a sliding window of the given
     length and stride.
@@ -400,9 +419,7 @@ def sliding_window_sample_frames(arg, k, stride, size=None):
 
     # Determine clip indices
     num_frames = get_frame_count(arg) if is_video_file else len(arg)
-    delta = np.arange(1, k + 1)
-    offsets = np.array(list(range(0, num_frames + 1 - k, stride)))
-    clip_inds = offsets[:, np.newaxis] + delta[np.newaxis, :]
+    clip_inds = get_sliding_window_frames(num_frames, k, stride)
     frames = list(np.unique(clip_inds))
 
     # Read frames ...
@@ -908,6 +925,146 @@ class OpenCVVideoReader(VideoReader):
         self._cap.release()
 
 
+class BufferedVideoReader(VideoReader):
+    '''Class that wraps another VideoReader and decodes its frames in a
+    background thread into a bounded buffer.
+
+    This allows frame decoding to overlap with whatever processing is
+    performed on the frames by the consumer. For example, a
+    BufferedVideoReader for the next video in a batch can be constructed
+    while the current video is still being processed, so that its first
+    frames are ready as soon as they are needed.
+
+    This class uses 1-based indexing for all frame operations.
+    '''
+
+    def __init__(self, reader, max_buffer_size=16):
+        '''Constructs a new BufferedVideoReader and starts decoding frames.
+
+        Args:
+            reader: the VideoReader instance to read frames from. The reader
+                is closed when this instance is closed
+            max_buffer_size: the maximum number of decoded frames to buffer.
+                The default value is 16
+        '''
+        self._reader = reader
+        super(BufferedVideoReader, self).__init__(reader.inpath, reader.frames)
+        self._queue = queue.Queue(maxsize=max_buffer_size)
+        self._stopped = False
+        self._done = False
+        self._closed = False
+        self._frame_number = -1
+        self._frame_range = (-1, -1)
+        self._is_new_frame_range = False
+
+        self._thread = threading.Thread(target=self._decode)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def frame_number(self):
+        '''The current frame number, or -1 if no frames have been read.'''
+        return self._frame_number
+
+    @property
+    def frame_range(self):
+        '''The (first, last) frames for the current range, or (-1, -1) if no
+        frames have been read.
+        '''
+        return self._frame_range
+
+    @property
+    def is_new_frame_range(self):
+        '''Whether the current frame is the first in a new range.'''
+        return self._is_new_frame_range
+
+    @property
+    def encoding_str(self):
+        '''Return the video encoding string.'''
+        return self._reader.encoding_str
+
+    @property
+    def frame_size(self):
+        '''The (width, height) of each frame.'''
+        return self._reader.frame_size
+
+    @property
+    def frame_rate(self):
+        '''The frame rate.'''
+        return self._reader.frame_rate
+
+    @property
+    def total_frame_count(self):
+        '''The total number of frames in the video.'''
+        return self._reader.total_frame_count
+
+    def read(self):
+        '''Reads the next frame.
+
+        Returns:
+            img: the next frame
+
+        Raises:
+            StopIteration: if there are no more frames to process
+            VideoReaderError: if unable to load the next frame from file
+        '''
+        if self._done:
+            raise StopIteration
+
+        item = self._queue.get()
+        if item is None:
+            self._done = True
+            raise StopIteration
+        if isinstance(item, Exception):
+            self._done = True
+            raise item
+
+        (self._frame_number, self._frame_range, self._is_new_frame_range,
+         img) = item
+        return img
+
+    def close(self):
+        '''Stops the background decoding thread and closes the wrapped
+        reader. Closing an already closed reader has no effect.
+        '''
+        if self._closed:
+            return
+
+        self._closed = True
+        self._stopped = True
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._reader.close()
+
+    def _decode(self):
+        try:
+            for img in self._reader:
+                if not self._put((
+                        self._reader.frame_number,
+                        self._reader.frame_range,
+                        self._reader.is_new_frame_range,
+                        img)):
+                    return
+        except Exception as e:
+            self._put(e)
+            return
+
+        self._put(None)
+
+    def _put(self, item):
+        while not self._stopped:
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+
+        return False
+
+
 class VideoWriter(object):
     '''Base class for writing videos.'''
 
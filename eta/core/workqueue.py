@@ -0,0 +1,605 @@
+'''
+Core infrastructure for running pipeline jobs on multiple nodes via a work
+queue on a shared filesystem.
+
+A WorkQueue is a directory of job tickets that requires no external services.
+Pipelines submit tickets for their ready jobs to the queue, and workers, which
+can run on any node that can access the queue directory, claim tickets by
+atomically renaming them, run the jobs, and write their results back to the
+queue. Workers periodically touch heartbeat files so that the tickets claimed
+by dead workers can be detected and returned to the queue. Heartbeats are
+compared against the modification time of a clock file in the queue directory
+rather than the local time, so the clocks of the nodes need not agree.
+
+A worker whose ticket was returned to the queue while it was still running,
+e.g. because its heartbeats were delayed, reclaims the ticket if it is still
+pending. If another worker has claimed the ticket in the meantime, the
+original worker discards its result. Workers record their results before
+releasing their claims, and a ticket whose result exists is done, so tickets
+are never lost when workers die.
+
+The queue directory has the following layout:
+
+    <queue_dir>/
+        pending/<ticket_id>.json                tickets waiting for a worker
+        claimed/<ticket_id>@<worker_id>.json    tickets claimed by a worker
+        results/<ticket_id>.json                results of finished tickets
+        heartbeats/<worker_id>                  worker heartbeat files
+        clock                                   the queue clock file
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import errno
+import logging
+import os
+import socket
+import threading
+import time
+
+from eta.core.config import Config, Configurable
+import eta.core.job as etaj
+import eta.core.serial as etas
+import eta.core.status as etass
+import eta.core.utils as etau
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue(object):
+    '''A work queue of job tickets backed by a directory on a (possibly
+    shared) filesystem.
+
+    All state transitions of a ticket are performed via atomic renames, so any
+    number of pipelines and workers on any number of nodes can use the same
+    queue concurrently.
+    '''
+
+    def __init__(self, queue_dir):
+        '''Creates a WorkQueue instance.
+
+        Args:
+            queue_dir: the queue directory, which is created if necessary
+        '''
+        self.queue_dir = queue_dir
+        for dirname in ("pending", "claimed", "results", "heartbeats"):
+            etau.ensure_dir(os.path.join(queue_dir, dirname))
+
+    def submit(self, ticket):
+        '''Submits a ticket to the queue.
+
+        Args:
+            ticket: a JSON dictionary describing the work to perform
+
+        Returns:
+            the ID of the ticket
+        '''
+        # Ticket IDs sort in submission order
+        ticket_id = "%.6f-%s" % (time.time(), etau.random_key(8))
+        self._write(self._get_pending_path(ticket_id), ticket)
+        return ticket_id
+
+    def claim(self, worker_id):
+        '''Claims the oldest pending ticket in the queue.
+
+        Args:
+            worker_id: the ID of the worker claiming the ticket
+
+        Returns:
+            a (ticket_id, ticket) tuple, or None if no tickets are pending
+        '''
+        for filename in sorted(os.listdir(self._pending_dir)):
+            if not filename.endswith(".json"):
+                continue  # partially written ticket
+
+            ticket_id = os.path.splitext(filename)[0]
+            if self._has_result(ticket_id):
+                # Requeued after its result was recorded
+                self._remove(self._get_pending_path(ticket_id))
+                continue
+
+            claimed_path = self._get_claimed_path(ticket_id, worker_id)
+            try:
+                os.rename(self._get_pending_path(ticket_id), claimed_path)
+            except OSError as e:
+                if e.errno == errno.ENOENT:
+                    continue  # another worker claimed the ticket first
+                raise
+
+            return ticket_id, etas.read_json(claimed_path)
+
+        return None
+
+    def owns(self, ticket_id, worker_id):
+        '''Returns True/False whether the given worker holds the claim on the
+        given ticket.
+        '''
+        return os.path.isfile(self._get_claimed_path(ticket_id, worker_id))
+
+    def reclaim(self, ticket_id, worker_id):
+        '''Ensures that the given worker holds the claim on the given ticket,
+        reclaiming the ticket if it was returned to the queue.
+
+        Args:
+            ticket_id: the ID of the ticket
+            worker_id: the ID of the worker
+
+        Returns:
+            True/False: if the worker holds the claim on the ticket. False
+                means that another worker has claimed or completed the ticket
+        '''
+        if self._has_result(ticket_id):
+            return False
+
+        if self.owns(ticket_id, worker_id):
+            return True
+
+        try:
+            os.rename(
+                self._get_pending_path(ticket_id),
+                self._get_claimed_path(ticket_id, worker_id))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+
+        logger.info("Worker %s reclaimed ticket %s", worker_id, ticket_id)
+        return True
+
+    def complete(self, ticket_id, worker_id, result):
+        '''Records the result of a claimed ticket.
+
+        The result is only recorded if the worker still holds the claim on
+        the ticket (reclaiming it if it was returned to the queue) and no
+        other worker has recorded a result for it, so each ticket has at most
+        one result. The result is written before the claim is released, so a
+        ticket is never lost if the worker dies in between; a ticket whose
+        result exists is considered done.
+
+        Args:
+            ticket_id: the ID of the ticket
+            worker_id: the ID of the worker that ran the ticket
+            result: a JSON dictionary describing the result
+
+        Returns:
+            True/False: if the result was recorded
+        '''
+        recorded = self.reclaim(ticket_id, worker_id)
+        if recorded:
+            result["worker_id"] = worker_id
+            recorded = self._write(
+                self._get_result_path(ticket_id), result, overwrite=False)
+
+        if not recorded:
+            logger.warning(
+                "Worker %s lost ticket %s to another worker; discarding its "
+                "result", worker_id, ticket_id)
+            return False
+
+        # Release the claim, which may have been requeued in the meantime
+        self._remove(self._get_claimed_path(ticket_id, worker_id))
+        self._remove(self._get_pending_path(ticket_id))
+        return True
+
+    def get_result(self, ticket_id):
+        '''Gets the result of the given ticket, removing it from the queue.
+
+        Args:
+            ticket_id: the ID of the ticket
+
+        Returns:
+            the JSON dictionary describing the result, or None if the ticket
+                has not finished
+        '''
+        result_path = self._get_result_path(ticket_id)
+        if not os.path.isfile(result_path):
+            return None
+
+        result = etas.read_json(result_path)
+
+        # Remove any claims left behind by a worker that died after recording
+        # the result
+        self._remove(self._get_pending_path(ticket_id))
+        for filename in os.listdir(self._claimed_dir):
+            if filename.startswith(ticket_id + "@"):
+                self._remove(os.path.join(self._claimed_dir, filename))
+
+        os.remove(result_path)
+        return result
+
+    def heartbeat(self, worker_id):
+        '''Records a heartbeat for the given worker.'''
+        with open(self._get_heartbeat_path(worker_id), "wt") as f:
+            f.write(etau.get_isotime())
+
+    def remove_heartbeat(self, worker_id):
+        '''Removes the heartbeat file of the given worker.'''
+        try:
+            os.remove(self._get_heartbeat_path(worker_id))
+        except OSError:
+            pass
+
+    def requeue_dead_tickets(self, timeout):
+        '''Returns the tickets claimed by dead workers to the queue.
+
+        A worker is considered dead if its heartbeat file is missing or has
+        not been updated within the given timeout. The age of a heartbeat is
+        measured by the clock of the filesystem on which the queue resides.
+        Claims on tickets whose results have been recorded are released
+        rather than requeued.
+
+        Args:
+            timeout: the heartbeat timeout, in seconds
+
+        Returns:
+            a list of the IDs of the requeued tickets
+        '''
+        requeued = []
+        now = self._get_queue_time()
+        for filename in os.listdir(self._claimed_dir):
+            ticket_id, worker_id = os.path.splitext(filename)[0].split("@", 1)
+            if self._has_result(ticket_id):
+                # The worker died after recording the result
+                self._remove(os.path.join(self._claimed_dir, filename))
+                continue
+
+            try:
+                last_beat = os.path.getmtime(
+                    self._get_heartbeat_path(worker_id))
+            except OSError:
+                last_beat = None
+
+            if last_beat is not None and now - last_beat <= timeout:
+                continue
+
+            try:
+                os.rename(
+                    os.path.join(self._claimed_dir, filename),
+                    self._get_pending_path(ticket_id))
+            except OSError:
+                continue  # completed or requeued by someone else
+
+            logger.warning(
+                "Worker %s appears to be dead; requeued ticket %s",
+                worker_id, ticket_id)
+            requeued.append(ticket_id)
+
+        return requeued
+
+    @property
+    def _pending_dir(self):
+        return os.path.join(self.queue_dir, "pending")
+
+    @property
+    def _claimed_dir(self):
+        return os.path.join(self.queue_dir, "claimed")
+
+    def _get_pending_path(self, ticket_id):
+        return os.path.join(self._pending_dir, ticket_id + ".json")
+
+    def _get_claimed_path(self, ticket_id, worker_id):
+        return os.path.join(
+            self._claimed_dir, "%s@%s.json" % (ticket_id, worker_id))
+
+    def _get_result_path(self, ticket_id):
+        return os.path.join(self.queue_dir, "results", ticket_id + ".json")
+
+    def _get_heartbeat_path(self, worker_id):
+        return os.path.join(self.queue_dir, "heartbeats", worker_id)
+
+    def _get_queue_time(self):
+        # Touches the clock file and returns its modification time, which is
+        # set by the same clock as the modification times of the heartbeats
+        clock_path = os.path.join(self.queue_dir, "clock")
+        with open(clock_path, "at"):
+            os.utime(clock_path, None)
+        return os.path.getmtime(clock_path)
+
+    def _has_result(self, ticket_id):
+        return os.path.isfile(self._get_result_path(ticket_id))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _write(self, path, d, overwrite=True):
+        # Write to a temporary file first so that readers never see partial
+        # files
+        tmp_path = "%s.%s.tmp" % (path, etau.random_key(8))
+        etas.write_json(d, tmp_path)
+        if overwrite:
+            os.rename(tmp_path, path)
+            return True
+
+        # Unlike renaming, linking fails if the file already exists
+        try:
+            os.link(tmp_path, path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            return False
+        finally:
+            os.remove(tmp_path)
+
+        return True
+
+
+def make_job_ticket(
+        job_config, pipeline_name, overwrite=True, file_hasher=None,
+        job_cache=None):
+    '''Makes a WorkQueue ticket for running the given job.
+
+    Args:
+        job_config: a JobConfig instance
+        pipeline_name: the name of the pipeline to which the job belongs
+        overwrite: the overwrite mode of the job. By default, this is True
+        file_hasher: the fully-qualified name of the FileHasher subclass to
+            use to detect config changes. By default, `MD5FileHasher` is used
+        job_cache: an optional JobCache to use when running the job
+
+    Returns:
+        a JSON dictionary describing the ticket
+    '''
+    job = job_config.serialize()
+    job["working_dir"] = os.path.abspath(
+        job_config.working_dir or os.getcwd())
+    ticket = {
+        "pipeline": pipeline_name,
+        "job": job,
+        "overwrite": overwrite,
+        "file_hasher": file_hasher or "eta.core.utils.MD5FileHasher",
+        "job_cache": None,
+    }
+    if job_cache is not None:
+        ticket["job_cache"] = {
+            "cache_dir": job_cache.cache_dir,
+            "full_hash": job_cache.full_hash,
+        }
+
+    return ticket
+
+
+def run_job_ticket(ticket, zygote=None):
+    '''Runs the job described by the given ticket.
+
+    Args:
+        ticket: a ticket generated by `make_job_ticket()`
+        zygote: an optional running JobZygote to use for in-process jobs
+
+    Returns:
+        a JSON dictionary describing the result of the job
+    '''
+    job_config = etaj.JobConfig(ticket["job"])
+    hasher_cls = etau.get_class(ticket["file_hasher"])
+    job_cache = None
+    if ticket["job_cache"]:
+        job_cache = etaj.JobCache(
+            cache_dir=ticket["job_cache"]["cache_dir"],
+            full_hash=ticket["job_cache"]["full_hash"],
+            hasher_cls=hasher_cls)
+
+    pipeline_status = etass.PipelineStatus(ticket["pipeline"])
+    try:
+        ran_job, success = etaj.run(
+            job_config, pipeline_status, overwrite=ticket["overwrite"],
+            zygote=zygote, job_cache=job_cache, hasher_cls=hasher_cls)
+    except Exception:
+        logger.exception("Job %s raised an exception", job_config.name)
+        ran_job, success = True, False
+        if pipeline_status.jobs:
+            pipeline_status.jobs[-1].fail()
+
+    job_status = pipeline_status.jobs[-1] if pipeline_status.jobs else None
+    return {
+        "ran_job": ran_job,
+        "success": success,
+        "job_status": job_status.serialize() if job_status else None,
+    }
+
+
+class WorkerConfig(Config):
+    '''Configuration settings for a Worker.
+
+    Attributes:
+        queue_dir: the WorkQueue directory from which to claim tickets
+        worker_id: a unique ID for the worker. By default, an ID is generated
+            from the hostname and process ID of the worker
+        poll_interval: the time, in seconds, to wait between checks for new
+            tickets when the queue is empty. The default is 1
+        heartbeat_interval: the time, in seconds, between heartbeats. The
+            default is 5
+        heartbeat_timeout: the time, in seconds, after which a worker without
+            a heartbeat is considered dead. The default is 60
+        exit_when_idle: whether to exit when the queue is empty rather than
+            waiting for new tickets. The default is False
+        preload_modules: the modules to preload in the JobZygote that the
+            worker uses to run in-process jobs. By default,
+            `JobZygote.DEFAULT_PRELOAD_MODULES` is used
+    '''
+
+    def __init__(self, d):
+        self.queue_dir = self.parse_string(d, "queue_dir")
+        self.worker_id = self.parse_string(d, "worker_id", default=None)
+        self.poll_interval = self.parse_number(d, "poll_interval", default=1)
+        self.heartbeat_interval = self.parse_number(
+            d, "heartbeat_interval", default=5)
+        self.heartbeat_timeout = self.parse_number(
+            d, "heartbeat_timeout", default=60)
+        self.exit_when_idle = self.parse_bool(
+            d, "exit_when_idle", default=False)
+        self.preload_modules = self.parse_array(
+            d, "preload_modules",
+            default=list(etaj.JobZygote.DEFAULT_PRELOAD_MODULES))
+
+
+class Worker(Configurable):
+    '''A worker that claims job tickets from a WorkQueue and runs them.'''
+
+    def __init__(self, config):
+        '''Creates a Worker instance.
+
+        Args:
+            config: a WorkerConfig instance
+        '''
+        self.validate(config)
+        self.config = config
+        self.worker_id = config.worker_id or "%s-%d" % (
+            socket.gethostname(), os.getpid())
+        self.work_queue = WorkQueue(config.queue_dir)
+
+        self._zygote = None
+        self._stop_event = threading.Event()
+        self._heartbeat_thread = None
+        self._ticket_id = None
+        self._lost_ticket = False
+        self._ticket_lock = threading.Lock()
+
+    def serve(self):
+        '''Claims and runs tickets until the worker is stopped, or until the
+        queue is empty if `exit_when_idle` is True.
+        '''
+        logger.info(
+            "Worker %s serving queue '%s'", self.worker_id,
+            self.config.queue_dir)
+
+        # The zygote must be forked before any threads are started
+        if hasattr(os, "fork"):
+            self._zygote = etaj.JobZygote(
+                preload_modules=self.config.preload_modules)
+            self._zygote.start()
+
+        self.work_queue.heartbeat(self.worker_id)
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat)
+        self._heartbeat_thread.daemon = True
+        self._heartbeat_thread.start()
+
+        try:
+            while not self._stop_event.is_set():
+                self.work_queue.requeue_dead_tickets(
+                    self.config.heartbeat_timeout)
+                claimed = self.work_queue.claim(self.worker_id)
+                if claimed is None:
+                    if self.config.exit_when_idle:
+                        break
+                    self._stop_event.wait(self.config.poll_interval)
+                    continue
+
+                self._run_ticket(*claimed)
+        finally:
+            self._stop_event.set()
+            self._heartbeat_thread.join()
+            self.work_queue.remove_heartbeat(self.worker_id)
+            if self._zygote is not None:
+                self._zygote.stop()
+
+        logger.info("Worker %s exiting", self.worker_id)
+
+    def stop(self):
+        '''Stops the worker after its current ticket (if any) finishes.'''
+        self._stop_event.set()
+
+    def _run_ticket(self, ticket_id, ticket):
+        logger.info(
+            "Worker %s running job %s of pipeline %s (ticket %s)",
+            self.worker_id, ticket["job"]["name"], ticket["pipeline"],
+            ticket_id)
+        with self._ticket_lock:
+            self._ticket_id = ticket_id
+            self._lost_ticket = False
+
+        try:
+            result = run_job_ticket(ticket, zygote=self._zygote)
+        finally:
+            with self._ticket_lock:
+                self._ticket_id = None
+                lost_ticket = self._lost_ticket
+
+        if lost_ticket:
+            logger.warning(
+                "Worker %s discarding the result of lost ticket %s",
+                self.worker_id, ticket_id)
+            return
+
+        self.work_queue.complete(ticket_id, self.worker_id, result)
+
+    def _heartbeat(self):
+        while not self._stop_event.wait(self.config.heartbeat_interval):
+            try:
+                self.work_queue.heartbeat(self.worker_id)
+                self._check_ticket()
+            except EnvironmentError:
+                logger.warning("Failed to write heartbeat")
+
+    def _check_ticket(self):
+        # Reclaims the current ticket if it was returned to the queue, and
+        # marks it as lost if another worker has claimed it
+        with self._ticket_lock:
+            if self._ticket_id is None or self._lost_ticket:
+                return
+
+            if not self.work_queue.reclaim(self._ticket_id, self.worker_id):
+                logger.error(
+                    "Worker %s lost ticket %s to another worker",
+                    self.worker_id, self._ticket_id)
+                self._lost_ticket = True
+
+
+def wait_for_job_ticket(
+        work_queue, ticket_id, heartbeat_timeout=60, poll_interval=1,
+        timeout=None):
+    '''Waits for the given ticket to finish, requeuing the tickets of any
+    dead workers while waiting.
+
+    Args:
+        work_queue: a WorkQueue instance
+        ticket_id: the ID of the ticket
+        heartbeat_timeout: the time, in seconds, after which a worker without
+            a heartbeat is considered dead. The default is 60
+        poll_interval: the time, in seconds, between checks for the result.
+            The default is 1
+        timeout: an optional maximum time, in seconds, to wait for the
+            result. By default, there is no limit
+
+    Returns:
+        the JSON dictionary describing the result of the job
+
+    Raises:
+        WorkQueueTimeoutError: if the ticket did not finish within the given
+            timeout
+    '''
+    start_time = time.time()
+    while True:
+        result = work_queue.get_result(ticket_id)
+        if result is not None:
+            return result
+
+        if timeout is not None and time.time() - start_time > timeout:
+            raise WorkQueueTimeoutError(
+                "Ticket %s did not finish within %g seconds" % (
+                    ticket_id, timeout))
+
+        work_queue.requeue_dead_tickets(heartbeat_timeout)
+        time.sleep(poll_interval)
+
+
+class WorkQueueTimeoutError(Exception):
+    '''Exception raised when a WorkQueue ticket does not finish in time.'''
+    pass
@@ -114,6 +114,7 @@ class ParametersConfig(Config):
         self.frames = self.parse_string(d, "frames", default=None)
 
 
+@etam.shard_data
 def _clip_videos(clip_config):
     for data in clip_config.data:
         frames = _get_frames(data, clip_config.parameters)
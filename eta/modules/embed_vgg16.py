@@ -24,16 +24,16 @@ from builtins import *
 # pragma pylint: enable=unused-wildcard-import
 # pragma pylint: enable=wildcard-import
 
+from contextlib import closing
 import logging
 import sys
 
-import tensorflow as tf
-
 from eta.core.config import Config
 import eta.core.features as etaf
 import eta.core.module as etam
 import eta.core.serial as etas
 import eta.core.vgg16 as etav
+import eta.core.video as etavi
 
 
 logger = logging.getLogger(__name__)
@@ -82,7 +82,7 @@ class ParametersConfig(Config):
 
     def __init__(self, d):
         self.vgg16 = self.parse_object(
-                d, "vgg16", etav.VGG16Config, default=None)
+                d, "vgg16", etav.VGG16FeaturizerConfig, default=None)
         self.crop_box = self.parse_object(
                 d, "crop_box", RectangleConfig, default=None)
 
@@ -103,43 +103,72 @@ class RectangleConfig(Config):
         self.bottom_right = self.parse_object(d, "bottom_right", Point2Config)
 
 
+@etam.shard_data
 def _featurize_driver(config, d):
-    '''For each of the featurizers in the config, creates a VGG16Featurizer and
-    processes the video.
-
-    @todo Note that I need to manually create the configs for the featurizer as
-    I loop through the set of them from this config. This is probably not the
-    cleanest way of doing it, but alas, it is doing it... A better way?
+    '''Embeds each video in the config into the VGG-16 feature space.
 
-    @todo This creates a whole new VGG net for each video, which is not
-    necessary. This could somehow reuse the vgg network instance for each
-    featurizer.
+    A single VideoFramesFeaturizer (and thus a single VGG-16 network) is built
+    and kept alive for all videos, and the frames of the next video are
+    decoded in the background while the current video is being featurized.
     '''
     parameters = config.parameters
-    for data in config.data:
-        # Needed to avoid running out of memory.
-        # The proper fix is reuse the vgg-net across featurizers, but this
-        # works and keeps the VGG16Featurizer easy to understand.
-        tf.reset_default_graph()
-
-        vffcd_ = {"type": "eta.core.vgg16.VGG16Featurizer"}
-        if parameters.vgg16 is None:
-            vffcd_["config"] = {}
-        else:
-            vffcd_["config"] = parameters.vgg16
-
-        vffcd = {
-            "backing_path": data.backing_path,
-            "frame_featurizer": vffcd_,
-        }
-
-        vffc = etaf.VideoFramesFeaturizerConfig(vffcd)
-        vf = etaf.VideoFramesFeaturizer(vffc)
+
+    vffcd_ = {"type": "eta.core.vgg16.VGG16Featurizer"}
+    if parameters.vgg16 is None:
+        vffcd_["config"] = {}
+    else:
+        vffcd_["config"] = parameters.vgg16
+
+    # The backing path of each video is set manually below
+    vffcd = {
+        "backing_path": config.data[0].backing_path if config.data else "/tmp",
+        "backing_manager": "manual",
+        "frame_featurizer": vffcd_,
+    }
+
+    vffc = etaf.VideoFramesFeaturizerConfig(vffcd)
+    with etaf.VideoFramesFeaturizer(vffc) as vf:
         if parameters.crop_box is not None:
             vf.frame_preprocessor = _crop(parameters.crop_box)
+            vf.frame_preprocessor_id = _get_crop_id(parameters.crop_box)
 
         # @todo should frames be a part of the config?
-        vf.featurize(data.video_path)
+        with closing(_prefetch_videos(config.data, vffc.frames)) as videos:
+            for data, reader in videos:
+                logger.info("Embedding video '%s'", data.video_path)
+                vf.update_backing_path(data.backing_path)
+                vf.featurize(
+                    data.video_path, returnX=False, video_reader=reader)
+
+
+def _prefetch_videos(data_list, frames):
+    '''Generates (data, reader) pairs for the given DataConfigs, where each
+    reader is a BufferedVideoReader for the video.
+
+    The reader for the next video is opened (and begins decoding) before the
+    current pair is yielded, so that decoding overlaps featurization. Any
+    readers that are still open when the generator is closed (e.g., because
+    featurization of the current video failed) are closed.
+    '''
+    def _open(data):
+        return etavi.BufferedVideoReader(
+            etavi.FFmpegVideoReader(data.video_path, frames=frames))
+
+    if not data_list:
+        return
+
+    reader = None
+    next_reader = _open(data_list[0])
+    try:
+        for idx, data in enumerate(data_list):
+            reader, next_reader = next_reader, None
+            if idx + 1 < len(data_list):
+                next_reader = _open(data_list[idx + 1])
+            yield data, reader
+    finally:
+        for r in (reader, next_reader):
+            if r is not None:
+                r.close()
 
 
 def _crop(crop_box):
@@ -161,6 +190,15 @@ def _crop(crop_box):
     return crop_image
 
 
+def _get_crop_id(crop_box):
+    '''Returns a string that uniquely identifies the `_crop(crop_box)`
+    preprocessor.
+    '''
+    tl = crop_box.top_left
+    br = crop_box.bottom_right
+    return "crop(%r, %r, %r, %r)" % (tl.x, tl.y, br.x, br.y)
+
+
 def run(config_path, pipeline_config_path=None):
     '''Run the embed_vgg16 module.
 
@@ -143,6 +143,7 @@ class ParametersConfig(Config):
             d, "ffmpeg_out_opts", default=None)
 
 
+@etam.shard_data
 def _format_videos(config):
     parameters = config.parameters
     for data in config.data:
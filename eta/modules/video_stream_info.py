@@ -61,6 +61,7 @@ class DataConfig(Config):
         self.stream_info = self.parse_string(d, "stream_info")
 
 
+@etam.shard_data
 def _get_stream_info(stream_info_config):
     for data_config in stream_info_config.data:
         logger.info("Reading stream info for %s", data_config.video)
@@ -0,0 +1,224 @@
+'''
+Tests for the eta.core.c3d clip featurizer.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import eta
+import eta.core.features as etaf
+import eta.core.image as etai
+import eta.core.video as etav
+
+try:
+    import eta.core.c3d as etac3d
+except ImportError:
+    etac3d = None
+
+
+class _FakeC3D(object):
+
+    num_clips = 0
+
+    def evaluate(self, clips, layer=None):
+        _FakeC3D.num_clips += len(clips)
+        return np.array([np.full(4096, clip.mean()) for clip in clips])
+
+
+def _iter_fake_clips(video_path):
+    # Yields fake sliding window clips whose values depend on the video
+    with open(video_path, "rb") as f:
+        value = len(f.read())
+    for start in range(1, 33, 16):
+        clips = np.arange(start, start + 16, 8)[:, np.newaxis]
+        yield clips[:, 0], clips * value
+
+
+class _FakeVideoReader(object):
+    '''A video reader whose frames are filled with their frame numbers.'''
+
+    def __init__(self, num_frames, frames):
+        self._frames = iter([fn for fn in frames if fn <= num_frames])
+        self.frame_number = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def read(self):
+        self.frame_number = next(self._frames)
+        return np.full((16, 16, 3), self.frame_number, dtype=np.uint8)
+
+
+def _make_featurizer(config):
+    # Replaces the network and the video reader with fakes
+    featurizer = etac3d.VideoClipsFeaturizer(config)
+    featurizer._start = lambda: setattr(featurizer, "c3d", _FakeC3D())
+    featurizer._stop = lambda: setattr(featurizer, "c3d", None)
+    featurizer._iter_sliding_window_clips = _iter_fake_clips
+    return featurizer
+
+
+@unittest.skipIf(etac3d is None, "TensorFlow is not installed")
+class VideoClipsFeaturizerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._cache_dir = eta.config.cache_dir
+        eta.config.cache_dir = os.path.join(self.tmp_dir, "cache")
+
+        _FakeC3D.num_clips = 0
+        self.featurizer = _make_featurizer(
+            etac3d.VideoClipsFeaturizerConfig.from_dict(
+                {"backing_path": os.path.join(self.tmp_dir, "clips")}))
+
+    def tearDown(self):
+        eta.config.cache_dir = self._cache_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_video(self, dirname, contents):
+        path = os.path.join(self.tmp_dir, dirname, "video.mp4")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(contents)
+        return path
+
+    def test_backing_paths_do_not_collide(self):
+        path1 = self._write_video("a", b"video")
+        path2 = self._write_video("b", b"other video")
+        self.assertNotEqual(
+            self.featurizer.get_backing_path(path1),
+            self.featurizer.get_backing_path(path2))
+        self.assertEqual(
+            self.featurizer.get_backing_path(path1),
+            self.featurizer.get_backing_path(path1))
+
+        config = etac3d.VideoClipsFeaturizerConfig.from_dict({
+            "backing_path": self.featurizer.config.backing_path,
+            "stride": 4,
+        })
+        self.assertNotEqual(
+            self.featurizer.get_backing_path(path1),
+            _make_featurizer(config).get_backing_path(path1))
+
+    def test_clip_features(self):
+        path1 = self._write_video("a", b"video")
+        path2 = self._write_video("b", b"other video")
+
+        clip_features = self.featurizer.get_clip_features(path1)
+        self.assertIsInstance(clip_features, etaf.ClipFeatures)
+        np.testing.assert_array_equal(
+            clip_features.start_frames, [1, 9, 17, 25])
+        self.assertEqual(_FakeC3D.num_clips, 4)
+
+        # Stored features are reused
+        self.featurizer.get_clip_features(path1)
+        self.assertEqual(_FakeC3D.num_clips, 4)
+
+        # Videos with the same name get their own features
+        other = self.featurizer.get_clip_features(path2)
+        self.assertEqual(_FakeC3D.num_clips, 8)
+        self.assertFalse(np.array_equal(other.X, clip_features.X))
+
+    def test_featurize_returns_vector(self):
+        path = self._write_video("a", b"video")
+        v = self.featurizer.featurize(path)
+        self.assertEqual(v.shape, (self.featurizer.dim(),))
+        self.assertAlmostEqual(np.linalg.norm(v), 1.0, places=5)
+        np.testing.assert_allclose(
+            v, self.featurizer.get_clip_features(path).aggregate(1, 40))
+
+
+
+@unittest.skipIf(etac3d is None, "TensorFlow is not installed")
+class SlidingWindowClipsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.tmp_dir, "video.mp4")
+        with open(self.video_path, "wb") as f:
+            f.write(b"video")
+
+        self._get_frame_count = etav.get_frame_count
+        self._video_reader_cls = etav.FFmpegVideoReader
+
+    def tearDown(self):
+        etav.get_frame_count = self._get_frame_count
+        etav.FFmpegVideoReader = self._video_reader_cls
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_featurizer(self, num_frames, reported_num_frames=None):
+        # Replaces the video with one that has `num_frames` frames, although
+        # its metadata reports `reported_num_frames` frames
+        etav.get_frame_count = lambda path: reported_num_frames or num_frames
+        etav.FFmpegVideoReader = lambda path, frames=None: _FakeVideoReader(
+            num_frames, frames)
+
+        config = etac3d.VideoClipsFeaturizerConfig.from_dict({
+            "backing_path": os.path.join(self.tmp_dir, "clips"),
+            "stride": 4,
+            "max_batch_clips": 2,
+        })
+        featurizer = etac3d.VideoClipsFeaturizer(config)
+        featurizer._start = lambda: setattr(featurizer, "c3d", _FakeC3D())
+        featurizer._stop = lambda: setattr(featurizer, "c3d", None)
+        featurizer._preprocessor = etai.ImageBatchPreprocessor(
+            112, 112, num_threads=1)
+        self.addCleanup(featurizer._preprocessor.close)
+        return featurizer
+
+    def _iter_clips(self, featurizer):
+        start_frames = []
+        for chunk_start_frames, clips in featurizer._iter_sliding_window_clips(
+                self.video_path):
+            self.assertLessEqual(len(clips), 2)
+            for start_frame, clip in zip(chunk_start_frames, clips):
+                np.testing.assert_array_equal(
+                    clip[:, 0, 0, 0], np.arange(start_frame, start_frame + 16))
+            start_frames.extend(chunk_start_frames)
+        return start_frames
+
+    def test_clips(self):
+        featurizer = self._make_featurizer(28)
+        self.assertEqual(self._iter_clips(featurizer), [1, 5, 9, 13])
+
+    def test_video_shorter_than_one_clip(self):
+        featurizer = self._make_featurizer(10)
+        self.assertEqual(self._iter_clips(featurizer), [])
+
+        with self.assertRaises(ValueError):
+            featurizer.get_clip_features(self.video_path)
+        with self.assertRaises(ValueError):
+            featurizer.featurize(self.video_path)
+
+    def test_video_shorter_than_reported(self):
+        featurizer = self._make_featurizer(24, reported_num_frames=40)
+        self.assertEqual(self._iter_clips(featurizer), [1, 5, 9])
+
+        featurizer = self._make_featurizer(10, reported_num_frames=40)
+        self.assertEqual(self._iter_clips(featurizer), [])
+
+if __name__ == "__main__":
+    unittest.main()
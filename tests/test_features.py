@@ -0,0 +1,623 @@
+'''
+Tests for the eta.core.features featurizers and feature tools.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import eta
+import eta.core.features as etaf
+import eta.core.utils as etau
+import eta.core.video as etav
+
+
+class FakeVideoReader(object):
+    '''A video reader that yields the given in-memory frames.'''
+
+    def __init__(self, imgs, frames=None):
+        self.imgs = imgs
+        if not frames or frames == "*":
+            frames = "1-%d" % len(imgs)
+        self.frames = frames
+        self.frame_number = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        for frame_number in etav.FrameRanges.from_str(self.frames).to_list():
+            self.frame_number = frame_number
+            yield self.imgs[frame_number - 1]
+
+
+def _make_frames(num_frames, seed=0):
+    # Frames whose left halves are static and whose right halves are noise
+    rng = np.random.RandomState(seed)
+    base = (rng.rand(160, 160, 3) * 255).astype(np.uint8)
+    imgs = []
+    for _ in range(num_frames):
+        img = base.copy()
+        img[:, 80:] = (rng.rand(160, 80, 3) * 255).astype(np.uint8)
+        imgs.append(img)
+    return imgs
+
+
+def _crop_left(img):
+    return img[:, :80]
+
+
+class _CountingFeaturizer(etaf.Featurizer):
+    '''Featurizes a file as a vector containing its length, and records the
+    batches that it featurizes.
+    '''
+
+    def __init__(self):
+        super(_CountingFeaturizer, self).__init__()
+        self.batches = []
+
+    def dim(self):
+        return 2
+
+    def _featurize(self, path):
+        self.batches.append([path])
+        return self._featurize_path(path)
+
+    def _featurize_batch(self, paths):
+        self.batches.append(list(paths))
+        return [self._featurize_path(path) for path in paths]
+
+    @staticmethod
+    def _featurize_path(path):
+        with open(path, "rb") as f:
+            return np.array([len(f.read()), 1.0])
+
+
+class _Classifier(etaf.CanFeaturize):
+
+    @etaf.CanFeaturize.featurize_if_needed
+    def predict(self, X):
+        return X
+
+
+class CanFeaturizeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for idx in range(3):
+            path = os.path.join(self.tmp_dir, "%d.txt" % idx)
+            with open(path, "wb") as f:
+                f.write(b"x" * (idx + 1))
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_memoized_paths_are_not_refeaturized(self):
+        featurizer = _CountingFeaturizer()
+        classifier = _Classifier(
+            featurizer=featurizer, feature_cache_size=10)
+
+        X = classifier.predict(self.paths[:2])
+        np.testing.assert_array_equal(X, [[1, 1], [2, 1]])
+        X = classifier.predict(self.paths)
+        np.testing.assert_array_equal(X, [[1, 1], [2, 1], [3, 1]])
+        self.assertEqual(featurizer.batches, [self.paths[:2], self.paths[2:]])
+
+        # Changed files are refeaturized
+        with open(self.paths[0], "wb") as f:
+            f.write(b"xxxx")
+        os.utime(self.paths[0], (0, 0))
+        np.testing.assert_array_equal(
+            classifier.predict(self.paths[0]), [4, 1])
+        self.assertEqual(len(featurizer.batches), 3)
+
+    def test_memoization_evicts_least_recently_used(self):
+        featurizer = _CountingFeaturizer()
+        classifier = _Classifier(featurizer=featurizer, feature_cache_size=2)
+
+        classifier.predict(self.paths[:2])
+        classifier.predict(self.paths[0])  # mark as recently used
+        classifier.predict(self.paths[2])  # evicts paths[1]
+        classifier.predict(self.paths[:2])
+        self.assertEqual(featurizer.batches, [
+            self.paths[:2], self.paths[2:], self.paths[1:2]])
+
+    def test_without_memoization(self):
+        featurizer = _CountingFeaturizer()
+        classifier = _Classifier(featurizer=featurizer)
+        classifier.predict(self.paths)
+        classifier.predict(self.paths)
+        self.assertEqual(featurizer.batches, [self.paths, self.paths])
+
+    def test_video_lists_are_featurized_separately(self):
+        videos = {"a.mp4": _make_frames(3, seed=0)}
+        videos["b.mp4"] = _make_frames(5, seed=1)
+        video_paths = []
+        for name in sorted(videos):
+            video_paths.append(os.path.join(self.tmp_dir, name))
+            with open(video_paths[-1], "wb") as f:
+                f.write(b"video")
+
+        vff = etaf.VideoFramesFeaturizer(
+            etaf.VideoFramesFeaturizerConfig.from_dict({
+                "backing_path": self.tmp_dir,
+                "frame_featurizer": {
+                    "type": "eta.core.features.ORBFeaturizer"},
+            }))
+        classifier = _Classifier(featurizer=vff, feature_cache_size=10)
+
+        reader_cls = etaf.etav.FFmpegVideoReader
+        etaf.etav.FFmpegVideoReader = lambda path, frames: FakeVideoReader(
+            videos[os.path.basename(path)])
+        try:
+            Xs = classifier.predict(video_paths)
+        finally:
+            etaf.etav.FFmpegVideoReader = reader_cls
+
+        self.assertIsInstance(Xs, list)
+        self.assertEqual([len(X) for X in Xs], [3, 5])
+        with etaf.ORBFeaturizer() as orb:
+            for path, X in zip(video_paths, Xs):
+                imgs = videos[os.path.basename(path)]
+                for img, v in zip(imgs, X):
+                    np.testing.assert_array_equal(orb.featurize(img), v)
+
+
+class VideoFramesFeaturizerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_featurizer(self, **kwargs):
+        d = {
+            "backing_path": self.tmp_dir,
+            "frame_featurizer": {"type": "eta.core.features.ORBFeaturizer"},
+        }
+        d.update(kwargs)
+        return etaf.VideoFramesFeaturizer(
+            etaf.VideoFramesFeaturizerConfig.from_dict(d))
+
+    def test_duplicates_are_judged_after_preprocessing(self):
+        imgs = _make_frames(6)
+
+        vff = self._make_featurizer(skip_duplicate_frames=True)
+        vff.featurize("video.mp4", video_reader=FakeVideoReader(imgs))
+        self.assertEqual(vff.num_skipped_frames, 0)
+
+        vff = self._make_featurizer(skip_duplicate_frames=True)
+        vff.frame_preprocessor = _crop_left
+        X = vff.featurize("video.mp4", video_reader=FakeVideoReader(imgs))
+        self.assertEqual(vff.num_featurized_frames, 1)
+        self.assertEqual(vff.num_skipped_frames, 5)
+        self.assertEqual(X.shape[0], 6)
+        for idx in range(1, 6):
+            np.testing.assert_array_equal(X[idx], X[0])
+
+    def test_frames_are_featurized_in_batches(self):
+        batch_sizes = []
+        featurize_batch = etaf.ORBFeaturizer._featurize_batch
+
+        def _featurize_batch(featurizer, imgs):
+            batch_sizes.append(len(imgs))
+            return featurize_batch(featurizer, imgs)
+
+        imgs = _make_frames(10)
+        etaf.ORBFeaturizer._featurize_batch = _featurize_batch
+        try:
+            X = self._make_featurizer(
+                backing_manager="manual", batch_size=4).featurize(
+                    "video.mp4", video_reader=FakeVideoReader(imgs))
+        finally:
+            etaf.ORBFeaturizer._featurize_batch = featurize_batch
+
+        self.assertEqual(batch_sizes, [4, 4, 2])
+        with etaf.ORBFeaturizer() as orb:
+            for img, v in zip(imgs, X):
+                np.testing.assert_array_equal(orb.featurize(img), v)
+
+    def test_batches_reuse_existing_features_and_duplicates(self):
+        imgs = _make_frames(3)
+        imgs = [imgs[0], imgs[0], imgs[1], imgs[1], imgs[2]]
+        vff = self._make_featurizer(
+            backing_manager="manual", batch_size=8,
+            skip_duplicate_frames=True)
+        X = vff.featurize(
+            "video.mp4", frames="1-3",
+            video_reader=FakeVideoReader(imgs[:3]))
+        self.assertEqual(vff.num_featurized_frames, 2)
+        self.assertEqual(vff.num_skipped_frames, 1)
+
+        X = vff.featurize("video.mp4", video_reader=FakeVideoReader(imgs))
+        self.assertEqual(vff.num_featurized_frames, 1)
+        self.assertEqual(vff.num_skipped_frames, 1)
+        self.assertEqual(
+            sorted(os.listdir(self.tmp_dir)),
+            ["%08d.npz" % idx for idx in range(1, 6)])
+        np.testing.assert_array_equal(X[0], X[1])
+        np.testing.assert_array_equal(X[2], X[3])
+        self.assertFalse(np.array_equal(X[1], X[2]))
+
+    def test_cache_requires_preprocessor_id(self):
+        video_path = os.path.join(self.tmp_dir, "video.mp4")
+        with open(video_path, "wb") as f:
+            f.write(b"video")
+        imgs = _make_frames(2)
+
+        vff = self._make_featurizer(backing_manager="cache")
+        vff.frame_preprocessor = _crop_left
+        with self.assertRaises(etaf.VideoFramesFeaturizerError):
+            vff.featurize(video_path, video_reader=FakeVideoReader(imgs))
+
+        vff.frame_preprocessor_id = "crop-left"
+        vff.featurize(video_path, video_reader=FakeVideoReader(imgs))
+        key = vff._backing_manager_cache_last_key
+
+        # Setting a new preprocessor resets its ID
+        vff.frame_preprocessor = _crop_left
+        self.assertIsNone(vff.frame_preprocessor_id)
+        vff.frame_preprocessor_id = "crop-right"
+        vff.featurize(video_path, video_reader=FakeVideoReader(imgs))
+        self.assertNotEqual(vff._backing_manager_cache_last_key, key)
+
+    def _featurize_video(self, vff, imgs):
+        # Featurizes a fake video, including in any forked workers
+        reader_cls = etav.FFmpegVideoReader
+        get_frame_count = etav.get_frame_count
+        etav.FFmpegVideoReader = lambda path, frames: FakeVideoReader(
+            imgs, frames=frames)
+        etav.get_frame_count = lambda path: len(imgs)
+        video_path = os.path.join(self.tmp_dir, "video.mp4")
+        with open(video_path, "wb") as f:
+            f.write(b"video")
+        try:
+            return vff.featurize(video_path)
+        finally:
+            etav.FFmpegVideoReader = reader_cls
+            etav.get_frame_count = get_frame_count
+
+    @unittest.skipIf(etau.get_fork_context() is None, "requires fork()")
+    def test_parallel_matches_serial(self):
+        imgs = _make_frames(7)
+        serial_dir = os.path.join(self.tmp_dir, "serial")
+        parallel_dir = os.path.join(self.tmp_dir, "parallel")
+
+        serial = self._make_featurizer(
+            backing_manager="manual", backing_path=serial_dir)
+        X = self._featurize_video(serial, imgs)
+        parallel = self._make_featurizer(
+            backing_manager="manual", backing_path=parallel_dir, workers=3)
+        Y = self._featurize_video(parallel, imgs)
+
+        np.testing.assert_array_equal(X, Y)
+        self.assertEqual(
+            sorted(os.listdir(serial_dir)), sorted(os.listdir(parallel_dir)))
+        for frame_number in range(1, 8):
+            np.testing.assert_array_equal(
+                serial.retrieve_featurized_frame(frame_number),
+                parallel.retrieve_featurized_frame(frame_number))
+        self.assertEqual(parallel.num_featurized_frames, 7)
+        self.assertEqual(parallel.num_skipped_frames, 0)
+
+    @unittest.skipIf(etau.get_fork_context() is None, "requires fork()")
+    def test_parallel_uses_preprocessor_and_records_stats(self):
+        imgs = _make_frames(6)
+        vff = self._make_featurizer(
+            backing_manager="cache", workers=2, skip_duplicate_frames=True)
+        vff.frame_preprocessor = _crop_left
+        vff.frame_preprocessor_id = "crop-left"
+        X = self._featurize_video(vff, imgs)
+
+        # Duplicate detection restarts at the first frame of each shard
+        self.assertEqual(vff.num_featurized_frames, 2)
+        self.assertEqual(vff.num_skipped_frames, 4)
+        with etaf.ORBFeaturizer() as orb:
+            v = orb.featurize(_crop_left(imgs[0]))
+        for x in X:
+            np.testing.assert_array_equal(x, v)
+
+    def test_parallel_falls_back_to_serial_without_fork(self):
+        imgs = _make_frames(3)
+        vff = self._make_featurizer(backing_manager="manual", workers=2)
+        get_fork_context = etau.get_fork_context
+        etau.get_fork_context = lambda: None
+        try:
+            X = self._featurize_video(vff, imgs)
+        finally:
+            etau.get_fork_context = get_fork_context
+
+        self.assertEqual(X.shape[0], 3)
+        self.assertEqual(vff.num_featurized_frames, 3)
+
+
+class ORBFeaturizerTests(unittest.TestCase):
+
+    def test_fixed_length(self):
+        config = etaf.ORBFeaturizerConfig.from_dict({"num_keypoints": 16})
+        with etaf.ORBFeaturizer(config) as orb:
+            blank = orb.featurize(np.zeros((64, 64, 3), dtype=np.uint8))
+            v = orb.featurize(_make_frames(1)[0])
+
+        self.assertEqual(orb.dim(), 33 * 16)
+        self.assertEqual(blank.shape, (orb.dim(),))
+        self.assertFalse(np.any(blank))
+        _, mask = etaf.split_orb_features(v, 16)
+        self.assertTrue(np.any(mask))
+
+    def test_num_keypoints_is_deprecated(self):
+        config = etaf.ORBFeaturizerConfig.from_dict({"num_keypoints": 16})
+        img = _make_frames(1)[0]
+        with etaf.ORBFeaturizer(config) as orb:
+            v = orb.featurize(img)
+
+        for orb in (
+                etaf.ORBFeaturizer(16), etaf.ORBFeaturizer(num_keypoints=16)):
+            self.assertEqual(orb.config.num_keypoints, 16)
+            self.assertEqual(orb.dim(), 33 * 16)
+            with orb:
+                np.testing.assert_array_equal(orb.featurize(img), v)
+
+        with self.assertRaises(ValueError):
+            etaf.ORBFeaturizer(config, num_keypoints=16)
+
+    def test_thread_pool_is_created_lazily(self):
+        config = etaf.ORBFeaturizerConfig.from_dict({"num_threads": 2})
+        imgs = _make_frames(3)
+        orb = etaf.ORBFeaturizer(config)
+        orb.start()
+        try:
+            orb.featurize(imgs[0])
+            self.assertIsNone(orb._pool)
+            batch = orb.featurize_batch(imgs)
+            self.assertIsNotNone(orb._pool)
+        finally:
+            orb.stop()
+
+        self.assertIsNone(orb._pool)
+        for img, v in zip(imgs, batch):
+            np.testing.assert_array_equal(orb.featurize(img), v)
+
+
+class FeatureCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.tmp_dir, "video.mp4")
+        with open(self.video_path, "wb") as f:
+            f.write(b"video")
+
+        self._cache_dir = eta.config.cache_dir
+        eta.config.cache_dir = os.path.join(self.tmp_dir, "cache")
+
+    def tearDown(self):
+        eta.config.cache_dir = self._cache_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_make_key(self):
+        key = etaf.FeatureCache.make_key(self.video_path, {"a": 1}, "p")
+        self.assertEqual(
+            key, etaf.FeatureCache.make_key(self.video_path, {"a": 1}, "p"))
+        self.assertNotEqual(
+            key, etaf.FeatureCache.make_key(self.video_path, {"a": 2}, "p"))
+        self.assertNotEqual(
+            key, etaf.FeatureCache.make_key(self.video_path, {"a": 1}, "q"))
+
+        with open(self.video_path, "wb") as f:
+            f.write(b"other video")
+        self.assertNotEqual(
+            key, etaf.FeatureCache.make_key(self.video_path, {"a": 1}, "p"))
+
+    def test_make_key_reuses_video_hash(self):
+        etaf.FeatureCache.make_key(self.video_path, {})
+        self.assertTrue(os.path.isfile(
+            etau.MD5FileHasher.get_cache_path(self.video_path)))
+
+        hash_fcn = etau.MD5FileHasher.__dict__["make_hash"]
+        etau.MD5FileHasher.make_hash = staticmethod(lambda: 1 / 0)
+        try:
+            etaf.FeatureCache.make_key(self.video_path, {})
+        finally:
+            etau.MD5FileHasher.make_hash = hash_fcn
+
+
+class FeatureCodecTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+
+        # Features that lie in a 16-dimensional subspace
+        self.X = np.dot(rng.randn(400, 16), rng.randn(16, 64)).astype(
+            np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_codec(self, **kwargs):
+        d = {"num_components": 16}
+        d.update(kwargs)
+        codec = etaf.FeatureCodec(etaf.FeatureCodecConfig.from_dict(d))
+        codec.train(self.X, seed=0)
+        return codec
+
+    def _relative_error(self, codec, X):
+        X_approx = codec.decode(codec.encode(X))
+        return np.linalg.norm(X - X_approx) / np.linalg.norm(X)
+
+    def test_round_trip(self):
+        codec = self._make_codec()
+        codes = codec.encode(self.X)
+        self.assertEqual(codes.dtype, np.float16)
+        self.assertEqual(codes.shape, (400, 16))
+        self.assertLess(self._relative_error(codec, self.X), 1e-2)
+        self.assertEqual(codec.compression_ratio(), 8.0)
+
+    def test_round_trip_pq(self):
+        codec = self._make_codec(
+            use_pq=True, num_subvectors=4, num_codewords=16)
+        codes = codec.encode(self.X)
+        self.assertEqual(codes.shape, (400, 4))
+        self.assertLess(self._relative_error(codec, self.X), 0.7)
+        self.assertEqual(codec.compression_ratio(), 64.0)
+
+    def test_save_load(self):
+        for kwargs in ({}, {"use_pq": True, "num_subvectors": 4}):
+            codec = self._make_codec(**kwargs)
+            path = os.path.join(self.tmp_dir, "codec.npz")
+            codec.save(path)
+            loaded = etaf.FeatureCodec.load(path)
+
+            self.assertEqual(loaded.config.use_pq, codec.config.use_pq)
+            codes = codec.encode(self.X[:10])
+            np.testing.assert_array_equal(loaded.encode(self.X[:10]), codes)
+            np.testing.assert_allclose(
+                loaded.decode(codes), codec.decode(codes), rtol=1e-6)
+
+    def test_video_frames_featurizer_returns_decoded_features(self):
+        vff_config = {
+            "backing_path": self.tmp_dir,
+            "backing_manager": "manual",
+            "frame_featurizer": {"type": "eta.core.features.ORBFeaturizer"},
+        }
+        imgs = _make_frames(4)
+        vff = etaf.VideoFramesFeaturizer(
+            etaf.VideoFramesFeaturizerConfig.from_dict(vff_config))
+        X = vff.featurize("video.mp4", video_reader=FakeVideoReader(imgs))
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+
+        codec = etaf.FeatureCodec(etaf.FeatureCodecConfig.from_dict(
+            {"num_components": 4}))
+        codec.train(X)
+        codec_path = os.path.join(self.tmp_dir, "codec", "codec.npz")
+        codec.save(codec_path)
+
+        vff_config["feature_codec_path"] = codec_path
+        vff = etaf.VideoFramesFeaturizer(
+            etaf.VideoFramesFeaturizerConfig.from_dict(vff_config))
+        X_computed = vff.featurize(
+            "video.mp4", video_reader=FakeVideoReader(imgs))
+        X_read = vff.featurize(
+            "video.mp4", video_reader=FakeVideoReader(imgs))
+        np.testing.assert_array_equal(X_computed, X_read)
+        np.testing.assert_allclose(
+            X_computed, codec.decode(codec.encode(X)), rtol=1e-5, atol=1e-3)
+
+
+class ClipFeaturesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.start_frames = np.array([1, 9, 17, 25, 33])
+        self.X = rng.randn(5, 8).astype(np.float32)
+
+        # Clips are sorted by start frame
+        order = rng.permutation(5)
+        self.clip_features = etaf.ClipFeatures(
+            self.start_frames[order], self.X[order], 16)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sorted(self):
+        self.assertEqual(len(self.clip_features), 5)
+        np.testing.assert_array_equal(
+            self.clip_features.start_frames, self.start_frames)
+        np.testing.assert_array_equal(self.clip_features.X, self.X)
+
+    def test_get_clip_range(self):
+        # Clips [9, 24] and [17, 32] lie within frames 5-33
+        self.assertEqual(self.clip_features.get_clip_range(5, 33), (1, 3))
+
+        # Clips [1, 16] through [33, 48] overlap frames 5-33
+        self.assertEqual(
+            self.clip_features.get_clip_range(5, 33, contained=False),
+            (0, 5))
+
+        self.assertEqual(self.clip_features.get_clip_range(2, 10), (1, 1))
+
+    def test_aggregate(self):
+        v = self.clip_features.aggregate(5, 33, normalize=False)
+        np.testing.assert_allclose(v, np.mean(self.X[1:3], axis=0), rtol=1e-5)
+
+        v = self.clip_features.aggregate(1, 48)
+        expected = np.mean(self.X, axis=0)
+        np.testing.assert_allclose(
+            v, expected / np.linalg.norm(expected), rtol=1e-5)
+        self.assertEqual(v.dtype, np.float32)
+
+        self.assertIsNone(self.clip_features.aggregate(2, 10))
+
+    def test_write_read(self):
+        path = os.path.join(self.tmp_dir, "video.clips.npz")
+        self.clip_features.write(path)
+        clip_features = etaf.ClipFeatures.read(path)
+        self.assertEqual(clip_features.clip_length, 16)
+        np.testing.assert_array_equal(
+            clip_features.start_frames, self.start_frames)
+        np.testing.assert_array_equal(clip_features.X, self.X)
+
+
+class FeatureReducerTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.randn(23, 5).astype(np.float32)
+        self.chunks = [self.X[:7], self.X[7:8], self.X[8:20], self.X[20:]]
+
+    def _reduce(self, reducer):
+        for X in self.chunks:
+            reducer.update(X)
+        return reducer.result()
+
+    def test_empty(self):
+        self.assertIsNone(etaf.MeanFeatureReducer().result())
+        self.assertIsNone(etaf.MaxFeatureReducer().result())
+        self.assertIsNone(etaf.WindowedMeanFeatureReducer(4).result())
+
+    def test_mean(self):
+        mean = self._reduce(etaf.MeanFeatureReducer())
+        np.testing.assert_allclose(mean, np.mean(self.X, axis=0), rtol=1e-5)
+
+    def test_max(self):
+        maximum = self._reduce(etaf.MaxFeatureReducer())
+        np.testing.assert_array_equal(maximum, np.max(self.X, axis=0))
+        self.assertFalse(np.may_share_memory(maximum, self.X))
+
+    def test_windowed_mean(self):
+        means = self._reduce(etaf.WindowedMeanFeatureReducer(5))
+        expected = [
+            np.mean(self.X[idx:idx + 5], axis=0) for idx in range(0, 23, 5)]
+        self.assertEqual(means.shape, (5, 5))
+        np.testing.assert_allclose(means, expected, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+'''
+Tests for the eta.core.featurizer_server FeaturizerServer and
+RemoteFeaturizer.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+from multiprocessing import AuthenticationError
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+import eta.core.features as etaf
+import eta.core.featurizer_server as etafs
+
+
+ORB_TYPE = "eta.core.features.ORBFeaturizer"
+
+
+def _make_imgs(num_imgs):
+    rng = np.random.RandomState(0)
+    return [
+        (rng.rand(160, 160, 3) * 255).astype(np.uint8)
+        for _ in range(num_imgs)]
+
+
+@unittest.skipIf(not hasattr(socket, "AF_UNIX"), "requires Unix sockets")
+class FeaturizerServerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmp_dir, "eta", "server.sock")
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_server(self):
+        server = etafs.FeaturizerServer(
+            etafs.FeaturizerServerConfig.from_dict({
+                "address": self.address,
+                "authkey": "secret",
+                "featurizer_types": [ORB_TYPE],
+            }))
+        self.servers.append(server)
+        return server
+
+    def _start_server(self):
+        server = self._make_server()
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        # Wait for the server to listen
+        for _ in range(100):
+            if server._listener is not None:
+                break
+            time.sleep(0.05)
+        return server
+
+    def _make_remote(self, authkey="secret"):
+        return etafs.RemoteFeaturizer(
+            etafs.RemoteFeaturizerConfig.from_dict({
+                "featurizer": {"type": ORB_TYPE},
+                "address": self.address,
+                "authkey": authkey,
+            }))
+
+    def test_round_trip(self):
+        self._start_server()
+        imgs = _make_imgs(3)
+        with self._make_remote() as remote:
+            self.assertEqual(remote.dim(), etaf.ORBFeaturizer().dim())
+            v = remote.featurize(imgs[0])
+            vs = remote.featurize_batch(imgs)
+
+        with etaf.ORBFeaturizer() as orb:
+            np.testing.assert_array_equal(v, orb.featurize(imgs[0]))
+            for img, v in zip(imgs, vs):
+                np.testing.assert_array_equal(v, orb.featurize(img))
+
+    def test_socket_permissions(self):
+        self._start_server()
+        mode = os.stat(os.path.dirname(self.address)).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o700)
+        mode = os.stat(self.address).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o600)
+
+    def test_wrong_authkey_is_rejected(self):
+        server = self._start_server()
+        with self.assertRaises(AuthenticationError):
+            self._make_remote(authkey="wrong").start()
+
+        # The server keeps serving other clients
+        with self._make_remote() as remote:
+            remote.dim()
+        self.assertEqual(len(server._workers), 1)
+
+    def test_non_whitelisted_type_is_rejected(self):
+        server = self._start_server()
+        with self._make_remote() as remote:
+            remote._featurizer_dict = {
+                "type": "eta.core.features.VideoFramesFeaturizer"}
+            with self.assertRaises(etafs.FeaturizerServerError):
+                remote.featurize(_make_imgs(1)[0])
+
+        self.assertEqual(server._workers, {})
+
+    def test_stale_socket_is_removed(self):
+        os.makedirs(os.path.dirname(self.address))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.address)
+        sock.close()  # leaves the socket file behind
+
+        self._start_server()
+        with self._make_remote() as remote:
+            remote.dim()
+
+    def test_live_socket_is_not_removed(self):
+        self._start_server()
+        with self.assertRaises(etafs.FeaturizerServerError):
+            self._make_server().serve_forever()
+
+        with self._make_remote() as remote:
+            remote.dim()
+
+
+if __name__ == "__main__":
+    unittest.main()
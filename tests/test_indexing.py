@@ -0,0 +1,117 @@
+'''
+Tests for the eta.core.indexing and eta.core.numutils quantization tools.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import eta.core.indexing as etai
+import eta.core.numutils as etan
+
+
+class ProductQuantizerTests(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.X = rng.randn(300, 16).astype(np.float32)
+        self.pq = etan.ProductQuantizer(num_subvectors=4, num_codewords=16)
+        self.pq.train(self.X, seed=0)
+
+    def test_distances_match_decoded_vectors(self):
+        codes = self.pq.encode(self.X[:50])
+        q = self.X[100]
+        dists = self.pq.compute_distances(q, codes)
+        expected = etan.squared_distances(
+            q[np.newaxis, :], self.pq.decode(codes))[0]
+        self.assertEqual(dists.shape, (50,))
+        np.testing.assert_allclose(dists, expected, rtol=1e-4, atol=1e-4)
+
+    def test_codes_use_smallest_dtype(self):
+        codes = self.pq.encode(self.X[:10])
+        self.assertEqual(codes.dtype, np.uint8)
+        self.assertEqual(codes.shape, (10, 4))
+
+
+class VectorIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        self.X = rng.randn(500, 16).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_index(self, use_pq):
+        config = etai.VectorIndexConfig.from_dict({
+            "num_lists": 32,
+            "num_probes": 32,
+            "use_pq": use_pq,
+            "num_subvectors": 4,
+            "num_codewords": 16,
+        })
+        index = etai.VectorIndex(config)
+        index.train(self.X, seed=0)
+        return index
+
+    def _check_save_load_with_empty_lists(self, use_pq):
+        index = self._make_index(use_pq)
+        Y = self.X[:5]
+        index.add(Y)
+        num_nonempty = sum(1 for ids in index._list_ids if ids)
+        self.assertLess(num_nonempty, 32)
+
+        path = os.path.join(self.tmp_dir, "index.npz")
+        index.save(path)
+        loaded = etai.VectorIndex.load(path)
+
+        self.assertEqual(len(loaded), 5)
+        dists, ids = index.search(Y, k=3)
+        loaded_dists, loaded_ids = loaded.search(Y, k=3)
+        np.testing.assert_array_equal(ids, loaded_ids)
+        np.testing.assert_allclose(dists, loaded_dists)
+        for c in range(32):
+            expected, _ = index._get_list(c)
+            actual, _ = loaded._get_list(c)
+            np.testing.assert_array_equal(expected, actual)
+
+    def test_save_load_with_empty_lists(self):
+        self._check_save_load_with_empty_lists(False)
+
+    def test_save_load_with_empty_lists_pq(self):
+        self._check_save_load_with_empty_lists(True)
+
+    def test_exact_search_finds_query(self):
+        index = self._make_index(False)
+        index.add(self.X)
+        _, ids = index.search(self.X[:10], k=1)
+        np.testing.assert_array_equal(ids[:, 0], np.arange(10))
+
+    def test_save_empty_index_raises(self):
+        index = self._make_index(False)
+        with self.assertRaises(etai.VectorIndexError):
+            index.save(os.path.join(self.tmp_dir, "index.npz"))
+
+
+if __name__ == "__main__":
+    unittest.main()
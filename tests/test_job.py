@@ -0,0 +1,288 @@
+'''
+Tests for the eta.core.job job cache and job zygote.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import eta
+import eta.core.job as etaj
+import eta.core.serial as etas
+import eta.core.status as etass
+
+
+# A job that uppercases its input and counts its runs
+JOB_SCRIPT = """
+import json
+import sys
+
+
+def run(config_path, pipeline_config_path=None):
+    with open(config_path, "rt") as f:
+        d = json.load(f)
+    with open(d["runs"], "at") as f:
+        f.write("run\\n")
+    if d.get("fail", False):
+        sys.exit(3)
+    with open(d["input"], "rt") as f:
+        contents = f.read()
+    with open(d["output"], "wt") as f:
+        f.write(contents.upper())
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
+"""
+
+
+def _write(path, contents):
+    with open(path, "wt") as f:
+        f.write(contents)
+
+
+def _read(path):
+    with open(path, "rt") as f:
+        return f.read()
+
+
+class JobCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.working_dir = os.path.join(self.tmp_dir, "work")
+        os.makedirs(os.path.join(self.working_dir, "frames"))
+        _write(os.path.join(self.working_dir, "input.txt"), "input")
+        etas.write_json(
+            {"data": [{"input": "input.txt", "output": "output.txt"}]},
+            os.path.join(self.working_dir, "config.json"))
+        self.job_config = etaj.JobConfig.from_dict({
+            "binary": "noop",
+            "config_path": "config.json",
+            "inputs": ["input.txt"],
+            "outputs": ["output.txt", "frames/%05d.txt"],
+        })
+        self.cache = etaj.JobCache(
+            cache_dir=os.path.join(self.tmp_dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _output_path(self):
+        return os.path.join(self.working_dir, "output.txt")
+
+    def _frame_path(self, idx):
+        return os.path.join(self.working_dir, "frames", "%05d.txt" % idx)
+
+    def _store(self):
+        _write(self._output_path(), "output")
+        _write(self._frame_path(1), "frame1")
+        _write(self._frame_path(2), "frame2")
+        key = self.cache.get_key(self.job_config, self.working_dir)
+        self.cache.store(key, self.job_config, self.working_dir)
+        return key
+
+    def test_key_depends_on_inputs(self):
+        key = self.cache.get_key(self.job_config, self.working_dir)
+        self.assertEqual(
+            key, self.cache.get_key(self.job_config, self.working_dir))
+        _write(os.path.join(self.working_dir, "input.txt"), "changed input")
+        self.assertNotEqual(
+            key, self.cache.get_key(self.job_config, self.working_dir))
+
+    def test_rewriting_output_after_store_keeps_entry(self):
+        key = self._store()
+        self.assertTrue(self.cache.has(key))
+
+        # Rewrite the outputs in place
+        with open(self._output_path(), "r+t") as f:
+            f.write("corrupt")
+        with open(self._frame_path(1), "r+t") as f:
+            f.write("corrupt")
+
+        self.cache.restore(key, self.job_config, self.working_dir)
+        self.assertEqual(_read(self._output_path()), "output")
+        self.assertEqual(_read(self._frame_path(1)), "frame1")
+        self.assertEqual(_read(self._frame_path(2)), "frame2")
+
+    def test_rewriting_output_after_restore_keeps_entry(self):
+        key = self._store()
+        os.remove(self._output_path())
+        shutil.rmtree(os.path.join(self.working_dir, "frames"))
+
+        self.cache.restore(key, self.job_config, self.working_dir)
+        self.assertEqual(_read(self._output_path()), "output")
+        with open(self._output_path(), "r+t") as f:
+            f.write("corrupt")
+
+        self.cache.restore(key, self.job_config, self.working_dir)
+        self.assertEqual(_read(self._output_path()), "output")
+
+    def test_restore_does_not_share_inodes(self):
+        key = self._store()
+        self.cache.restore(key, self.job_config, self.working_dir)
+        entry_dir = self.cache.get_entry_dir(key)
+        for root, _, filenames in os.walk(entry_dir):
+            for filename in filenames:
+                self.assertEqual(
+                    os.stat(os.path.join(root, filename)).st_nlink, 1)
+        self.assertFalse(os.path.islink(self._output_path()))
+
+
+class _ScriptJobTestCase(unittest.TestCase):
+    '''Base class for tests that run `JOB_SCRIPT` as a job.'''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._cache_dir = eta.config.cache_dir
+        eta.config.cache_dir = os.path.join(self.tmp_dir, "eta")
+
+        self.working_dir = os.path.join(self.tmp_dir, "work")
+        os.makedirs(self.working_dir)
+        _write(os.path.join(self.working_dir, "job.py"), JOB_SCRIPT)
+        _write(os.path.join(self.working_dir, "input.txt"), "input")
+
+    def tearDown(self):
+        eta.config.cache_dir = self._cache_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_job_config(self, in_process=False, fail=False):
+        etas.write_json(
+            {"input": "input.txt", "output": "output.txt",
+             "runs": "runs.txt", "fail": fail},
+            os.path.join(self.working_dir, "config.json"))
+        return etaj.JobConfig.from_dict({
+            "name": "job",
+            "working_dir": self.working_dir,
+            "interpreter": sys.executable,
+            "script": "job.py",
+            "config_path": "config.json",
+            "in_process": in_process,
+            "inputs": ["input.txt"],
+            "outputs": ["output.txt"],
+        })
+
+    def _run(self, job_config, **kwargs):
+        pipeline_status = etass.PipelineStatus("pipeline")
+        ran_job, success = etaj.run(job_config, pipeline_status, **kwargs)
+        return ran_job, success, pipeline_status.jobs[-1].state
+
+    def _read_output(self):
+        return _read(os.path.join(self.working_dir, "output.txt"))
+
+    def _num_runs(self):
+        path = os.path.join(self.working_dir, "runs.txt")
+        return len(_read(path).split()) if os.path.isfile(path) else 0
+
+
+@unittest.skipIf(not hasattr(os, "fork"), "requires fork()")
+class JobZygoteTests(_ScriptJobTestCase):
+
+    def _check_same_as_subprocess(self, fail):
+        job_config = self._make_job_config(fail=fail)
+        expected = self._run(job_config)
+        output = None if fail else self._read_output()
+        self.assertEqual(self._num_runs(), 1)
+
+        job_config = self._make_job_config(in_process=True, fail=fail)
+        with etaj.JobZygote() as zygote:
+            actual = self._run(job_config, zygote=zygote)
+
+        self.assertEqual(actual, expected)
+        self.assertEqual(self._num_runs(), 2)
+        if not fail:
+            self.assertEqual(self._read_output(), output)
+
+    def test_successful_job(self):
+        self._check_same_as_subprocess(False)
+
+    def test_failed_job(self):
+        self._check_same_as_subprocess(True)
+
+    def test_multiple_jobs(self):
+        job_config = self._make_job_config(in_process=True)
+        with etaj.JobZygote() as zygote:
+            for _ in range(3):
+                self.assertTrue(zygote.run(job_config, self.working_dir))
+
+        self.assertEqual(self._num_runs(), 3)
+        self.assertFalse(zygote.is_running)
+
+
+class JobCacheRunTests(_ScriptJobTestCase):
+
+    def setUp(self):
+        super(JobCacheRunTests, self).setUp()
+        self.job_cache = etaj.JobCache(full_hash=True)
+        self._eta_fingerprint = etaj._ETA_FINGERPRINT
+
+    def tearDown(self):
+        etaj._ETA_FINGERPRINT = self._eta_fingerprint
+        super(JobCacheRunTests, self).tearDown()
+
+    def _run_cached(self, job_config):
+        return self._run(job_config, job_cache=self.job_cache)
+
+    def test_hits_and_misses(self):
+        job_config = self._make_job_config()
+        self.assertEqual(
+            self._run_cached(job_config),
+            (True, True, etass.JobState.COMPLETE))
+        self.assertEqual(self._num_runs(), 1)
+
+        # Same inputs: restored from the cache
+        os.remove(os.path.join(self.working_dir, "output.txt"))
+        self.assertEqual(
+            self._run_cached(job_config),
+            (True, True, etass.JobState.SKIPPED))
+        self.assertEqual(self._num_runs(), 1)
+        self.assertEqual(self._read_output(), "INPUT")
+
+        # Changed input content
+        _write(os.path.join(self.working_dir, "input.txt"), "other")
+        self.assertEqual(
+            self._run_cached(job_config),
+            (True, True, etass.JobState.COMPLETE))
+        self.assertEqual(self._num_runs(), 2)
+        self.assertEqual(self._read_output(), "OTHER")
+
+        # Changed ETA source code
+        etaj._ETA_FINGERPRINT = "changed"
+        self.assertEqual(
+            self._run_cached(job_config),
+            (True, True, etass.JobState.COMPLETE))
+        self.assertEqual(self._num_runs(), 3)
+        self.assertEqual(
+            self._run_cached(job_config),
+            (True, True, etass.JobState.SKIPPED))
+        self.assertEqual(self._num_runs(), 3)
+
+    def test_failed_jobs_are_not_cached(self):
+        job_config = self._make_job_config(fail=True)
+        for num_runs in (1, 2):
+            self.assertEqual(
+                self._run_cached(job_config),
+                (True, False, etass.JobState.FAILED))
+            self.assertEqual(self._num_runs(), num_runs)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+'''
+Tests for the eta.core.module data sharding utilities.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import eta.core.module as etam
+import eta.core.serial as etas
+import eta.core.utils as etau
+
+
+class ShardTestConfig(etam.BaseModuleConfig):
+    '''Module config for testing data sharding.'''
+
+    def __init__(self, d):
+        super(ShardTestConfig, self).__init__(d)
+        self.data = self.parse_array(d, "data")
+        self.output_dir = self.parse_string(d, "output_dir")
+        self.fail_on = self.parse_string(d, "fail_on", default=None)
+
+
+@etam.shard_data
+def _process_data(config):
+    # Records the data and process ID of each shard, then writes one output
+    # per data element
+    etas.write_json(
+        {"data": config.data, "pid": os.getpid()},
+        os.path.join(config.output_dir, "shard-%s.json" % config.data[0]))
+    for data in config.data:
+        if data == config.fail_on:
+            raise ValueError("Failed to process '%s'" % data)
+
+        etas.write_json(
+            {"data": data}, os.path.join(config.output_dir, data + ".json"))
+
+    return os.getpid()
+
+
+class ShardDataTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = ["d%d" % idx for idx in range(7)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _make_config(self, num_workers, fail_on=None):
+        return ShardTestConfig.from_dict({
+            "base": {"num_workers": num_workers},
+            "data": self.data,
+            "output_dir": self.tmp_dir,
+            "fail_on": fail_on,
+        })
+
+    def _read_shards(self):
+        shards = [
+            etas.read_json(os.path.join(self.tmp_dir, filename))
+            for filename in sorted(os.listdir(self.tmp_dir))
+            if filename.startswith("shard-")]
+        return [shard["data"] for shard in shards], \
+            set(shard["pid"] for shard in shards)
+
+    def _check_outputs(self, data):
+        for d in data:
+            path = os.path.join(self.tmp_dir, d + ".json")
+            self.assertEqual(etas.read_json(path), {"data": d})
+
+    @unittest.skipIf(etau.get_fork_context() is None, "requires fork()")
+    def test_partitioning(self):
+        _process_data(self._make_config(3))
+
+        shards, pids = self._read_shards()
+        self.assertEqual(
+            shards, [["d0", "d1"], ["d2", "d3"], ["d4", "d5", "d6"]])
+        self.assertEqual(len(pids), 3)
+        self.assertNotIn(os.getpid(), pids)
+        self._check_outputs(self.data)
+
+    @unittest.skipIf(etau.get_fork_context() is None, "requires fork()")
+    def test_more_workers_than_data(self):
+        self.data = self.data[:2]
+        _process_data(self._make_config(8))
+
+        shards, pids = self._read_shards()
+        self.assertEqual(shards, [["d0"], ["d1"]])
+        self.assertEqual(len(pids), 2)
+        self._check_outputs(self.data)
+
+    @unittest.skipIf(etau.get_fork_context() is None, "requires fork()")
+    def test_shard_errors(self):
+        with self.assertRaises(etam.ModuleShardError) as cm:
+            _process_data(self._make_config(3, fail_on="d2"))
+        self.assertEqual(str(cm.exception), "1 of 3 shards failed: 2")
+
+        # The other shards run to completion
+        self._check_outputs(["d0", "d1", "d4", "d5", "d6"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "d3.json")))
+
+    def test_serial(self):
+        self.assertEqual(_process_data(self._make_config(1)), os.getpid())
+
+        shards, _ = self._read_shards()
+        self.assertEqual(shards, [self.data])
+        self._check_outputs(self.data)
+
+        with self.assertRaises(ValueError):
+            _process_data(self._make_config(1, fail_on="d2"))
+
+    def test_serial_without_fork(self):
+        get_fork_context = etau.get_fork_context
+        etau.get_fork_context = lambda: None
+        try:
+            pid = _process_data(self._make_config(3))
+        finally:
+            etau.get_fork_context = get_fork_context
+
+        self.assertEqual(pid, os.getpid())
+        shards, _ = self._read_shards()
+        self.assertEqual(shards, [self.data])
+        self._check_outputs(self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,197 @@
+'''
+Tests for the eta.core.pipeline job scheduler.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import threading
+import time
+import unittest
+
+from eta.core.config import ConfigError
+import eta.core.pipeline as etap
+import eta.core.status as etas
+
+
+def _make_pipeline_config(jobs, **kwargs):
+    d = {
+        "jobs": [
+            dict(config_path="%s.json" % job["name"], **job) for job in jobs],
+    }
+    d.update(kwargs)
+    return etap.PipelineConfig.from_dict(d)
+
+
+class _FakeJobRunner(object):
+    '''Replaces `eta.core.job.run()` with a function that records the order
+    in which jobs start and finish, and runs the given function for each
+    job.
+    '''
+
+    def __init__(self, fcns=None):
+        self.fcns = fcns or {}
+        self.events = []
+        self._lock = threading.Lock()
+        self._run = None
+
+    def __enter__(self):
+        self._run = etap.etaj.run
+        etap.etaj.run = self.run
+        return self
+
+    def __exit__(self, *args):
+        etap.etaj.run = self._run
+
+    def run(self, job_config, pipeline_status, **kwargs):
+        name = job_config.name
+        self._record("start", name)
+        try:
+            fcn = self.fcns.get(name, None)
+            success = fcn() if fcn else True
+        finally:
+            self._record("end", name)
+        return True, success
+
+    def index(self, event, name):
+        return self.events.index((event, name))
+
+    def _record(self, event, name):
+        with self._lock:
+            self.events.append((event, name))
+
+
+class JobDependencyTests(unittest.TestCase):
+
+    def test_default_dependencies(self):
+        config = _make_pipeline_config([
+            {"name": "a"}, {"name": "b"}, {"name": "c", "dependencies": []}])
+        self.assertEqual(
+            config.get_job_dependencies(),
+            {"a": [], "b": ["a"], "c": []})
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ConfigError):
+            _make_pipeline_config([
+                {"name": "a"}, {"name": "b", "dependencies": ["x"]}])
+
+    def test_cycle_is_rejected(self):
+        # Dependencies must precede their jobs, so cycles are impossible
+        with self.assertRaises(ConfigError):
+            _make_pipeline_config([
+                {"name": "a", "dependencies": ["b"]},
+                {"name": "b", "dependencies": ["a"]}])
+
+        with self.assertRaises(ConfigError):
+            _make_pipeline_config([{"name": "a", "dependencies": ["a"]}])
+
+    def test_duplicate_names_are_rejected(self):
+        with self.assertRaises(ConfigError):
+            _make_pipeline_config([{"name": "a"}, {"name": "a"}])
+
+
+class RunJobsTests(unittest.TestCase):
+
+    def _run_jobs(self, runner, jobs, **kwargs):
+        config = _make_pipeline_config(jobs, **kwargs)
+        with runner:
+            return etap._run_jobs(config, etas.PipelineStatus("pipeline"))
+
+    def test_serial_order(self):
+        runner = _FakeJobRunner()
+        jobs = [{"name": "a"}, {"name": "b"}, {"name": "c"}]
+        self.assertTrue(self._run_jobs(runner, jobs))
+        self.assertEqual(runner.events, [
+            ("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"),
+            ("start", "c"), ("end", "c")])
+
+    def test_parallel_order(self):
+        # "a" and "b" can only finish if they run concurrently
+        barrier = threading.Barrier(2, timeout=10)
+
+        def wait():
+            barrier.wait()
+            return True
+
+        runner = _FakeJobRunner({"a": wait, "b": wait})
+        jobs = [
+            {"name": "a", "dependencies": []},
+            {"name": "b", "dependencies": []},
+            {"name": "c", "dependencies": ["a", "b"]},
+            {"name": "d", "dependencies": ["a"]},
+        ]
+        self.assertTrue(self._run_jobs(runner, jobs, max_parallel_jobs=2))
+
+        self.assertEqual(len(runner.events), 8)
+        for dep, name in (("a", "c"), ("b", "c"), ("a", "d")):
+            self.assertLess(
+                runner.index("end", dep), runner.index("start", name))
+
+    def test_failure_stops_launching_jobs(self):
+        runner = _FakeJobRunner({"b": lambda: False})
+        jobs = [
+            {"name": "a", "dependencies": []},
+            {"name": "b", "dependencies": []},
+            {"name": "c", "dependencies": []},
+        ]
+        self.assertFalse(self._run_jobs(runner, jobs))
+        self.assertEqual(runner.events, [
+            ("start", "a"), ("end", "a"), ("start", "b"), ("end", "b")])
+
+    def test_failure_lets_running_jobs_finish(self):
+        b_started = threading.Event()
+
+        def fail():
+            b_started.wait(10)
+            return False
+
+        def slow():
+            b_started.set()
+            time.sleep(0.2)
+            return True
+
+        runner = _FakeJobRunner({"a": fail, "b": slow})
+        jobs = [
+            {"name": "a", "dependencies": []},
+            {"name": "b", "dependencies": []},
+            {"name": "c", "dependencies": []},
+            {"name": "d", "dependencies": ["a"]},
+        ]
+        self.assertFalse(self._run_jobs(runner, jobs, max_parallel_jobs=2))
+        self.assertIn(("end", "b"), runner.events)
+        self.assertNotIn(("start", "c"), runner.events)
+        self.assertNotIn(("start", "d"), runner.events)
+
+    def test_exception_is_raised_after_running_jobs_finish(self):
+        def fail():
+            raise ValueError("job failed")
+
+        def slow():
+            time.sleep(0.2)
+            return True
+
+        runner = _FakeJobRunner({"a": slow, "b": fail})
+        jobs = [
+            {"name": "a", "dependencies": []},
+            {"name": "b", "dependencies": []},
+        ]
+        with self.assertRaises(ValueError):
+            self._run_jobs(runner, jobs, max_parallel_jobs=2)
+        self.assertIn(("end", "a"), runner.events)
+
+
+if __name__ == "__main__":
+    unittest.main()
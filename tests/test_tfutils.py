@@ -0,0 +1,161 @@
+'''
+Tests for the eta.core.tfutils thread count utilities.
+
+Copyright 2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import eta
+import eta.core.utils as etau
+
+try:
+    import eta.core.tfutils as etat
+except ImportError:
+    etat = None
+
+
+HAS_TF1 = etat is not None and hasattr(etat.tf, "ConfigProto")
+
+
+@unittest.skipIf(etat is None, "requires TensorFlow")
+class ThreadCountTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._settings = {
+            "cache_dir": eta.config.cache_dir,
+            "num_workers": eta.config.num_workers,
+            "tf_auto_threads": eta.config.tf_auto_threads,
+            "tf_config": eta.config.tf_config,
+        }
+        eta.config.cache_dir = self.tmp_dir
+        eta.config.num_workers = 1
+        eta.config.tf_auto_threads = False
+        eta.config.tf_config = {}
+
+        self._get_cpu_count = etau.get_cpu_count
+        etau.get_cpu_count = lambda: 16
+
+    def tearDown(self):
+        for field, value in self._settings.items():
+            setattr(eta.config, field, value)
+        etau.get_cpu_count = self._get_cpu_count
+        shutil.rmtree(self.tmp_dir)
+
+    def _calibrate(self, runtimes, **kwargs):
+        benchmark = etat._benchmark_thread_counts
+        etat._benchmark_thread_counts = lambda fcn, intra, inter, n: \
+            runtimes[(intra, inter)]
+        try:
+            return etat.calibrate_thread_counts(
+                "model", None, candidates=sorted(runtimes), **kwargs)
+        finally:
+            etat._benchmark_thread_counts = benchmark
+
+    def test_get_cpu_thread_counts(self):
+        self.assertEqual(etat.get_cpu_thread_counts(), (16, 2))
+        self.assertEqual(etat.get_cpu_thread_counts(num_workers=4), (4, 1))
+        self.assertEqual(etat.get_cpu_thread_counts(num_workers=32), (1, 1))
+
+        eta.config.num_workers = 2
+        self.assertEqual(etat.get_cpu_thread_counts(), (8, 2))
+
+    def test_calibrate_thread_counts(self):
+        runtimes = {(16, 1): 2.0, (8, 1): 1.0, (4, 1): None}
+        self.assertEqual(self._calibrate(runtimes), (8, 1))
+        self.assertEqual(etat.get_calibrated_thread_counts("model"), (8, 1))
+        self.assertIsNone(
+            etat.get_calibrated_thread_counts("model", num_workers=2))
+        self.assertEqual(
+            os.listdir(self.tmp_dir), [etat.THREAD_CALIBRATION_CACHE_FILE])
+
+        # Cached results are reused unless forced
+        runtimes = {(16, 1): 1.0, (8, 1): 2.0}
+        self.assertEqual(self._calibrate(runtimes), (8, 1))
+        self.assertEqual(self._calibrate(runtimes, force=True), (16, 1))
+        self.assertEqual(etat.get_calibrated_thread_counts("model"), (16, 1))
+
+    def test_calibrate_thread_counts_failures(self):
+        with self.assertRaises(etat.ThreadCalibrationError):
+            self._calibrate({(16, 1): None, (8, 1): None})
+        self.assertIsNone(etat.get_calibrated_thread_counts("model"))
+
+    def test_calibrate_thread_counts_without_fork(self):
+        get_fork_context = etau.get_fork_context
+        etau.get_fork_context = lambda: None
+        try:
+            self.assertEqual(self._calibrate({(1, 1): 1.0}), (16, 2))
+        finally:
+            etau.get_fork_context = get_fork_context
+
+        self.assertIsNone(etat.get_calibrated_thread_counts("model"))
+
+    @unittest.skipIf(not HAS_TF1, "requires TensorFlow 1.x")
+    def test_make_tf_config_precedence(self):
+        # TensorFlow defaults
+        config = etat.make_tf_config(model_name="model")
+        self.assertEqual(config.intra_op_parallelism_threads, 0)
+        self.assertEqual(config.inter_op_parallelism_threads, 0)
+
+        # Recommended thread counts
+        eta.config.tf_auto_threads = True
+        config = etat.make_tf_config(model_name="model")
+        self.assertEqual(config.intra_op_parallelism_threads, 16)
+        self.assertEqual(config.inter_op_parallelism_threads, 2)
+
+        # Calibrated thread counts
+        self._calibrate({(4, 1): 1.0})
+        config = etat.make_tf_config(model_name="model")
+        self.assertEqual(config.intra_op_parallelism_threads, 4)
+        self.assertEqual(config.inter_op_parallelism_threads, 1)
+        config = etat.make_tf_config(model_name="other")
+        self.assertEqual(config.intra_op_parallelism_threads, 16)
+
+        # The provided proto and `eta.config.tf_config` take precedence
+        config_proto = etat.tf.ConfigProto(inter_op_parallelism_threads=3)
+        eta.config.tf_config = {"intra_op_parallelism_threads": 6}
+        config = etat.make_tf_config(
+            config_proto=config_proto, model_name="model")
+        self.assertEqual(config.intra_op_parallelism_threads, 6)
+        self.assertEqual(config.inter_op_parallelism_threads, 3)
+
+    @unittest.skipIf(not HAS_TF1, "requires TensorFlow 1.x")
+    @unittest.skipIf(etau.get_fork_context() is None, "requires fork()")
+    def test_benchmark_thread_counts(self):
+        tf = etat.tf
+
+        def benchmark_fcn(sess):
+            x = tf.random_uniform([64, 64])
+            y = tf.matmul(x, x)
+            return lambda: sess.run(y)
+
+        runtime = etat._benchmark_thread_counts(benchmark_fcn, 1, 1, 2)
+        self.assertGreater(runtime, 0)
+
+        def failing_benchmark_fcn(sess):
+            raise ValueError("benchmark failed")
+
+        self.assertIsNone(
+            etat._benchmark_thread_counts(failing_benchmark_fcn, 1, 1, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
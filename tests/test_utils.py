@@ -0,0 +1,112 @@
+'''
+Tests for the eta.core.utils file hashers.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import eta
+import eta.core.job as etaj
+import eta.core.serial as etas
+import eta.core.utils as etau
+
+
+def _write(path, contents):
+    with open(path, "wt") as f:
+        f.write(contents)
+
+
+class FileHasherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, "data")
+        os.makedirs(self.data_dir)
+        self.path = os.path.join(self.data_dir, "file.txt")
+        _write(self.path, "contents")
+
+        self._cache_dir = eta.config.cache_dir
+        eta.config.cache_dir = os.path.join(self.tmp_dir, "cache")
+
+    def tearDown(self):
+        eta.config.cache_dir = self._cache_dir
+        shutil.rmtree(self.tmp_dir)
+
+    def test_hash_matches_hashlib(self):
+        expected = hashlib.md5(b"contents").hexdigest()
+        self.assertEqual(etau.MD5FileHasher.hash(self.path), expected)
+        self.assertEqual(
+            etau.MD5FileHasher.hash(self.path, use_cache=True), expected)
+
+    def test_sidecar_is_outside_hashed_directory(self):
+        etau.MD5FileHasher.hash(self.path, use_cache=True)
+        cache_path = etau.MD5FileHasher.get_cache_path(self.path)
+        self.assertTrue(os.path.isfile(cache_path))
+        self.assertTrue(cache_path.startswith(eta.config.cache_dir))
+        self.assertEqual(os.listdir(self.data_dir), ["file.txt"])
+
+    def test_sidecar_is_read_while_file_is_unchanged(self):
+        etau.MD5FileHasher.hash(self.path, use_cache=True)
+        cache_path = etau.MD5FileHasher.get_cache_path(self.path)
+        with open(cache_path, "rt") as f:
+            d = json.load(f)
+        d["hash"] = "cached"
+        with open(cache_path, "wt") as f:
+            json.dump(d, f)
+
+        self.assertEqual(
+            etau.MD5FileHasher.hash(self.path, use_cache=True), "cached")
+
+        _write(self.path, "new contents")
+        self.assertEqual(
+            etau.MD5FileHasher.hash(self.path, use_cache=True),
+            hashlib.md5(b"new contents").hexdigest())
+
+    def test_sidecars_are_keyed_by_hasher_and_path(self):
+        other_path = os.path.join(self.data_dir, "other.txt")
+        self.assertNotEqual(
+            etau.MD5FileHasher.get_cache_path(self.path),
+            etau.MD5FileHasher.get_cache_path(other_path))
+        self.assertNotEqual(
+            etau.MD5FileHasher.get_cache_path(self.path),
+            etau.SHA1FileHasher.get_cache_path(self.path))
+
+    def test_full_hash_job_key_is_stable(self):
+        etas.write_json(
+            {"data": [{"input": "data"}]},
+            os.path.join(self.tmp_dir, "config.json"))
+        job_config = etaj.JobConfig.from_dict({
+            "binary": "noop",
+            "config_path": "config.json",
+            "inputs": ["data"],
+        })
+        cache = etaj.JobCache(
+            cache_dir=os.path.join(self.tmp_dir, "jobs"), full_hash=True)
+
+        key = cache.get_key(job_config, self.tmp_dir)
+        self.assertEqual(key, cache.get_key(job_config, self.tmp_dir))
+        self.assertEqual(os.listdir(self.data_dir), ["file.txt"])
+
+
+if __name__ == "__main__":
+    unittest.main()
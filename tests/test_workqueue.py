@@ -0,0 +1,169 @@
+'''
+Tests for the eta.core.workqueue work queue.
+
+Copyright 2017-2018, Voxel51, Inc.
+voxel51.com
+
+Brian Moore, brian@voxel51.com
+'''
+# pragma pylint: disable=redefined-builtin
+# pragma pylint: disable=unused-wildcard-import
+# pragma pylint: disable=wildcard-import
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from builtins import *
+# pragma pylint: enable=redefined-builtin
+# pragma pylint: enable=unused-wildcard-import
+# pragma pylint: enable=wildcard-import
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import eta.core.workqueue as etawq
+
+
+class WorkQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = etawq.WorkQueue(self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _age_heartbeat(self, worker_id, age):
+        path = self.queue._get_heartbeat_path(worker_id)
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+
+    def test_claim_in_submission_order(self):
+        first = self.queue.submit({"n": 1})
+        time.sleep(0.01)
+        second = self.queue.submit({"n": 2})
+
+        self.assertEqual(self.queue.claim("a"), (first, {"n": 1}))
+        self.assertEqual(self.queue.claim("b"), (second, {"n": 2}))
+        self.assertIsNone(self.queue.claim("c"))
+        self.assertTrue(self.queue.owns(first, "a"))
+        self.assertFalse(self.queue.owns(first, "b"))
+
+    def test_complete_records_result(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.assertTrue(self.queue.complete(ticket_id, "a", {"success": True}))
+        self.assertFalse(self.queue.owns(ticket_id, "a"))
+        self.assertEqual(
+            self.queue.get_result(ticket_id),
+            {"success": True, "worker_id": "a"})
+        self.assertIsNone(self.queue.get_result(ticket_id))
+
+    def test_requeue_tickets_of_dead_workers(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue.heartbeat("a")
+        self.assertEqual(self.queue.requeue_dead_tickets(60), [])
+
+        self._age_heartbeat("a", 120)
+        self.assertEqual(self.queue.requeue_dead_tickets(60), [ticket_id])
+        self.assertFalse(self.queue.owns(ticket_id, "a"))
+        self.assertEqual(self.queue.claim("b")[0], ticket_id)
+
+    def test_requeue_ticket_without_heartbeat(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.assertEqual(self.queue.requeue_dead_tickets(60), [ticket_id])
+
+    def test_heartbeats_use_queue_clock(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue.heartbeat("a")
+
+        # A skewed local clock must not make live workers look dead
+        time_fcn = etawq.time.time
+        etawq.time.time = lambda: time_fcn() + 3600
+        try:
+            self.assertEqual(self.queue.requeue_dead_tickets(60), [])
+        finally:
+            etawq.time.time = time_fcn
+
+        self.assertTrue(self.queue.owns(ticket_id, "a"))
+
+    def test_complete_reclaims_requeued_ticket(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue.requeue_dead_tickets(60)
+
+        self.assertTrue(self.queue.complete(ticket_id, "a", {}))
+        self.assertIsNone(self.queue.claim("b"))
+        self.assertIsNotNone(self.queue.get_result(ticket_id))
+
+    def test_complete_after_losing_ticket_discards_result(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue.requeue_dead_tickets(60)
+        self.queue.claim("b")
+
+        self.assertFalse(self.queue.reclaim(ticket_id, "a"))
+        self.assertFalse(self.queue.complete(ticket_id, "a", {"n": 1}))
+        self.assertIsNone(self.queue.get_result(ticket_id))
+
+        self.assertTrue(self.queue.complete(ticket_id, "b", {"n": 2}))
+        self.assertEqual(self.queue.get_result(ticket_id)["worker_id"], "b")
+
+    def test_result_recorded_before_claim_is_released(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+
+        # Simulate worker "a" dying after writing its result but before
+        # releasing its claim
+        self.queue._write(
+            self.queue._get_result_path(ticket_id), {"worker_id": "a"})
+        self.assertEqual(self.queue.requeue_dead_tickets(60), [])
+        self.assertFalse(self.queue.owns(ticket_id, "a"))
+        self.assertIsNone(self.queue.claim("b"))
+        self.assertEqual(
+            self.queue.get_result(ticket_id), {"worker_id": "a"})
+
+    def test_get_result_releases_stale_claims(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue._write(
+            self.queue._get_result_path(ticket_id), {"worker_id": "a"})
+
+        self.assertIsNotNone(self.queue.get_result(ticket_id))
+        self.assertFalse(self.queue.owns(ticket_id, "a"))
+        self.assertEqual(os.listdir(self.queue._claimed_dir), [])
+
+    def test_only_first_result_is_recorded(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue.requeue_dead_tickets(60)
+        self.queue.claim("b")
+        self.assertTrue(self.queue.complete(ticket_id, "b", {"n": 2}))
+
+        # Worker "a" reclaimed the ticket before "b" finished
+        self.queue._write(self.queue._get_claimed_path(ticket_id, "a"), {})
+        self.assertFalse(self.queue.complete(ticket_id, "a", {"n": 1}))
+        self.assertEqual(self.queue.get_result(ticket_id)["n"], 2)
+
+    def test_wait_for_job_ticket_timeout(self):
+        ticket_id = self.queue.submit({})
+        with self.assertRaises(etawq.WorkQueueTimeoutError):
+            etawq.wait_for_job_ticket(
+                self.queue, ticket_id, poll_interval=0.01, timeout=0.05)
+
+    def test_wait_for_job_ticket(self):
+        ticket_id = self.queue.submit({})
+        self.queue.claim("a")
+        self.queue.complete(ticket_id, "a", {"n": 1})
+        result = etawq.wait_for_job_ticket(self.queue, ticket_id, timeout=1)
+        self.assertEqual(result["n"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()